@@ -6,4 +6,5 @@ from .pod import Pod
 from .podlist import Pods
 from .service import DataService
 from .h5 import *
-from .general import SystematicAlternatives
\ No newline at end of file
+from .general import SystematicAlternatives
+from .partitioned import PartitionedDataset
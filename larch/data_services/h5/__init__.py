@@ -1,5 +1,6 @@
 from .h5data import *
 from .h5vault import *
+from .h5tiles import TileCache, read_pairs, shared_tile_cache
 
 import tables
 import sys, atexit
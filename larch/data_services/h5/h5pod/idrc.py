@@ -1,11 +1,74 @@
+import ast
 import numpy
 from .idco import H5PodCO
 from ...general import selector_len_for, _sqz_same
 
-class H5PodRC(H5PodCO):
+# functions that act on each value alone, so they give the same result
+# on the values at some pairs as on the whole matrix
+_ELEMENTWISE_FUNCTIONS = frozenset([
+	'log', 'exp', 'log1p', 'absolute', 'fabs', 'sqrt', 'isnan', 'isfinite',
+	'logaddexp', 'fmin', 'fmax', 'nan_to_num', 'sin', 'cos', 'piece', 'boolean',
+])
+
+_ELEMENTWISE_NODES = (
+	ast.Expression, ast.BinOp, ast.UnaryOp, ast.Compare, ast.Call, ast.keyword,
+	ast.Name, ast.Load, ast.Constant,
+	ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod, ast.Pow,
+	ast.BitAnd, ast.BitOr, ast.BitXor, ast.UAdd, ast.USub, ast.Invert, ast.Not,
+	ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE,
+)
+
+
+def _elementwise_names(cmd):
+	"""
+	The names used in an elementwise expression, or None if it is not one.
+
+	An expression is elementwise if it uses only names, constants,
+	arithmetic and comparison operators, and calls to the functions in
+	`_ELEMENTWISE_FUNCTIONS`.  Such an expression gives the same values
+	when evaluated on the values at some row-and-column pairs as when
+	evaluated on the whole matrix, while attributes (`SKIM.T`),
+	subscripts, and other functions (reductions like `SKIM.max()` or
+	`mean(SKIM)`) may not.
+	"""
+	try:
+		tree = ast.parse(str(cmd).strip(), mode='eval')
+	except SyntaxError:
+		return None
+	names = set()
+	for node in ast.walk(tree):
+		if not isinstance(node, _ELEMENTWISE_NODES):
+			return None
+		if isinstance(node, ast.Call):
+			if not isinstance(node.func, ast.Name) or node.func.id not in _ELEMENTWISE_FUNCTIONS:
+				return None
+		elif isinstance(node, ast.Name):
+			names.add(node.id)
+	return names - _ELEMENTWISE_FUNCTIONS
 
-	def __init__(self, rowindexes, colindexes, *args, **kwargs):
+class H5PodRC(H5PodCO):
+	"""
+	A HDF5 group node containing skims, read at row-and-column pairs.
+
+	Parameters
+	----------
+	rowindexes, colindexes : str, int, or ndarray
+		The row and column of each case.  Give a str to name a vector in
+		the group node, or an int to use the same row (or column) for
+		every case.
+	tile_cache : TileCache or bool, default True
+		Skim values are read by HDF5 chunk, reading only the chunks that
+		hold at least one of this pod's row-and-column pairs, and the
+		chunks read are kept in this cache (or in the cache shared by all
+		skims if True).  Expressions are then evaluated elementwise on
+		just the values at those pairs.  Set to None to read without
+		caching, or to False to evaluate each expression on the whole
+		matrix before picking out the pairs.
+	"""
+
+	def __init__(self, rowindexes, colindexes, *args, tile_cache=True, **kwargs):
 		super().__init__(*args, **kwargs)
+		self.tile_cache = tile_cache
 		if isinstance(rowindexes, str):
 			self.rowindexes = self._groupnode._v_children[rowindexes][:]
 		elif isinstance(rowindexes, numpy.ndarray):
@@ -31,6 +94,59 @@ class H5PodRC(H5PodCO):
 	def podtype(self):
 		return 'idrc'
 
+	def _evaluate_rc(self, cmd, selector=None):
+		"""
+		Evaluate an expression on the skims at this pod's row-and-column pairs.
+
+		Parameters
+		----------
+		cmd : str
+		selector : slice or array-like, optional
+			Only evaluate for these pairs.
+
+		Returns
+		-------
+		ndarray
+		"""
+		rows, cols = self.rowindexes, self.colindexes
+		if selector is not None:
+			rows, cols = rows[selector], cols[selector]
+		if self.tile_cache is not False:
+			result = self._evaluate_rc_tiled(cmd, rows, cols)
+			if result is not None:
+				return result
+		temp = self._evaluate_single_item(cmd, None)
+		return temp[rows, cols]
+
+	def _evaluate_rc_tiled(self, cmd, rows, cols):
+		"""
+		Evaluate an expression on values read by tile, or None if it can't be.
+
+		This applies when the expression is elementwise (see
+		`_elementwise_names`) and every name in it is a 2-d skim (or
+		`pi`), whose values are then read only at the given pairs.
+		"""
+		from ..h5tiles import read_pairs, shared_tile_cache
+		cache = shared_tile_cache if self.tile_cache is True else self.tile_cache
+		names = _elementwise_names(cmd)
+		if names is None:
+			return None
+		names.discard('pi')
+		for name in names:
+			if name not in self._groupnode or len(self._groupnode._v_children[name].shape) != 2:
+				return None
+		# important globals, as for `_evaluate_single_item`
+		from numpy import log, exp, log1p, absolute, fabs, sqrt, isnan, isfinite, logaddexp, fmin, fmax, nan_to_num, sin, cos, pi
+		from ....util.common_functions import piece, boolean
+		namespace = dict(locals())
+		for name in names:
+			namespace[name] = read_pairs(self._groupnode._v_children[name], rows, cols, cache=cache)
+		try:
+			result = eval(str(cmd), namespace)
+		except Exception:
+			return None # evaluate in full, to get the usual error message
+		return numpy.broadcast_to(result, rows.shape)
+
 
 	def __getitem__(self, item):
 
@@ -49,11 +165,7 @@ class H5PodRC(H5PodCO):
 		result = numpy.zeros( [selector_len_for(slice_, self.shape[0]), *self.shape[1:], len(names)], dtype=dtype)
 
 		for i, cmd in enumerate(names):
-			temp = self._evaluate_single_item(cmd, None)
-			if slice_ is not None:
-				result[...,i] = temp[self.rowindexes[slice_],self.colindexes[slice_]]
-			else:
-				result[...,i] = temp[self.rowindexes,self.colindexes]
+			result[...,i] = self._evaluate_rc(cmd, slice_)
 		return result
 
 	def _load_into(self, names, slc, result):
@@ -71,11 +183,7 @@ class H5PodRC(H5PodCO):
 
 		assert (tuple(result.shape) == tuple([selector_len_for(slc, self.shape[0]), *self.shape[1:], len(names)]))
 		for i, cmd in enumerate(names):
-			temp = self._evaluate_single_item(cmd, None)
-			if slc is not None:
-				result[...,i] = temp[self.rowindexes[slc],self.colindexes[slc]]
-			else:
-				result[...,i] = temp[self.rowindexes,self.colindexes]
+			result[...,i] = self._evaluate_rc(cmd, slc)
 		return result
 
 	@property
@@ -99,15 +207,11 @@ class H5PodRC(H5PodCO):
 		from ...general import _sqz_same
 		_sqz_same(result.shape, [selector_len_for(selector, self.shape[0]), *self.shape[1:]])
 
-		temp = self._evaluate_single_item(name, None)
-		if selector is not None:
-			result[:] = temp[self.rowindexes[selector], self.colindexes[selector]]
-		else:
-			result[:] = temp[self.rowindexes, self.colindexes]
+		result[:] = self._evaluate_rc(name, selector)
 		return result
 
 	def as_idca(self):
-		ret = H5PodRCasCA(filename=self, rowindexes=self.rowindexes, colindexes=self.colindexes, ident=self.ident+"_as_idca")
+		ret = H5PodRCasCA(filename=self, rowindexes=self.rowindexes, colindexes=self.colindexes, ident=self.ident+"_as_idca", tile_cache=self.tile_cache)
 		return ret
 
 class H5PodRCasCA(H5PodRC):
@@ -123,11 +227,7 @@ class H5PodRCasCA(H5PodRC):
 		from ...general import _sqz_same
 		_sqz_same(result.shape, [selector_len_for(selector, self.shape[0]), *self.shape[1:]])
 
-		temp = self._evaluate_single_item(name, None)
-		if selector is not None:
-			result[:,:] = temp[self.rowindexes[selector], self.colindexes[selector]][:,None]
-		else:
-			result[:,:] = temp[self.rowindexes, self.colindexes][:,None]
+		result[:,:] = self._evaluate_rc(name, selector)[:,None]
 		return result
 
 	@property
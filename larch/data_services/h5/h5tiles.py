@@ -0,0 +1,172 @@
+import numpy
+from collections import OrderedDict
+
+_ROW_BAND_BYTES = 1 << 20
+
+
+class TileCache():
+	"""
+	A least-recently-used cache of matrix tiles, with a byte budget.
+
+	One cache can be shared by any number of matrices (and files), so
+	that the budget bounds the memory used by all skim tiles together.
+
+	Parameters
+	----------
+	max_bytes : int, default 256 MiB
+		The most memory to use for cached tiles.  When adding a tile
+		would exceed this budget, the least recently used tiles are
+		dropped.  Tiles larger than the whole budget are never cached.
+	"""
+
+	def __init__(self, max_bytes=256 << 20):
+		self._tiles = OrderedDict()
+		self._max_bytes = int(max_bytes)
+		self.nbytes = 0
+		self.hits = 0
+		self.misses = 0
+
+	@property
+	def max_bytes(self):
+		"""int : The byte budget of this cache."""
+		return self._max_bytes
+
+	@max_bytes.setter
+	def max_bytes(self, value):
+		self._max_bytes = int(value)
+		self._evict()
+
+	def __len__(self):
+		return len(self._tiles)
+
+	def __repr__(self):
+		return f"<larch.TileCache {len(self)} tiles, {self.nbytes} of {self._max_bytes} bytes>"
+
+	def get(self, key, loader):
+		"""
+		Get a tile from the cache, loading it if it is not cached.
+
+		Parameters
+		----------
+		key : hashable
+		loader : callable
+			Called with no arguments to load the tile on a cache miss.
+
+		Returns
+		-------
+		array
+		"""
+		try:
+			tile = self._tiles[key]
+		except KeyError:
+			self.misses += 1
+			tile = loader()
+			if tile.nbytes <= self._max_bytes:
+				self._tiles[key] = tile
+				self.nbytes += tile.nbytes
+				self._evict()
+		else:
+			self.hits += 1
+			self._tiles.move_to_end(key)
+		return tile
+
+	def _evict(self):
+		while self.nbytes > self._max_bytes and self._tiles:
+			_, tile = self._tiles.popitem(last=False)
+			self.nbytes -= tile.nbytes
+
+	def clear(self):
+		"""Drop all cached tiles, and reset the hit and miss counts."""
+		self._tiles.clear()
+		self.nbytes = 0
+		self.hits = 0
+		self.misses = 0
+
+
+shared_tile_cache = TileCache()
+
+
+def tile_shape(node):
+	"""
+	The shape of the tiles in which to read a 2-d array node.
+
+	For chunked arrays this is the HDF5 chunk shape, as a chunk is the
+	smallest unit that is read from disk (and decompressed).  For
+	contiguous arrays it is a band of whole rows of about 1 MiB.
+
+	Parameters
+	----------
+	node : tables.Array
+
+	Returns
+	-------
+	tuple of int
+	"""
+	if node.chunkshape is not None:
+		return tuple(int(i) for i in node.chunkshape[:2])
+	n_rows, n_cols = node.shape[:2]
+	band = max(1, _ROW_BAND_BYTES // max(1, n_cols * node.dtype.itemsize))
+	return (min(band, n_rows), n_cols)
+
+
+def read_pairs(node, rows, cols, cache=None):
+	"""
+	Read the values of a 2-d array node at row-and-column pairs.
+
+	The pairs are grouped by tile (see `tile_shape`), and only the tiles
+	that hold at least one requested pair are read, so the amount read
+	is proportional to the pairs used instead of the size of the matrix.
+
+	Parameters
+	----------
+	node : tables.Array
+		A 2-d array, typically a skim matrix in an OMX file.
+	rows, cols : array-like of int
+		The row and column of each value to read.  These must have the
+		same shape, which is also the shape of the result.
+	cache : TileCache, optional
+		A cache in which to keep the tiles that are read, for use by
+		later reads.  Tiles are only cached for files opened read-only,
+		as otherwise the data may change.
+
+	Returns
+	-------
+	array
+	"""
+	rows = numpy.asarray(rows, dtype=numpy.int64)
+	cols = numpy.asarray(cols, dtype=numpy.int64)
+	if rows.shape != cols.shape:
+		raise ValueError(f'rows shape {rows.shape} does not match cols shape {cols.shape}')
+	shape = rows.shape
+	n_rows, n_cols = node.shape[:2]
+	rows = numpy.where(rows < 0, rows + n_rows, rows).reshape(-1)
+	cols = numpy.where(cols < 0, cols + n_cols, cols).reshape(-1)
+	if rows.size and (rows.min() < 0 or rows.max() >= n_rows or cols.min() < 0 or cols.max() >= n_cols):
+		raise IndexError(f'row-and-column pairs out of bounds for {node._v_pathname} with shape {node.shape}')
+
+	if cache is not None and node._v_file.mode != 'r':
+		cache = None
+	tr, tc = tile_shape(node)
+	n_tile_cols = -(-n_cols // tc)
+	tile_ids = (rows // tr) * n_tile_cols + cols // tc
+	order = numpy.argsort(tile_ids, kind='stable')
+	sorted_ids = tile_ids[order]
+	starts = numpy.flatnonzero(numpy.r_[True, sorted_ids[1:] != sorted_ids[:-1]])
+	ends = numpy.r_[starts[1:], sorted_ids.size]
+
+	result = numpy.empty(rows.size, dtype=node.dtype)
+	if rows.size == 0:
+		return result.reshape(shape)
+	for s, e in zip(starts, ends):
+		r0, c0 = divmod(int(sorted_ids[s]), n_tile_cols)
+		r0 *= tr
+		c0 *= tc
+		loader = lambda: node[r0:r0+tr, c0:c0+tc]
+		if cache is not None:
+			# keyed by the file object, not its name, so a reopened file is read afresh
+			tile = cache.get((node._v_file, node._v_pathname, r0, c0), loader)
+		else:
+			tile = loader()
+		idx = order[s:e]
+		result[idx] = tile[rows[idx] - r0, cols[idx] - c0]
+	return result.reshape(shape)
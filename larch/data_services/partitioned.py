@@ -0,0 +1,366 @@
+import os
+import re
+import json
+import numpy
+import pandas
+
+import logging
+from ..log import logger_name
+logger = logging.getLogger(logger_name+'.data')
+
+_METADATA_FILE = 'dataset.json'
+_IDENTIFIER = re.compile(r'[A-Za-z_][A-Za-z0-9_]*')
+
+
+def _request_expressions(req_data):
+	"""
+	All the data expressions named in a data request.
+
+	Parameters
+	----------
+	req_data : Mapping
+		A data request, as from `Model.required_data`.
+
+	Yields
+	------
+	str
+	"""
+	for key, value in req_data.items():
+		if key in ('ca', 'co'):
+			yield from (str(i) for i in value)
+		elif key in ('choice_ca', 'choice_co_code', 'weight_co', 'avail_ca'):
+			if isinstance(value, str):
+				yield value
+		elif key in ('choice_co', 'avail_co'):
+			yield from (str(i) for i in value.values())
+
+
+def _referenced_columns(expressions, columns):
+	"""
+	The columns that are used by any of the expressions.
+
+	A column is used if it is an expression, or is an identifier
+	within one.  This may include a few columns that are not really
+	needed, but never misses one that is.
+	"""
+	expressions = list(expressions)
+	names = set(expressions)
+	for expr in expressions:
+		names.update(_IDENTIFIER.findall(expr))
+	return [c for c in columns if c in names]
+
+
+class PartitionedDataset():
+	"""
+	A dataset stored as a directory of Parquet files, partitioned by case.
+
+	Each component of the data (idco, idca or idce, and any separate
+	choice, availability and weight data) is stored as one Parquet file
+	per partition, and every partition holds a contiguous range of
+	cases.  As a dataservice for a model, only the columns the model
+	actually uses (per `Model.required_data`) are read, and only for
+	the requested partitions, and optionally only for the cases that
+	meet an idco selector expression.
+
+	Use `PartitionedDataset.write` to create a dataset.
+
+	Parameters
+	----------
+	path : path-like
+		The directory of the dataset.
+	"""
+
+	def __init__(self, path):
+		self.path = str(path)
+		with open(os.path.join(self.path, _METADATA_FILE), 'r') as f:
+			self._metadata = json.load(f)
+
+	@classmethod
+	def write(cls, dataframes, path, cases_per_partition=100_000, compression='snappy'):
+		"""
+		Write the data in a DataFrames to a partitioned dataset.
+
+		Parameters
+		----------
+		dataframes : DataFrames
+			The data to write.  Typically this is not computational,
+			i.e. it holds the raw survey data from which models will
+			draw the variables they need.
+		path : path-like
+			The directory to write.  It is created if it does not exist.
+		cases_per_partition : int, default 100_000
+			The number of cases in each partition.
+		compression : str, default 'snappy'
+			The compression for the Parquet files.
+
+		Returns
+		-------
+		PartitionedDataset
+		"""
+		import pyarrow as pa
+		import pyarrow.parquet as pq
+
+		path = str(path)
+		os.makedirs(path, exist_ok=True)
+		caseindex = dataframes.caseindex
+		n_cases = len(caseindex)
+		caseindex_name = caseindex.name or '_caseid_'
+		bounds = list(range(0, n_cases, cases_per_partition)) + [n_cases]
+		alt_names = dataframes.alternative_names()
+		if alt_names is not None:
+			alt_names = [str(i) for i in alt_names]
+
+		components = {}
+		if dataframes.data_co is not None:
+			components['co'] = ('co', dataframes.data_co)
+		if dataframes.data_ca is not None:
+			components['ca'] = ('ca', dataframes.data_ca)
+		elif dataframes.data_ce is not None:
+			components['ca'] = ('ce', dataframes.data_ce)
+		for seg in ('ch', 'av', 'wt'):
+			df = getattr(dataframes, f'data_{seg}')
+			if df is not None:
+				components[seg] = (seg, df)
+
+		metadata = dict(
+			n_cases=n_cases,
+			caseindex_name=caseindex_name,
+			alt_codes=pandas.Index(dataframes.alternative_codes()).tolist(),
+			alt_names=alt_names,
+			components={},
+			partitions=[],
+		)
+
+		for seg, (fmt, df) in components.items():
+			os.makedirs(os.path.join(path, seg), exist_ok=True)
+			if fmt in ('ca', 'ce'):
+				index_names = [caseindex_name, df.index.names[1] or '_altid_']
+				case_codes = df.index.get_level_values(0)
+			else:
+				index_names = [caseindex_name]
+				case_codes = df.index
+			# rows of each partition, located by the case ids it holds
+			case_pos = caseindex.get_indexer(case_codes)
+			table = df.copy(deep=False)
+			table.index = table.index.set_names(index_names)
+			table.columns = [str(c) for c in table.columns]
+			table = table.reset_index()
+			metadata['components'][seg] = dict(
+				format=fmt,
+				index=index_names,
+				columns=[str(c) for c in df.columns],
+			)
+			for p in range(len(bounds) - 1):
+				rows = (case_pos >= bounds[p]) & (case_pos < bounds[p + 1])
+				pq.write_table(
+					pa.Table.from_pandas(table[rows], preserve_index=False),
+					os.path.join(path, seg, f'part-{p:05d}.parquet'),
+					compression=compression,
+				)
+
+		for p in range(len(bounds) - 1):
+			metadata['partitions'].append(dict(
+				first_case=int(bounds[p]),
+				n_cases=int(bounds[p + 1] - bounds[p]),
+				file=f'part-{p:05d}.parquet',
+			))
+		with open(os.path.join(path, _METADATA_FILE), 'w') as f:
+			json.dump(metadata, f, indent=1)
+		return cls(path)
+
+	@property
+	def n_cases(self):
+		"""int : The total number of cases in all partitions."""
+		return self._metadata['n_cases']
+
+	@property
+	def n_partitions(self):
+		"""int : The number of partitions."""
+		return len(self._metadata['partitions'])
+
+	@property
+	def columns_co(self):
+		"""list : The idco columns."""
+		return self._component_columns('co')
+
+	@property
+	def columns_ca(self):
+		"""list : The idca (or idce) columns."""
+		return self._component_columns('ca')
+
+	def _component_columns(self, seg):
+		if seg in self._metadata['components']:
+			return list(self._metadata['components'][seg]['columns'])
+		return []
+
+	def alternative_codes(self):
+		return pandas.Index(self._metadata['alt_codes'])
+
+	def alternative_names(self):
+		return self._metadata['alt_names']
+
+	def _partition_numbers(self, partitions):
+		all_partitions = range(self.n_partitions)
+		if partitions is None:
+			return list(all_partitions)
+		if isinstance(partitions, slice):
+			return list(all_partitions[partitions])
+		if isinstance(partitions, (int, numpy.integer)):
+			return [all_partitions[partitions]]
+		return [all_partitions[p] for p in partitions]
+
+	def _read(self, seg, partition, columns=None, case_ids=None):
+		"""
+		Read one component of one partition as a pandas DataFrame.
+		"""
+		import pyarrow.parquet as pq
+		info = self._metadata['components'][seg]
+		filename = os.path.join(self.path, seg, self._metadata['partitions'][partition]['file'])
+		if columns is not None:
+			columns = list(info['index']) + list(columns)
+		filters = None
+		if case_ids is not None:
+			filters = [(info['index'][0], 'in', list(case_ids))]
+		df = pq.read_table(filename, columns=columns, filters=filters).to_pandas()
+		df = df.set_index(info['index'])
+		if seg in ('ch', 'av'):
+			# wide choice and availability columns are stored by name
+			df.columns = self.alternative_codes()
+		return df
+
+	def selected_cases(self, selector, partitions=None):
+		"""
+		The case ids that meet an idco selector expression.
+
+		Only the idco columns used by the selector are read.
+
+		Parameters
+		----------
+		selector : str
+			An expression to evaluate on the idco data that results in a
+			boolean selection filter, as for `DataFrames.selector_co`.
+		partitions : int, slice or Sequence[int], optional
+			Only read these partitions.
+
+		Returns
+		-------
+		dict
+			The selected case ids in each partition, keyed by partition.
+		"""
+		from ..util.dataframe import columnize
+		columns = _referenced_columns([selector], self.columns_co)
+		result = {}
+		for p in self._partition_numbers(partitions):
+			co = self._read('co', p, columns=columns)
+			keep = columnize(co, [selector], inplace=False, dtype=bool).iloc[:, 0].to_numpy()
+			result[p] = co.index[keep]
+		return result
+
+	def load(self, columns_co=None, columns_ca=None, *, partitions=None, selector=None):
+		"""
+		Read some columns of the dataset into a DataFrames.
+
+		Parameters
+		----------
+		columns_co, columns_ca : Sequence[str], optional
+			The idco and idca (or idce) columns to read.  By default
+			all columns are read.
+		partitions : int, slice or Sequence[int], optional
+			Only read these partitions.
+		selector : str, optional
+			Only read the cases that meet this idco selector expression.
+			Partitions without any such case are skipped, and the rows
+			of the other cases are filtered as they are read.
+
+		Returns
+		-------
+		DataFrames
+			The raw data, not yet computational.
+		"""
+		from ..dataframes import DataFrames
+		partitions = self._partition_numbers(partitions)
+		if selector is not None:
+			case_ids = self.selected_cases(selector, partitions)
+			partitions = [p for p in partitions if len(case_ids[p])]
+		else:
+			case_ids = {}
+		if not partitions:
+			raise ValueError('no cases are selected')
+
+		columns = {'co': columns_co, 'ca': columns_ca}
+		kwargs = {}
+		for seg, info in self._metadata['components'].items():
+			parts = [
+				self._read(seg, p, columns=columns.get(seg), case_ids=case_ids.get(p))
+				for p in partitions
+			]
+			kwargs[info['format']] = pandas.concat(parts) if len(parts) > 1 else parts[0]
+
+		if 'co' not in kwargs:
+			# cases without idco data are still indexed by the choice data
+			for seg in ('ch', 'av', 'wt'):
+				if seg in kwargs:
+					kwargs['co'] = pandas.DataFrame(index=kwargs[seg].index)
+					break
+		return DataFrames(
+			alt_codes=self.alternative_codes(),
+			alt_names=self.alternative_names(),
+			**kwargs,
+		)
+
+	def validate_dataservice(self, req_data):
+		pass
+
+	def make_dataframes(
+			self,
+			req_data,
+			*,
+			selector=None,
+			partitions=None,
+			float_dtype=numpy.float64,
+			log_warnings=True,
+			explicit=False,
+	):
+		"""
+		Create a DataFrames object that will satisfy a data request.
+
+		Only the columns used by the request are read from disk.
+
+		Parameters
+		----------
+		req_data : Dict or str
+			The requested data, as for `DataFrames.make_dataframes`.
+		selector : str, optional
+			Only load the cases that meet this idco selector expression,
+			as for `DataFrames.selector_co`.
+		partitions : int, slice or Sequence[int], optional
+			Only load these partitions.
+		float_dtype : dtype, default float64
+			The dtype to use for all float-type arrays.
+		log_warnings : bool, default True
+			Emit warnings in the logger if choice, avail, or weight is
+			not requested but is stored and thus returned by default.
+		explicit : bool, default False
+			Only include data that is explicitly requested.
+
+		Returns
+		-------
+		DataFrames
+		"""
+		if isinstance(req_data, str):
+			from ..util import Dict
+			import textwrap
+			req_data = Dict.load(textwrap.dedent(req_data))
+		expressions = list(_request_expressions(req_data))
+		raw = self.load(
+			_referenced_columns(expressions, self.columns_co),
+			_referenced_columns(expressions, self.columns_ca),
+			partitions=partitions,
+			selector=selector,
+		)
+		return raw.make_dataframes(
+			req_data,
+			float_dtype=float_dtype,
+			log_warnings=log_warnings,
+			explicit=explicit,
+		)
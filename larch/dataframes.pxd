@@ -71,6 +71,12 @@ cdef class DataFrames:
 		object _caseindex_name
 		object _altindex_name
 
+		# Compressed case mapping
+		object _case_map
+
+		# Shared memory handle
+		object _shared_memory
+
 	# cdef void _compute_utility_onecase(
 	# 		self,
 	# 		int c,
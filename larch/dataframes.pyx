@@ -84,6 +84,30 @@ def _ensure_dataframe_of_dtype_c_contiguous(df, dtype, label):
 		)
 	return df
 
+def _is_read_only(df):
+	"""
+	Whether every column of a DataFrame views read-only memory.
+
+	This is so for data memory-mapped by `from_feathers(memory_map=True)`
+	or attached from shared memory.
+	"""
+	if df.shape[1] == 0:
+		return False
+	return not any(df.iloc[:, j].to_numpy(copy=False).flags.writeable for j in range(df.shape[1]))
+
+def _with_index(df, index):
+	"""
+	A copy of a DataFrame with a new index.
+
+	The data is copied, so that changes made in place (e.g. by the
+	repairs in `larch.troubleshooting`) don't alter the caller's frame,
+	unless it is read-only and so can't be changed, in which case it is
+	shared.  This keeps memory-mapped and shared memory data zero-copy.
+	"""
+	df = df.copy(deep=not _is_read_only(df))
+	df.index = index
+	return df
+
 def _ensure_no_duplicate_column_names(df):
 	cols, counts = numpy.unique(df.columns, return_counts=True)
 	if len(cols)>0 and counts.max()>1:
@@ -485,16 +509,16 @@ cdef class DataFrames:
 				if not isinstance(ce.index, pandas.MultiIndex) or ce.index.nlevels!=2:
 					raise ValueError('ce must have two level multi-index')
 				try:
-					ce = ce.set_index(ce.index.set_levels(ce.index.levels[0].astype(int), 0))
+					ce = _with_index(ce, ce.index.set_levels(ce.index.levels[0].astype(int), 0))
 				except Exception as err:
 					raise ValueError('ce multi-index must have integer case values') from err
 				try:
-					ce = ce.set_index(ce.index.set_levels(ce.index.levels[1].astype(int), 1))
+					ce = _with_index(ce, ce.index.set_levels(ce.index.levels[1].astype(int), 1))
 				except Exception as err:
 					if alt_codes is None and alt_names is None:
 						alt_names = list(ce.index.levels[1])
 						alt_codes = numpy.arange(len(alt_names))+1
-						ce = ce.set_index(ce.index.set_levels(alt_codes, 1))
+						ce = _with_index(ce, ce.index.set_levels(alt_codes, 1))
 					else:
 						raise ValueError('ce multi-index must have integer values') from err
 
@@ -504,16 +528,16 @@ cdef class DataFrames:
 				if not isinstance(ca.index, pandas.MultiIndex) or ca.index.nlevels!=2:
 					raise ValueError('ca must have two level multi-index')
 				try:
-					ca = ca.set_index(ca.index.set_levels(ca.index.levels[0].astype(numpy.int64), 0))
+					ca = _with_index(ca, ca.index.set_levels(ca.index.levels[0].astype(numpy.int64), 0))
 				except Exception as err:
 					raise ValueError('ca multi-index must have integer values') from err
 				try:
-					ca = ca.set_index(ca.index.set_levels(ca.index.levels[1].astype(numpy.int64), 1))
+					ca = _with_index(ca, ca.index.set_levels(ca.index.levels[1].astype(numpy.int64), 1))
 				except Exception as err:
 					if alt_codes is None and alt_names is None:
 						alt_names = list(ca.index.levels[1])
 						alt_codes = numpy.arange(len(alt_names))+1
-						ca = ca.set_index(ca.index.set_levels(alt_codes, 1))
+						ca = _with_index(ca, ca.index.set_levels(alt_codes, 1))
 					else:
 						raise ValueError('ca multi-index must have integer values') from err
 
@@ -898,7 +922,7 @@ cdef class DataFrames:
 		"""
 		return self._is_computational_ready(activate)
 
-	def to_feathers(self, filename, components=None):
+	def to_feathers(self, filename, components=None, compression=None):
 		"""
 		Output data to a collection of Feather files.
 
@@ -910,6 +934,10 @@ cdef class DataFrames:
 			will be created.
 		components : subset of {'co','ca','ce','wt','av','ch','meta'}
 			Only these data components will be exported.
+		compression : {None, 'lz4', 'zstd', 'uncompressed'}
+			The compression for the data files, as for
+			`pyarrow.feather.write_feather`.  Use 'uncompressed' for
+			files that will be loaded with `from_feathers(memory_map=True)`.
 
 		"""
 		import pyarrow as pa
@@ -951,7 +979,7 @@ cdef class DataFrames:
 				array_ = getattr(self, f'array_{seg}')()
 				if array_ is not None:
 					if seg == 'ce':
-						pf.write_feather(self.data_ce.reset_index(), str(filename)+f".data_ce")
+						pf.write_feather(self.data_ce.reset_index(), str(filename)+f".data_ce", compression=compression)
 					else:
 						if array_.flags['F_CONTIGUOUS']:
 							tb = pa.table([array_.T.reshape(-1)], [f'data_{seg}'])
@@ -968,7 +996,7 @@ cdef class DataFrames:
 							metadata[b'COLUMNSBYTES'] = str(len(columns))
 						new_schema = tb.schema.with_metadata(metadata)
 						tb = tb.cast(new_schema)
-						pf.write_feather(tb, str(filename)+f".data_{seg}")
+						pf.write_feather(tb, str(filename)+f".data_{seg}", compression=compression)
 			for seg in components:
 				if seg == 'meta': continue
 				segment_out(seg)
@@ -1016,7 +1044,32 @@ cdef class DataFrames:
 			raise
 
 	@classmethod
-	def from_feathers(cls, filename, components=None):
+	def from_feathers(cls, filename, components=None, memory_map=False):
+		"""
+		Load data from a collection of Feather files.
+
+		Parameters
+		----------
+		filename : path-like
+			The base filename of the files, as given to `to_feathers`.
+		components : subset of {'co','ca','ce','wt','av','ch','meta'}
+			Only these data components will be imported.
+		memory_map : bool, default False
+			Memory-map the files instead of reading them.  For files
+			written with `compression='uncompressed'`, the co, ca and
+			av arrays are then read-only views of the mapped files, so
+			nothing is read until it is used, and processes that load
+			the same files share one copy of the data in the page cache.
+			The ch and wt arrays are still copied, as they must be
+			writeable, and idce data is always read into memory.
+			The mapped arrays are used directly by the Cython kernels,
+			and by a `NumbaModel` that uses every column (or that has
+			`repack_data` set to False).
+
+		Returns
+		-------
+		DataFrames
+		"""
 		import pyarrow as pa
 		import pyarrow.feather as pf
 		import pickle
@@ -1055,6 +1108,12 @@ cdef class DataFrames:
 		else:
 			wgtnorm = 1.0
 
+		def column_array(tb, name):
+			column = tb[name]
+			if memory_map and column.num_chunks == 1:
+				return column.chunk(0).to_numpy(zero_copy_only=True)
+			return column.to_numpy()
+
 		kwargs = {}
 		def segment_in(seg):
 			try:
@@ -1064,13 +1123,13 @@ cdef class DataFrames:
 						df = pf.read_feather(filename_seg)
 						df = df.set_index(list(df.columns[:2]))
 					else:
-						tb = pf.read_table(filename_seg)
+						tb = pf.read_table(filename_seg, memory_map=memory_map)
 						columns = from_metadata(tb, b'COLUMNS')
 						transpose = tb.schema.metadata.get(b'T', b'N')
 						if transpose == b'Y':
-							arr = tb[f'data_{seg}'].to_numpy().reshape(len(columns), -1).T
+							arr = column_array(tb, f'data_{seg}').reshape(len(columns), -1).T
 						else:
-							arr = tb[f'data_{seg}'].to_numpy().reshape(-1, len(columns))
+							arr = column_array(tb, f'data_{seg}').reshape(-1, len(columns))
 						if seg == 'ca':
 							idx = pandas.MultiIndex.from_product([
 							    caseindex,
@@ -1096,6 +1155,46 @@ cdef class DataFrames:
 		result.weight_normalization = wgtnorm
 		return result
 
+	def to_shared_memory(self):
+		"""
+		Copy the data into shared memory, for use by worker processes.
+
+		Pickling the result (or a model to which it is attached) only
+		serializes a lightweight `SharedMemoryHandle`, and unpickling it
+		in another process attaches to the same memory without copying
+		the data.  The shared memory is released when the result (more
+		precisely, its `shared_memory` handle) is garbage collected in
+		this process, so it must be kept alive while workers use it.
+
+		Returns
+		-------
+		DataFrames
+
+		Raises
+		------
+		TypeError
+			If any data column has an object dtype.
+		"""
+		from .util.shared_memory import SharedMemoryHandle
+		return SharedMemoryHandle.create(self).attach()
+
+	@property
+	def shared_memory(self):
+		"""SharedMemoryHandle or None : The handle to the shared memory holding this data, if any."""
+		return self._shared_memory
+
+	def _set_shared_memory(self, handle):
+		self._shared_memory = handle
+		self._case_map = handle._metadata.get('case_map', None)
+
+	def __reduce__(self):
+		if self._shared_memory is None:
+			raise TypeError(
+				'DataFrames can only be pickled when its data is in shared memory, '
+				'see `DataFrames.to_shared_memory`'
+			)
+		return (self._shared_memory.attach, ())
+
 	def inject_feathers(self, filename, components=None):
 		"""
 		Read data from a collection of Feather files.
@@ -1504,7 +1603,7 @@ cdef class DataFrames:
 			# Change level names if requested
 			caseindex_name = self._caseindex_name or df.index.names[0]
 			altindex_name = self._altindex_name or df.index.names[1]
-			df = df.set_index(df.index.set_names([caseindex_name, altindex_name]))
+			df = _with_index(df, df.index.set_names([caseindex_name, altindex_name]))
 
 			if self._computational:
 				self._data_ca = _ensure_dataframe_of_dtype(df, l4_float_dtype, 'data_ca')
@@ -1564,7 +1663,7 @@ cdef class DataFrames:
 
 			# Change index name if requested
 			caseindex_name = self._caseindex_name or df.index.names[0]
-			df = df.set_index(df.index.set_names(caseindex_name))
+			df = _with_index(df, df.index.set_names(caseindex_name))
 
 			if self._computational:
 				self._data_co = _ensure_dataframe_of_dtype(df, l4_float_dtype, 'data_co')
@@ -1936,16 +2035,44 @@ cdef class DataFrames:
 			raise NotImplementedError("data_ca is not defined, just use data_co")
 		return result
 
-	def array_ca(self, dtype=None, force=False):
+	def array_ca(self, dtype=None, force=False, columns=None):
+		"""
+		The idca data as an array of shape [n_cases, n_alts, n_vars].
+
+		Parameters
+		----------
+		dtype : dtype, optional
+		force : bool, default False
+			Return an empty array instead of None when there is no idca data.
+		columns : Sequence[str], optional
+			Keep only these columns, in this order.  The result is then a
+			new C-contiguous array, and the other columns are never copied.
+		"""
 		if force and self.data_ca is None:
 			dtype = dtype if dtype is not None else numpy.float32
 			return numpy.empty( (self.n_cases, self.n_alts, 0), dtype=dtype)
+		if columns is not None:
+			return _df_values_c_contiguous(self.data_ca[list(columns)], (self.n_cases, self.n_alts, -1), dtype=dtype)
 		return _df_values(self.data_ca, (self.n_cases, self.n_alts, -1), dtype=dtype)
 
-	def array_co(self, dtype=None, force=False):
+	def array_co(self, dtype=None, force=False, columns=None):
+		"""
+		The idco data as an array of shape [n_cases, n_vars].
+
+		Parameters
+		----------
+		dtype : dtype, optional
+		force : bool, default False
+			Return an empty array instead of None when there is no idco data.
+		columns : Sequence[str], optional
+			Keep only these columns, in this order.  The result is then a
+			new C-contiguous array, and the other columns are never copied.
+		"""
 		if force and self.data_co is None:
 			dtype = dtype if dtype is not None else numpy.float32
 			return numpy.empty( (self.n_cases, 0), dtype=dtype)
+		if columns is not None:
+			return _df_values_c_contiguous(self.data_co[list(columns)], dtype=dtype)
 		return _df_values(self.data_co, dtype=dtype)
 
 	def array_ce(self, dtype=None, force=False):
@@ -3143,6 +3270,121 @@ cdef class DataFrames:
 			logger.exception('error in DataFrames.split')
 			raise
 
+	def compress_cases(self):
+		"""
+		Collapse identical cases into single cases with their combined weight.
+
+		Cases are identical when they have the same idco and idca (or idce)
+		data, availability and choices.  Each set of identical cases is
+		replaced by its first case, with a weight equal to the total weight
+		of the set, or the number of cases in the set if there are no
+		weights.  The log likelihood, its gradient and the BHHH matrix are
+		unchanged, but are computed over fewer cases.
+
+		Returns
+		-------
+		DataFrames
+			The compressed data.  Its `case_map` gives the compressed case
+			that each original case was collapsed into, and `expand_cases`
+			maps casewise results back to the original cases.
+		"""
+		cdef DataFrames result
+		try:
+			caseindex = self.caseindex
+			parts = []
+			for df in (self.data_co, self.data_av, self.data_ch):
+				if df is not None:
+					parts.append(df.to_numpy(dtype=numpy.float64).reshape(self.n_cases, -1))
+			for df in (self.data_ca, self.data_ce):
+				if df is not None:
+					wide = df.unstack().reindex(caseindex)
+					parts.append(wide.to_numpy(dtype=numpy.float64))
+			rows = numpy.concatenate(parts, axis=1)
+			# NaN never compares equal, so mark the NaN (e.g. missing idce
+			# alternatives) in separate columns and zero them in the data
+			missing = numpy.isnan(rows)
+			if missing.any():
+				rows[missing] = 0
+				rows = numpy.concatenate([rows, missing.astype(numpy.float64)], axis=1)
+			rows = numpy.ascontiguousarray(rows)
+			_, first, inverse = numpy.unique(rows, axis=0, return_index=True, return_inverse=True)
+			inverse = inverse.reshape(-1)
+
+			# number the compressed cases in order of first appearance
+			order = numpy.argsort(first)
+			rank = numpy.empty_like(order)
+			rank[order] = numpy.arange(order.size)
+			case_map = rank[inverse]
+			keep = first[order]
+			keep_ids = caseindex[keep]
+
+			if self.data_wt is not None:
+				wt = self.array_wt().reshape(-1).astype(numpy.float64)
+			else:
+				wt = numpy.ones(self.n_cases)
+			data_wt = pandas.DataFrame(
+				{self._data_wt_name or 'computed_weight': numpy.bincount(case_map, weights=wt)},
+				index=keep_ids,
+			)
+
+			def keep_idca(df):
+				if df is None:
+					return None
+				result = df[df.index.get_level_values(0).isin(keep_ids)]
+				result.index = remove_unused_level(result.index, 0)
+				return result
+
+			result = self.__class__(
+				data_co=None if self.data_co is None else self.data_co.iloc[keep],
+				data_ca=keep_idca(self.data_ca),
+				data_ce=keep_idca(self.data_ce),
+				data_av=None if self.data_av is None else self.data_av.iloc[keep],
+				data_ch=None if self.data_ch is None else self.data_ch.iloc[keep],
+				data_wt=data_wt,
+				alt_names = self.alternative_names(),
+				alt_codes = self.alternative_codes(),
+				sys_alts=self.sys_alts,
+				ch_name=self._data_ch_name,
+				wt_name=self._data_wt_name,
+				av_name=self._data_av_name,
+			)
+			result.weight_normalization = self.weight_normalization
+			result._case_map = pandas.Series(case_map, index=caseindex, name='compressed_case')
+			logger.debug(f'compressed {self.n_cases} cases to {result.n_cases}')
+			return result
+		except:
+			logger.exception('error in DataFrames.compress_cases')
+			raise
+
+	@property
+	def case_map(self):
+		"""pandas.Series or None : For compressed data, the compressed case position of each original case."""
+		return self._case_map
+
+	def expand_cases(self, values):
+		"""
+		Map casewise results on compressed data back to the original cases.
+
+		Parameters
+		----------
+		values : array-like or pandas.DataFrame or pandas.Series
+			Casewise values, with one row per compressed case.
+
+		Returns
+		-------
+		same type as `values`
+			The values with one row per original case.  Pandas objects
+			are indexed by the original case index.
+		"""
+		if self._case_map is None:
+			raise ValueError('these DataFrames were not made by compress_cases')
+		positions = self._case_map.to_numpy()
+		if isinstance(values, (pandas.DataFrame, pandas.Series)):
+			result = values.iloc[positions]
+			result.index = self._case_map.index
+			return result
+		return numpy.asarray(values)[positions]
+
 	def make_idca(self, *columns, selector=None, float_dtype=numpy.float64):
 		"""
 		Extract a set of idca values into a new dataframe.
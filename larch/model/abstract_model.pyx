@@ -501,6 +501,52 @@ cdef class AbstractChoiceModel(ParameterFrame):
 		"""
 		raise NotImplementedError("abstract base class, use a derived class instead")
 
+	def loglike_multi(self, x, *, return_gradient=False):
+		"""
+		Compute the log likelihood at several sets of parameter values.
+
+		This implementation evaluates the points one at a time, models
+		that can evaluate all the points in a single pass through the
+		data override it.  The parameter values of the model are not
+		changed.
+
+		Parameters
+		----------
+		x : array-like, shape [n_points, n_params]
+			Each row is a complete vector of parameter values, in the
+			order of `pnames`.
+		return_gradient : bool, default False
+			Whether to also compute the gradient at each point.
+
+		Returns
+		-------
+		dictx
+			The log likelihood at each point is given by key 'll', and if
+			`return_gradient` the gradients by key 'dll', as an array of
+			shape [n_points, n_params].
+		"""
+		from ..util import dictx
+		points = np.array(x, dtype=np.float64, ndmin=2)
+		if points.ndim != 2 or points.shape[1] != len(self.pf):
+			raise ValueError(f'x must have shape [n_points, {len(self.pf)}], not {points.shape}')
+		ll = np.zeros(points.shape[0])
+		dll = np.zeros(points.shape) if return_gradient else None
+		current_values = self.pvals.copy()
+		try:
+			for j in range(points.shape[0]):
+				if return_gradient:
+					y = self.loglike2(points[j])
+					ll[j] = y.ll
+					dll[j] = np.asarray(y.dll)
+				else:
+					ll[j] = self.loglike(points[j])
+		finally:
+			self.set_values(current_values)
+		result = dictx(ll=ll)
+		if return_gradient:
+			result['dll'] = dll
+		return result
+
 	def d_loglike(self, x=None, *, start_case=0, stop_case=-1, step_case=1, leave_out=-1, keep_only=-1, subsample=-1,):
 		"""
 		Compute the first derivative of log likelihood with respect to the parameters.
@@ -1565,13 +1611,7 @@ cdef class AbstractChoiceModel(ParameterFrame):
 			ref_value_orig = ref_value
 			if _current_ll is None:
 				_current_ll = self.loglike()
-			if param is None:
-				result = pd.Series(data=np.nan, index=self.pf.index)
-				for p in self.pf.index:
-					if not self.pf.loc[p, 'holdfast'] or include_holdfast:
-						result[p] = self.likelihood_ratio(p, ref_value=ref_value, _current_ll=_current_ll)
-				return result
-			elif isinstance(param, str):
+			if isinstance(param, str):
 				if ref_value is None:
 					ref_value = self.pf.loc[param, 'nullvalue']
 				current_value = self.pf.loc[param, 'value']
@@ -1588,10 +1628,25 @@ cdef class AbstractChoiceModel(ParameterFrame):
 						self.pf.loc[param, 'likelihood_ratio'] = like_ratio
 				return like_ratio
 			else:
-				result = pd.Series(data=np.nan, index=list(param))
-				for p in result.index:
-					if not self.pf.loc[p, 'holdfast'] or include_holdfast:
-						result[p] = self.likelihood_ratio(p, ref_value=ref_value, _current_ll=_current_ll)
+				# all the alternative points are evaluated together by `loglike_multi`
+				names = self.pf.index if param is None else list(param)
+				result = pd.Series(data=np.nan, index=names)
+				names = [p for p in names if not self.pf.loc[p, 'holdfast'] or include_holdfast]
+				if ref_value is None:
+					ref_values = self.pf.loc[names, 'nullvalue'].to_numpy(dtype=np.float64)
+				else:
+					ref_values = np.full(len(names), ref_value, dtype=np.float64)
+				slots = self.pf.index.get_indexer(names)
+				current_values = self.pvals.astype(np.float64)
+				changed = ref_values != current_values[slots]
+				like_ratio = np.zeros(len(names))
+				if changed.any():
+					points = np.tile(current_values, (int(changed.sum()), 1))
+					points[np.arange(points.shape[0]), slots[changed]] = ref_values[changed]
+					like_ratio[changed] = _current_ll - self.loglike_multi(points).ll
+				result[names] = like_ratio
+				if ref_value_orig is None and len(names):
+					self.pf.loc[names, 'likelihood_ratio'] = like_ratio
 				return result
 		except:
 			logger.exception("error in likelihood_ratio")
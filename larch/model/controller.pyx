@@ -132,6 +132,9 @@ cdef class Model5c(AbstractChoiceModel):
 		state["_cached_loglike_best           ".strip()] = (self._cached_loglike_best           )
 		state["_title                         ".strip()] = (self._title                         )
 		state["_matrixes                      ".strip()] = (self._matrixes                      )
+		# data in shared memory is sent as a handle, other data is not sent
+		if self._dataframes is not None and self._dataframes.shared_memory is not None:
+			state["_shared_memory"] = self._dataframes.shared_memory
 
 		state = cloudpickle.dumps(state)
 		state = gzip.compress(state)
@@ -179,6 +182,8 @@ cdef class Model5c(AbstractChoiceModel):
 		self.unmangle(True)
 		self.n_threads = 0
 		self._prior_frame_values = None
+		if state.get("_shared_memory", None) is not None:
+			self.dataframes = state["_shared_memory"].attach()
 		# if self._graph is not None:
 		# 	self.graph.set_touch_callback(self.mangle)
 
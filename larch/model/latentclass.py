@@ -254,6 +254,70 @@ class LatentClassModel(AbstractChoiceModel):
 		return p
 
 
+	def _mixed_loglike(self, start_case=0, stop_case=-1, step_case=1, return_dll=True, return_bhhh=False):
+		"""
+		Compute the log likelihood by mixing the class log likelihoods of each case.
+
+		The choices within a case are treated as repeated choices of the same
+		decision maker, so the class-specific likelihood of a case is the product
+		of the probabilities of its chosen alternatives, each raised to the power
+		of its choice amount.  This is the likelihood for which
+		`class_responsibility` gives the posterior class probabilities.
+
+		Returns
+		-------
+		ll : float
+		dll : ndarray or None
+		bhhh : ndarray or None
+		"""
+		if stop_case == -1:
+			stop_case = self.n_cases
+		cases = slice(start_case, stop_case, step_case)
+		if self.dataframes.data_wt is not None:
+			wt = self.dataframes.array_wt()[cases].reshape(-1).astype(numpy.float64)
+		else:
+			wt = None
+		ch = numpy.asarray(self.dataframes.array_ch()[cases], dtype=numpy.float64)
+		n_alts = self.dataframes.n_alts
+		import warnings
+		with warnings.catch_warnings():
+			warnings.simplefilter("ignore", category=ParameterNotInModelWarning)
+			k_membership_probability = self.class_membership_probability(
+				start_case=start_case, stop_case=stop_case, step_case=step_case,
+			)
+			pi = k_membership_probability.to_numpy(dtype=numpy.float64, copy=True)
+			with numpy.errstate(divide='ignore'):
+				log_joint = numpy.log(pi)
+			if return_dll or return_bhhh:
+				d_log_joint = numpy.asarray(self.class_membership_d_probability(
+					start_case=start_case, stop_case=stop_case, step_case=step_case,
+				), dtype=numpy.float64)[:, :pi.shape[1], :] / numpy.where(pi > 0, pi, 1.0)[:, :, None]
+			for k_position, k_name in enumerate(k_membership_probability.columns):
+				k_model = self._k_models[k_name]
+				k_pr = numpy.asarray(k_model.probability(
+					start_case=start_case, stop_case=stop_case, step_case=step_case,
+				))[:, :n_alts]
+				ch_over_pr = ch / numpy.where(ch > 0, k_pr, 1.0)
+				with numpy.errstate(divide='ignore', invalid='ignore'):
+					log_joint[:, k_position] += numpy.where(ch > 0, ch * numpy.log(k_pr), 0.0).sum(1)
+				if return_dll or return_bhhh:
+					k_d_pr = numpy.asarray(k_model.d_probability(
+						start_case=start_case, stop_case=stop_case, step_case=step_case,
+					))[:, :n_alts, :]
+					d_log_joint[:, k_position, :] += numpy.einsum('ca,cap->cp', ch_over_pr, k_d_pr)
+		shifter = log_joint.max(1, keepdims=True)
+		with numpy.errstate(invalid='ignore'):
+			casewise_ll = numpy.log(numpy.exp(log_joint - shifter).sum(1)) + shifter[:, 0]
+		ll = (casewise_ll * wt).sum() if wt is not None else casewise_ll.sum()
+		if not (return_dll or return_bhhh):
+			return ll, None, None
+		share = numpy.exp(log_joint - casewise_ll[:, None])
+		casewise_dll = numpy.einsum('ck,ckp->cp', share, d_log_joint)
+		weighted_dll = casewise_dll * wt[:, None] if wt is not None else casewise_dll
+		dll = weighted_dll.sum(0)
+		bhhh = weighted_dll.T @ casewise_dll if return_bhhh else None
+		return ll, dll, bhhh
+
 	def loglike2(
 			self,
 			x=None,
@@ -308,63 +372,29 @@ class LatentClassModel(AbstractChoiceModel):
 		from ..util import dictx
 
 		self.__prep_for_compute(x)
-		pr = self.probability(
-			x=None,
-			start_case=start_case, stop_case=stop_case, step_case=step_case,
-		)
-
 		y = dictx()
 
+		if probability_only or persist & persist_flags.PERSIST_PROBABILITY:
+			pr = self.probability(
+				x=None,
+				start_case=start_case, stop_case=stop_case, step_case=step_case,
+			)
+
 		if probability_only:
 			y.ll = numpy.nan
 			y.probability = pr
 			return y
 
-		d_p = self.d_probability(
-			x=None,
+		y.ll, y.dll, bhhh = self._mixed_loglike(
 			start_case=start_case, stop_case=stop_case, step_case=step_case,
-		)
-
-		from .nl import d_loglike_from_d_probability
-		from .mnl import loglike_from_probability
-
-		if stop_case == -1:
-			stop_case_ = self.n_cases
-		else:
-			stop_case_ = stop_case
-
-		if self.dataframes.data_wt is not None:
-			wt = self.dataframes.data_wt.iloc[start_case:stop_case_:step_case]
-		else:
-			wt = None
-
-		ch = self.dataframes.array_ch()[start_case:stop_case_:step_case]
-
-		y.ll = loglike_from_probability(
-			pr,
-			ch,
-			wt
+			return_bhhh=bool(persist & persist_flags.PERSIST_BHHH),
 		)
 
 		if persist & persist_flags.PERSIST_PROBABILITY:
 			y.probability = pr
 
 		if persist & persist_flags.PERSIST_BHHH:
-			y.dll, y.bhhh = d_loglike_from_d_probability(
-				pr,
-				d_p,
-				ch,
-				wt,
-				True
-			)
-		else:
-			y.dll = d_loglike_from_d_probability(
-				pr,
-				d_p,
-				ch,
-				wt,
-				False
-			)
+			y.bhhh = bhhh
 
 		if start_case==0 and (stop_case==-1 or stop_case==self.n_cases) and step_case==1:
 			self._check_if_best(y.ll)
@@ -480,34 +510,23 @@ class LatentClassModel(AbstractChoiceModel):
 			A dictx is returned if `persist` is non-zero.
 		"""
 		self.__prep_for_compute(x)
-		pr = self.probability(
-			x=None,
-			start_case=start_case,
-			stop_case=stop_case,
-			step_case=step_case,
-			return_dataframe=False,
-		)
+		if probability_only or persist & persist_flags.PERSIST_PROBABILITY:
+			pr = self.probability(
+				x=None,
+				start_case=start_case,
+				stop_case=stop_case,
+				step_case=step_case,
+				return_dataframe=False,
+			)
 		if probability_only:
 			return pr
-		from .mnl import loglike_from_probability
-
-		if stop_case == -1:
-			stop_case_ = self.n_cases
-		else:
-			stop_case_ = stop_case
-
-		if self.dataframes.data_wt is not None:
-			wt = self.dataframes.data_wt.iloc[start_case:stop_case_:step_case]
-		else:
-			wt = None
 
 		from ..util import dictx
 		y = dictx()
-		y.ll = loglike_from_probability(
-			pr,
-			self.dataframes.array_ch()[start_case:stop_case_:step_case],
-			wt
-		)
+		y.ll = self._mixed_loglike(
+			start_case=start_case, stop_case=stop_case, step_case=step_case,
+			return_dll=False,
+		)[0]
 
 		if start_case==0 and (stop_case==-1 or stop_case==self.n_cases) and step_case==1:
 			self._check_if_best(y.ll)
@@ -520,6 +539,264 @@ class LatentClassModel(AbstractChoiceModel):
 
 
 
+	def class_responsibility(self, x=None):
+		"""
+		Compute the posterior class membership probabilities.
+
+		The responsibility of class `k` for case `c` is the probability that the
+		case belongs to that class, given its observed choices, which is
+		proportional to the class membership probability times the likelihood of
+		those choices under the class model.
+
+		Parameters
+		----------
+		x : {'null', 'init', 'best', array-like, dict, scalar}, optional
+			Values for the parameters.  See :ref:`set_values` for details.
+
+		Returns
+		-------
+		pandas.DataFrame
+			One row per case and one column per class, with rows summing to 1.
+		"""
+		self.__prep_for_compute(x)
+		import warnings
+		with warnings.catch_warnings():
+			warnings.simplefilter("ignore", category=ParameterNotInModelWarning)
+			k_membership_probability = self.class_membership_probability()
+			ch = self.dataframes.array_ch()
+			n_alts = self.dataframes.n_alts
+			log_h = numpy.log(k_membership_probability.to_numpy(dtype=numpy.float64, copy=True))
+			for k_position, k_name in enumerate(k_membership_probability.columns):
+				k_pr = numpy.asarray(self._k_models[k_name].probability())[:, :n_alts]
+				with numpy.errstate(divide='ignore'):
+					log_k_pr = numpy.where(ch > 0, numpy.log(k_pr), 0.0)
+				log_h[:, k_position] += (ch * log_k_pr).sum(1)
+		log_h -= log_h.max(1, keepdims=True)
+		h = numpy.exp(log_h)
+		h /= h.sum(1, keepdims=True)
+		return pandas.DataFrame(
+			h,
+			index=k_membership_probability.index,
+			columns=k_membership_probability.columns,
+		)
+
+	def _em_submodels(self):
+		"""
+		Independent copies of the constituent models, for the M-step sub-fits.
+
+		Each copy keeps only its own parameters, so it can be estimated alone.
+		"""
+		self.unmangle()
+		import pickle
+		import warnings
+		submodels = {}
+		with warnings.catch_warnings():
+			warnings.simplefilter("ignore", category=ParameterNotInModelWarning)
+			for k_name, k_model in [(None, self._k_membership), *self._k_models.items()]:
+				sub = pickle.loads(k_model.dumps())
+				if sub.graph is not None:
+					sub.graph.set_touch_callback(sub.mangle)
+				sub.remove_unused_parameters(verbose=False)
+				submodels[k_name] = sub
+		return submodels
+
+	def _em_step_data(self, responsibility):
+		"""
+		The weighted data for each M-step sub-fit, given the class responsibilities.
+
+		The DataFrames are built once, and only their responsibility
+		dependent parts are replaced on later iterations, see
+		`_em_update_step_data`.
+		"""
+		x = self.dataframes
+		top = self._k_membership.dataframes
+		step_data = {
+			None: DataFrames(
+				co=top.data_co,
+				ch=pandas.DataFrame(
+					0.0,
+					index=top.caseindex,
+					columns=top.alternative_codes(),
+				),
+				wt=pandas.Series(self._em_case_weights(), index=top.caseindex, name='wt'),
+				alt_codes=top.alternative_codes(),
+				alt_names=top.alternative_names(),
+				av=1,
+			),
+		}
+		for k_name in self._k_models:
+			step_data[k_name] = DataFrames(
+				co=x.data_co,
+				ca=x.data_ca,
+				ce=x.data_ce,
+				av=x.data_av,
+				ch=x.data_ch,
+				wt=pandas.Series(0.0, index=x.caseindex, name='wt'),
+				alt_names=x.alternative_names(),
+				alt_codes=x.alternative_codes(),
+			)
+		self._em_update_step_data(step_data, responsibility)
+		return step_data
+
+	def _em_case_weights(self):
+		x = self.dataframes
+		if x.data_wt is not None:
+			return x.array_wt().reshape(-1).astype(numpy.float64)
+		return numpy.ones(x.n_cases)
+
+	def _em_update_step_data(self, step_data, responsibility):
+		"""
+		Replace the choices of the membership sub-fit and the weights of the class sub-fits.
+
+		Parameters
+		----------
+		step_data : dict
+			The DataFrames of each sub-fit, from `_em_step_data`, which
+			are changed in place.
+		responsibility : pandas.DataFrame
+			The class responsibilities, from `class_responsibility`.
+		"""
+		top = step_data[None]
+		top.data_ch = pandas.DataFrame(
+			responsibility.to_numpy(),
+			index=top.caseindex,
+			columns=top.alternative_codes(),
+		)
+		wt = self._em_case_weights()
+		for k_name in self._k_models:
+			step_data[k_name].data_wt = pandas.Series(
+				wt * responsibility[k_name].to_numpy(),
+				index=step_data[k_name].caseindex,
+				name='wt',
+			)
+
+	def maximize_loglike_em(
+			self,
+			max_iter=100,
+			tol=1e-6,
+			n_threads=None,
+			quiet=True,
+			**kwargs,
+	):
+		"""
+		Maximize the log likelihood with the expectation-maximization algorithm.
+
+		Each iteration computes the posterior class responsibilities of every
+		case (the E-step), and then re-estimates each class choice model on the
+		data weighted by its responsibilities, and the class membership model
+		with the responsibilities as fractional choices (the M-step).  Each
+		M-step sub-fit is an ordinary single model estimation, so it uses the
+		fast MNL or NL engines, and does not need the derivatives of the full
+		latent class model.
+
+		Constituent models that have free parameters in common are estimated
+		together, as a `ModelGroup` of their weighted models, so that each
+		M-step maximizes the expected complete-data log likelihood jointly
+		over the shared parameters.  The sub-fits of unconnected models are
+		independent and are run concurrently in a thread pool.
+
+		Parameters
+		----------
+		max_iter : int, default 100
+			The maximum number of EM iterations.
+		tol : float, default 1e-6
+			Stop when an iteration improves the log likelihood by less than
+			this.  EM never decreases the log likelihood if each sub-fit
+			converges, so an iteration that does decrease it raises a
+			RuntimeWarning and does not stop the iterations.
+		n_threads : int, optional
+			The number of sub-fits to run at once.  Defaults to one per
+			group of constituent models that share parameters.
+		quiet : bool, default True
+			Whether to suppress the dashboard of the sub-fits.
+		**kwargs
+			Other arguments are passed to `maximize_loglike` for each sub-fit.
+
+		Returns
+		-------
+		dictx
+			The final log likelihood under key 'loglike', the parameter values
+			under 'x', the number of iterations, and the elapsed time.
+		"""
+		import warnings
+		from ..util import dictx
+		from ..util.timesize import Timer
+		from concurrent.futures import ThreadPoolExecutor
+
+		timer = Timer()
+		submodels = self._em_submodels()
+		free_names = {
+			k_name: set(sub.pf.index[sub.pf.holdfast == 0])
+			for k_name, sub in submodels.items()
+		}
+
+		# models that share free parameters must be fit together
+		fit_groups = []
+		for k_name in submodels:
+			joined = [g for g in fit_groups if any(free_names[k_name] & free_names[j] for j in g)]
+			merged = [k_name]
+			for g in joined:
+				fit_groups.remove(g)
+				merged = g + merged
+			fit_groups.append(merged)
+		kwargs.setdefault('check_for_overspecification', False)
+
+		def sub_fit(k_names, step_data):
+			members = [submodels[k_name] for k_name in k_names]
+			for k_name, sub in zip(k_names, members):
+				sub.set_values(self.pf.value.reindex(sub.pf.index).to_dict())
+				# the data was checked when first attached, so this only
+				# refreshes what the model derives from the new weights
+				sub.set_dataframes(step_data[k_name], check_sufficiency=False)
+			if len(members) == 1:
+				fitter = members[0]
+			else:
+				from .model_group import ModelGroup
+				fitter = ModelGroup(members, max_workers=1)
+				fitter.set_values(self.pf.value.reindex(fitter.pf.index).to_dict())
+			fitter.maximize_loglike(quiet=quiet, **kwargs)
+			names = sorted(set().union(*(free_names[k_name] for k_name in k_names)))
+			return fitter.pf.value[names]
+
+		ll = self.loglike()
+		message = f"reached max_iter={max_iter}"
+		iteration = 0
+		step_data = None
+		with ThreadPoolExecutor(max_workers=n_threads or len(fit_groups)) as executor:
+			for iteration in range(1, max_iter + 1):
+				if step_data is None:
+					step_data = self._em_step_data(self.class_responsibility())
+					for k_name, sub in submodels.items():
+						sub.dataframes = step_data[k_name]
+				else:
+					self._em_update_step_data(step_data, self.class_responsibility())
+				futures = [executor.submit(sub_fit, k_names, step_data) for k_names in fit_groups]
+				for future in futures:
+					self.set_values(future.result().to_dict())
+				prior_ll, ll = ll, self.loglike()
+				if ll < prior_ll:
+					warnings.warn(
+						f"EM iteration {iteration} decreased the log likelihood "
+						f"from {prior_ll} to {ll}, an M-step sub-fit may not have converged",
+						RuntimeWarning,
+						stacklevel=2,
+					)
+				elif ll - prior_ll < tol:
+					message = "converged"
+					break
+
+		result = dictx(
+			loglike=ll,
+			x=self.pf.value.copy(),
+			iterations=iteration,
+			message=message,
+			method='EM',
+			elapsed_time=timer.elapsed(),
+			n_cases=self.n_cases,
+		)
+		self._most_recent_estimation_result = result.copy()
+		return result
+
 	@property
 	def dataframes(self):
 		return self._dataframes
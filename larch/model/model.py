@@ -698,6 +698,7 @@ class Model(_Model5c):
 			repair_nan_wt=None,
 			repair_nan_data_co=None,
 			verbose=3,
+			fused=True,
 	):
 		self.unmangle(True)
 		from ..troubleshooting import doctor
@@ -710,6 +711,7 @@ class Model(_Model5c):
 			repair_nan_wt=repair_nan_wt,
 			repair_nan_data_co=repair_nan_data_co,
 			verbose=verbose,
+			fused=fused,
 		)
 		if repair_ch_av or repair_ch_zq or repair_asc or repair_noch_nowt \
 				or repair_nan_wt or repair_nan_data_co:
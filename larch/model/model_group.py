@@ -1,4 +1,6 @@
 
+import numpy
+import pandas
 
 from .abstract_model import AbstractChoiceModel
 from . import persist_flags
@@ -7,6 +9,24 @@ from .constraints import ParametricConstraintList
 from collections.abc import MutableSequence
 
 class ModelGroup(AbstractChoiceModel, MutableSequence):
+	"""
+	A group of models estimated jointly, with shared parameters.
+
+	The log likelihood of the group is the sum of the log likelihoods of
+	its members.  The members are evaluated concurrently in a thread pool,
+	as the larch and numba kernels release the GIL, and their gradients
+	and BHHH matrices are then summed into the parameters of the group.
+
+	Parameters
+	----------
+	models : Iterable[AbstractChoiceModel]
+		The member models.  Members of a ModelGroup given here are
+		added individually.
+	max_workers : int, optional
+		The number of member models to evaluate at once.  Defaults to
+		one per member, up to the number of CPUs.  Set to 1 to evaluate
+		the members one after another.
+	"""
 
 	constraints = ParametricConstraintList()
 
@@ -19,6 +39,7 @@ class ModelGroup(AbstractChoiceModel, MutableSequence):
 			title=None,
 			dataservice=None,
 			constraints=None,
+			max_workers=None,
 	):
 		super().__init__(
 			parameters=parameters,
@@ -35,6 +56,65 @@ class ModelGroup(AbstractChoiceModel, MutableSequence):
 		self._dataframes = None
 		self._mangled = True
 		self.constraints = constraints
+		self._max_workers = max_workers
+
+	@property
+	def max_workers(self):
+		"""int or None : The number of member models evaluated at once."""
+		return self._max_workers
+
+	@max_workers.setter
+	def max_workers(self, value):
+		self._max_workers = value
+
+	def _map_members(self, func):
+		"""
+		Apply a function to every member model, concurrently where possible.
+
+		The thread pool lasts only for this call, so a group holds no
+		threads between evaluations.
+		"""
+		if self._max_workers == 1 or len(self._k_models) < 2:
+			return [func(k) for k in self._k_models]
+		import os
+		from concurrent.futures import ThreadPoolExecutor
+		max_workers = self._max_workers or min(len(self._k_models), os.cpu_count() or 1)
+		with ThreadPoolExecutor(max_workers=max_workers) as executor:
+			return list(executor.map(func, self._k_models))
+
+	def _reduce_parts(self, ll2_parts, keys=('dll', 'bhhh')):
+		"""
+		Sum the derivatives computed by the members into the group's parameters.
+
+		Parameters
+		----------
+		ll2_parts : Sequence[dictx]
+			The results from each member, in the order of the members.
+		keys : Collection[str]
+			The derivative keys to reduce.  A 'dll' entry is a vector over
+			the member's parameters, and a 'bhhh' entry a matrix.
+
+		Returns
+		-------
+		dict
+			The summed arrays for each key present in the member results,
+			indexed by the group's parameters.
+		"""
+		n_params = len(self.pf)
+		totals = {}
+		for k, y in zip(self._k_models, ll2_parts):
+			slots = self.pf.index.get_indexer(k.pf.index)
+			for key in keys:
+				if key not in y:
+					continue
+				part = numpy.asarray(y[key])
+				if part.ndim == 1:
+					total = totals.setdefault(key, numpy.zeros(n_params))
+					total[slots] += part
+				else:
+					total = totals.setdefault(key, numpy.zeros([n_params, n_params]))
+					total[numpy.ix_(slots, slots)] += part
+		return totals
 
 	def __getitem__(self, x):
 		return self._k_models[x]
@@ -77,10 +157,14 @@ class ModelGroup(AbstractChoiceModel, MutableSequence):
 
 	def unmangle(self, force=False):
 		super().unmangle(force)
-		for k in self._k_models:
-			for i in k.pf.index:
-				if i not in self._frame.index:
-					self._frame.loc[i] = k.pf.loc[i]
+		missing = [
+			k.pf.loc[~k.pf.index.isin(self._frame.index)]
+			for k in self._k_models
+		]
+		if any(len(i) for i in missing):
+			joined = pandas.concat([self._frame, *missing], sort=False)
+			joined = joined[~joined.index.duplicated(keep='first')]
+			self._frame = joined.astype(self._frame.dtypes.to_dict())
 
 	def _frame_values_have_changed(self):
 		for k in self._k_models:
@@ -152,7 +236,7 @@ class ModelGroup(AbstractChoiceModel, MutableSequence):
 
 		from ..util import dictx
 		self.__prep_for_compute(x)
-		ll2_parts = [m.loglike(persist=persist) for m in self._k_models]
+		ll2_parts = self._map_members(lambda m: m.loglike(persist=persist))
 		if not persist:
 			result = sum(ll2_parts)
 			self._check_if_best(result)
@@ -217,21 +301,60 @@ class ModelGroup(AbstractChoiceModel, MutableSequence):
 
 		from ..util import dictx
 		self.__prep_for_compute(x)
-		ll2_parts = [m.loglike2(persist=persist) for m in self._k_models]
-		dll = ll2_parts[0].dll
-		for y in ll2_parts[1:]:
-			dll = dll.add(y.dll, fill_value=0)
-		dll = dll[self.pf.index]
+		if persist & persist_flags.PERSIST_BHHH:
+			ll2_parts = self._map_members(lambda m: m.loglike2_bhhh(persist=persist))
+		else:
+			ll2_parts = self._map_members(lambda m: m.loglike2(persist=persist))
+		totals = self._reduce_parts(ll2_parts)
 		ll2 = dictx(
 			ll=sum(y.ll for y in ll2_parts),
-			dll=dll,
+			dll=pandas.Series(totals['dll'], index=self.pf.index),
 		)
+		if 'bhhh' in totals:
+			ll2.bhhh = totals['bhhh']
 		for key in ll2_parts[0].keys():
-			if key not in {'ll','dll'}:
+			if key not in {'ll', 'dll', 'bhhh'}:
 				ll2[key] = list(y[key] for y in ll2_parts)
 		self._check_if_best(ll2.ll)
 		return ll2
 
+	def loglike2_bhhh(
+			self,
+			x=None,
+			*,
+			return_series=False,
+			start_case=0, stop_case=-1, step_case=1,
+			persist=0,
+			leave_out=-1, keep_only=-1, subsample=-1,
+	):
+		"""
+		Compute a log like, it first deriv, and the BHHH approx of the Hessian.
+
+		The BHHH matrix of the group is the sum of the BHHH matrices of
+		its members, as cases are not shared between members.
+
+		Parameters
+		----------
+		x : {'null', 'init', 'best', array-like, dict, scalar}, optional
+			Values for the parameters.  See :ref:`set_values` for details.
+
+		Returns
+		-------
+		dictx
+			The log likelihood is given by key 'll', the first derivative
+			by key 'dll', and the BHHH matrix by 'bhhh'.
+		"""
+		return self.loglike2(
+			x=x,
+			start_case=start_case,
+			stop_case=stop_case,
+			step_case=step_case,
+			persist=persist | persist_flags.PERSIST_BHHH,
+			leave_out=leave_out,
+			keep_only=keep_only,
+			subsample=subsample,
+		)
+
 	def doctor(
 			self,
 			repair_ch_av=None,
@@ -241,6 +364,7 @@ class ModelGroup(AbstractChoiceModel, MutableSequence):
 			repair_nan_wt=None,
 			repair_nan_data_co=None,
 			verbose=3,
+			fused=True,
 	):
 		problems = []
 		for k in self._k_models:
@@ -253,5 +377,6 @@ class ModelGroup(AbstractChoiceModel, MutableSequence):
 				repair_nan_wt=repair_nan_wt,
 				repair_nan_data_co=repair_nan_data_co,
 				verbose=verbose,
+				fused=fused,
 			))
 		return problems
\ No newline at end of file
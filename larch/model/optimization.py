@@ -47,6 +47,83 @@ class ModelDashboard:
                     self.body.update(body, force=force)
 
 
+class NegLoglikeCache:
+    """
+    Memoized negative log likelihood and gradient, for `scipy.optimize.minimize`.
+
+    The optimizers in scipy ask for the objective and its gradient through
+    separate callables, usually at the same parameter values.  This class
+    computes both (and optionally the BHHH matrix) in one evaluation of
+    the model, and keeps the results for the most recently evaluated
+    parameter vectors, so that later requests at the same point are
+    served without running the model again.
+
+    Parameters
+    ----------
+    model : AbstractChoiceModel
+    args : tuple
+        Extra positional arguments for `neg_loglike2`, i.e.
+        (start_case, stop_case, step_case, leave_out, keep_only, subsample).
+    maxsize : int, default 4
+        The number of parameter vectors to keep results for.  The least
+        recently used results are evicted first.  Set to 0 to keep no
+        results, so that every request evaluates the model.
+    bhhh : bool, default False
+        Also compute the BHHH matrix, see `neg_bhhh`.
+    """
+
+    _arg_names = ('start_case', 'stop_case', 'step_case', 'leave_out', 'keep_only', 'subsample')
+
+    def __init__(self, model, args=(), maxsize=4, bhhh=False):
+        from collections import OrderedDict
+        self.model = model
+        self.args = tuple(args)
+        self.maxsize = int(maxsize)
+        if self.maxsize < 0:
+            raise ValueError(f'maxsize must be non-negative, not {maxsize}')
+        self.bhhh = bhhh
+        self._cache = OrderedDict()
+        self.n_evaluations = 0
+
+    def _evaluate(self, x):
+        x = np.asarray(x, dtype=np.float64)
+        key = x.tobytes()
+        try:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+        except KeyError:
+            pass
+        if self.bhhh:
+            kwargs = dict(zip(self._arg_names, self.args))
+            result = self.model.loglike2_bhhh(x, **kwargs)
+            value = (-result.ll, -np.asarray(result.dll), -np.asarray(result.bhhh))
+        else:
+            value = self.model.neg_loglike2(x, *self.args)
+        self.n_evaluations += 1
+        self._cache[key] = value
+        while len(self._cache) > self.maxsize:
+            self._cache.popitem(last=False)
+        return value
+
+    def neg_loglike(self, x, *args):
+        """The negative log likelihood at `x`."""
+        return self._evaluate(x)[0]
+
+    def neg_d_loglike(self, x, *args):
+        """The gradient of the negative log likelihood at `x`."""
+        return self._evaluate(x)[1]
+
+    def neg_bhhh(self, x, *args):
+        """The negative BHHH matrix at `x`; requires `bhhh`."""
+        if not self.bhhh:
+            raise ValueError('this cache was not set up to compute the BHHH matrix')
+        return self._evaluate(x)[2]
+
+    def clear(self):
+        """Discard all cached results."""
+        self._cache.clear()
+
+
 def maximize_loglike(
         model,
         method=None,
@@ -70,6 +147,7 @@ def maximize_loglike(
         return_dashboard=False,
         dashboard=None,
         prior_result=None,
+        memoize=4,
         **kwargs,
 ):
     """
@@ -88,6 +166,13 @@ def maximize_loglike(
         otherwise defaults to BHHH.
     quiet : bool, default False
         Whether to suppress the dashboard.
+    memoize : int, default 4
+        For scipy methods, the log likelihood and its gradient are computed
+        together, and the results for this many of the most recently
+        evaluated parameter vectors are kept, so the model is evaluated
+        only once at each point.  See `NegLoglikeCache`.  Set to 0 to
+        disable this, so that the log likelihood and its gradient are
+        computed by separate evaluations of the model.
 
     Returns
     -------
@@ -314,12 +399,18 @@ def maximize_loglike(
                     constraints = ()
 
                 args = getattr(model, '_null_slice', (0,-1,1))
+                args = args+(leave_out, keep_only, subsample) # start_case, stop_case, step_case, leave_out, keep_only, subsample
+                if memoize:
+                    objective = NegLoglikeCache(model, args, maxsize=memoize)
+                    fun, jac = objective.neg_loglike, objective.neg_d_loglike
+                else:
+                    fun, jac = model.neg_loglike, model.neg_d_loglike
                 raw_result = minimize(
-                    model.neg_loglike,
+                    fun,
                     model.pvals,
-                    args=args+(leave_out, keep_only, subsample), # start_case, stop_case, step_case, leave_out, keep_only, subsample
+                    args=() if memoize else args,
                     method=method,
-                    jac=model.neg_d_loglike,
+                    jac=jac,
                     bounds=bounds,
                     callback=callback,
                     options=options,
@@ -1,4 +1,5 @@
 from .model import NumbaModel as Model
+from .warmup import warmup
 from .. import DataFrames, P, X, PX, OMX, DBF, Reporter, NumberedCaption, read_metadata, examples, util
 from ..examples import example as _example
 
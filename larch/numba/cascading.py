@@ -2,13 +2,13 @@ import numpy as np
 import pandas as pd
 from numba import njit, prange
 
-@njit(parallel=True, nogil=True)
+@njit(parallel=True, nogil=True, cache=True)
 def cascade_or(arr, dn_slots, up_slots):
     for i in prange(arr.shape[0]):
         for j in range(dn_slots.size):
             arr[i,up_slots[j]] |= arr[i,dn_slots[j]]
 
-@njit(parallel=True, nogil=True)
+@njit(parallel=True, nogil=True, cache=True)
 def cascade_sum(arr, dn_slots, up_slots):
     for i in prange(arr.shape[0]):
         for j in range(dn_slots.size):
@@ -32,8 +32,23 @@ def data_av_cascade(dataframes, graph):
     -------
     array
     """
-    result = np.zeros((len(dataframes.data_av.index), len(graph)), dtype=np.int8)
-    result[: ,:graph.n_elementals()] = dataframes.data_av
+    return array_av_cascade(dataframes.data_av, graph)
+
+def array_av_cascade(array_av, graph):
+    """
+    Create an extra wide array with availability rolled up to nests.
+
+    Parameters
+    ----------
+    array_av : array-like, shape [n_cases, n_alts]
+    graph : NestingTree
+
+    Returns
+    -------
+    array
+    """
+    result = np.zeros((array_av.shape[0], len(graph)), dtype=np.int8)
+    result[: ,:graph.n_elementals()] = array_av
     ups, dns, _1, _2 = graph.edge_slot_arrays()
     cascade_or(result, dns, ups)
     return result
@@ -57,11 +72,30 @@ def data_ch_cascade(dataframes, graph, dtype=None):
     -------
     array
     """
-    result = np.zeros(
-        (len(dataframes.data_ch.index), len(graph)),
+    return array_ch_cascade(
+        dataframes.data_ch,
+        graph,
         dtype=dtype or dataframes.data_ch.dtype,
     )
-    result[: ,:graph.n_elementals()] = dataframes.data_ch
+
+def array_ch_cascade(array_ch, graph, dtype=None):
+    """
+    Create an extra wide array with choices rolled up to nests.
+
+    Parameters
+    ----------
+    array_ch : array-like, shape [n_cases, n_alts]
+    graph : NestingTree
+
+    Returns
+    -------
+    array
+    """
+    result = np.zeros(
+        (array_ch.shape[0], len(graph)),
+        dtype=dtype or array_ch.dtype,
+    )
+    result[: ,:graph.n_elementals()] = array_ch
     ups, dns, _1, _2 = graph.edge_slot_arrays()
     cascade_sum(result, dns, ups)
     return result
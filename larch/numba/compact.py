@@ -0,0 +1,143 @@
+from collections import namedtuple
+import numpy as np
+from numba import njit, prange
+from ..util.bitmasking import pack_bits
+
+CompactArrays = namedtuple(
+    'CompactArrays',
+    ['ch_index', 'ch_amount', 'av_bits'],
+)
+
+
+def compact_choice(array_ch, dtype=np.float64):
+    """
+    Encode choices with at most one chosen alternative per case.
+
+    Parameters
+    ----------
+    array_ch : array-like, shape [n_cases, n_alts]
+    dtype : dtype, default float64
+        The dtype of the chosen amounts.
+
+    Returns
+    -------
+    ch_index : int32 array, shape [n_cases]
+        The position of the chosen alternative, or -1 if none is chosen.
+    ch_amount : array, shape [n_cases]
+        The value of `array_ch` for the chosen alternative.
+
+    Raises
+    ------
+    ValueError
+        If any case has more than one chosen alternative.
+    """
+    array_ch = np.asarray(array_ch)
+    chosen = array_ch != 0
+    n_chosen = chosen.sum(1)
+    if (n_chosen > 1).any():
+        raise ValueError(
+            f'{int((n_chosen > 1).sum())} cases have more than one chosen alternative, '
+            f'compact choices require at most one'
+        )
+    ch_index = np.where(n_chosen > 0, chosen.argmax(1), -1).astype(np.int32)
+    ch_amount = np.where(
+        n_chosen > 0,
+        array_ch[np.arange(array_ch.shape[0]), np.maximum(ch_index, 0)],
+        0,
+    ).astype(dtype)
+    return ch_index, ch_amount
+
+
+def compact_arrays(dataframes, n_alts, dtype=np.float64):
+    """
+    Build the compact choice and availability arrays for a DataFrames.
+
+    Parameters
+    ----------
+    dataframes : DataFrames
+    n_alts : int
+        The number of elemental alternatives.
+    dtype : dtype, default float64
+        The dtype of the chosen amounts.
+
+    Returns
+    -------
+    CompactArrays
+    """
+    n_cases = dataframes.n_cases
+    if dataframes.data_ch is not None:
+        ch_index, ch_amount = compact_choice(dataframes.data_ch.to_numpy()[:, :n_alts], dtype=dtype)
+    else:
+        ch_index = np.full(n_cases, -1, dtype=np.int32)
+        ch_amount = np.zeros(n_cases, dtype=dtype)
+    if dataframes.data_av is not None:
+        av_bits = pack_bits(dataframes.data_av.to_numpy()[:, :n_alts])
+    else:
+        av_bits = pack_bits(np.ones([n_cases, n_alts], dtype=np.int8))
+    return CompactArrays(ch_index, ch_amount, av_bits)
+
+
+@njit(parallel=True, nogil=True, cache=True)
+def _expand_compact(
+        ch_index,
+        ch_amount,
+        av_bits,
+        start,
+        n_alts,
+        dn_slots,
+        up_slots,
+        array_ch,
+        array_av,
+):
+    for i in prange(array_ch.shape[0]):
+        c = start + i
+        array_ch[i, :] = 0
+        array_av[i, :] = 0
+        for a in range(n_alts):
+            array_av[i, a] = (av_bits[c, a >> 3] >> (7 - (a & 7))) & 1
+        if ch_index[c] >= 0:
+            array_ch[i, ch_index[c]] = ch_amount[c]
+        for j in range(dn_slots.size):
+            array_av[i, up_slots[j]] |= array_av[i, dn_slots[j]]
+            array_ch[i, up_slots[j]] += array_ch[i, dn_slots[j]]
+
+
+def expand_compact_arrays(compact, graph, start=0, stop=None, dtype=None):
+    """
+    Expand a range of cases of compact arrays into cascaded ch and av arrays.
+
+    The result is the same as `array_ch_cascade` and `array_av_cascade`
+    applied to the dense choices and availability of those cases.
+
+    Parameters
+    ----------
+    compact : CompactArrays
+    graph : NestingTree
+    start, stop : int, optional
+        The range of cases to expand, by default all of them.
+    dtype : dtype, optional
+        The dtype of the choice array, by default that of the chosen amounts.
+
+    Returns
+    -------
+    array_ch : array, shape [stop-start, n_nodes]
+    array_av : int8 array, shape [stop-start, n_nodes]
+    """
+    if stop is None:
+        stop = compact.ch_index.shape[0]
+    n_nodes = len(graph)
+    array_ch = np.empty([stop - start, n_nodes], dtype=dtype or compact.ch_amount.dtype)
+    array_av = np.empty([stop - start, n_nodes], dtype=np.int8)
+    ups, dns, _1, _2 = graph.edge_slot_arrays()
+    _expand_compact(
+        compact.ch_index,
+        compact.ch_amount,
+        compact.av_bits,
+        start,
+        graph.n_elementals(),
+        dns,
+        ups,
+        array_ch,
+        array_av,
+    )
+    return array_ch, array_av
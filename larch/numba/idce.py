@@ -0,0 +1,83 @@
+from collections import namedtuple
+import numpy as np
+from numba import njit, prange
+
+CeArrays = namedtuple(
+    'CeArrays',
+    ['rows', 'altindex', 'case_start'],
+)
+
+
+def ce_arrays(dataframes, columns=None, dtype=np.float64):
+    """
+    Build the sparse case-alternative arrays for a DataFrames with idce data.
+
+    Parameters
+    ----------
+    dataframes : DataFrames
+    columns : Sequence[str], optional
+        Keep only these columns of `data_ce`, in this order.
+    dtype : dtype, default float64
+
+    Returns
+    -------
+    CeArrays
+        The data rows, shape [n_rows, n_vars], sorted by case; the position
+        of the alternative of each row, shape [n_rows]; and the first row
+        of each case, shape [n_cases+1], so that the rows of case `c` are
+        `rows[case_start[c]:case_start[c+1]]`.
+
+    Raises
+    ------
+    ValueError
+        If `data_ce` has rows for cases or alternatives that are not in
+        the DataFrames.
+    """
+    data_ce = dataframes.data_ce
+    if columns is not None:
+        data_ce = data_ce[list(columns)]
+    case_pos = dataframes.caseindex.get_indexer(data_ce.index.get_level_values(0))
+    alt_pos = dataframes.alternative_codes().get_indexer(data_ce.index.get_level_values(1))
+    if (case_pos < 0).any():
+        raise ValueError('data_ce has rows for cases not in caseindex')
+    if (alt_pos < 0).any():
+        raise ValueError('data_ce has rows for unknown alternative codes')
+    order = np.argsort(case_pos, kind='stable')
+    rows = np.ascontiguousarray(data_ce.to_numpy(dtype=dtype)[order])
+    case_start = np.searchsorted(
+        case_pos[order], np.arange(dataframes.n_cases + 1),
+    ).astype(np.int64)
+    return CeArrays(rows, alt_pos[order].astype(np.int32), case_start)
+
+
+@njit(parallel=True, nogil=True, cache=True)
+def _expand_ce(rows, altindex, case_start, start, array_ca):
+    for i in prange(array_ca.shape[0]):
+        array_ca[i, :, :] = 0
+        for r in range(case_start[start + i], case_start[start + i + 1]):
+            array_ca[i, altindex[r], :] = rows[r]
+
+
+def expand_ce_arrays(ce, n_alts, start=0, stop=None):
+    """
+    Expand a range of cases of sparse case-alternative arrays into idca form.
+
+    The result is the same as the `array_ca` of `data_ce_as_ca`, with
+    zeros for the alternatives that have no row.
+
+    Parameters
+    ----------
+    ce : CeArrays
+    n_alts : int
+    start, stop : int, optional
+        The range of cases to expand, by default all of them.
+
+    Returns
+    -------
+    array_ca : array, shape [stop-start, n_alts, n_vars]
+    """
+    if stop is None:
+        stop = ce.case_start.shape[0] - 1
+    array_ca = np.empty([stop - start, n_alts, ce.rows.shape[1]], dtype=ce.rows.dtype)
+    _expand_ce(ce.rows, ce.altindex, ce.case_start, start, array_ca)
+    return array_ca
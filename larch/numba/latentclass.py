@@ -0,0 +1,468 @@
+import numpy as np
+import numba
+from numba import njit, prange
+from ..model.latentclass import LatentClassModel as _BaseLatentClassModel
+from ..model import persist_flags
+from ..util import dictx
+from .cascading import data_av_cascade, data_ch_cascade
+from .model import (
+    FixedArrays,
+    _bhhh_workspace,
+    _numba_master_work,
+    model_co_slots,
+    model_fixed_arrays,
+)
+
+
+def pack_fixed_arrays(fixed_arrays):
+    """
+    Concatenate the fixed arrays of several models, for one kernel call.
+
+    Parameters
+    ----------
+    fixed_arrays : Sequence[FixedArrays]
+
+    Returns
+    -------
+    packed : FixedArrays
+        Each field is the concatenation along the first axis of that
+        field for all models.
+    offsets : int32 array, shape [n_models+1, n_fields]
+        Model `k` occupies rows `offsets[k, f]:offsets[k+1, f]` of field `f`.
+    """
+    packed = FixedArrays(*(
+        np.concatenate([getattr(f, name) for f in fixed_arrays])
+        for name in FixedArrays._fields
+    ))
+    lengths = np.asarray([
+        [len(getattr(f, name)) for name in FixedArrays._fields]
+        for f in fixed_arrays
+    ], dtype=np.int32)
+    offsets = np.zeros([len(fixed_arrays)+1, len(FixedArrays._fields)], dtype=np.int32)
+    offsets[1:] = np.cumsum(lengths, axis=0)
+    return packed, offsets
+
+
+@njit(error_model='numpy', fastmath=True, cache=True, parallel=True, nogil=True)
+def _latent_class_reduced(
+        membership_co_alt,          # int input shape=[n_membership_co_features]
+        membership_co_param_scale,  # float input shape=[n_membership_co_features]
+        membership_co_param,        # int input shape=[n_membership_co_features]
+        membership_co_data,         # int input shape=[n_membership_co_features]
+        membership_co,              # float input shape=[n_cases, n_membership_co_vars]
+
+        model_q_ca_param_scale,  # packed FixedArrays for all classes
+        model_q_ca_param,
+        model_q_ca_data,
+        model_q_scale_param,
+        model_utility_ca_param_scale,
+        model_utility_ca_param,
+        model_utility_ca_data,
+        model_utility_co_alt,
+        model_utility_co_param_scale,
+        model_utility_co_param,
+        model_utility_co_data,
+        edgeslots,
+        mu_slots,
+        start_slots,
+        len_slots,
+        node_param_start,
+        node_param_index,
+        node_param_slot,
+        offsets,       # int input shape=[n_classes+1, 18]
+
+        holdfast_arr,  # int8 input shape=[n_params]
+        parameter_arr, # float input shape=[n_params]
+
+        array_ch,      # float input shape=[n_cases, total class nodes]
+        array_av,      # int8 input shape=[n_cases, total class nodes]
+        array_wt,      # float input shape=[n_cases]
+        array_co,      # float input shape=[n_cases, n_co_vars]
+        array_ca,      # float input shape=[n_cases, n_alts, n_ca_vars]
+
+        return_bhhh,   # bool input scalar
+        n_blocks,      # int input scalar
+):
+    """
+    Evaluate a latent class log likelihood and sum the results across cases.
+
+    For each case the class membership probabilities and the log
+    likelihood of the observed choice under every class model are
+    computed together, and mixed into the case's log likelihood and its
+    gradient, so no array larger than [n_classes, n_params] is needed per
+    case.  Cases are split into `n_blocks` blocks which accumulate their
+    own partial sums in float64, as in `_numba_master_reduced`.
+
+    The choices within a case are treated as repeated choices of the
+    same decision maker: the class-specific likelihood of the case is
+    the product of the probabilities of its choices, each raised to the
+    power of its choice amount, as in
+    `larch.model.latentclass.LatentClassModel.loglike`.
+
+    Returns
+    -------
+    loglike : float64 array, shape [1]
+    d_loglike : float64 array, shape [n_params]
+    bhhh : float64 array, shape [n_params, n_params]
+        Zeros unless `return_bhhh` is set.
+    """
+    n_cases = array_ch.shape[0]
+    n_alts = array_ca.shape[1]
+    n_classes = offsets.shape[0] - 1
+    n_params = parameter_arr.size
+    n_bhhh = n_params if return_bhhh else 0
+    max_nodes = 0
+    max_nonzero = 0
+    for k in range(n_classes):
+        max_nodes = max(max_nodes, offsets[k+1, 17] - offsets[k, 17])
+        max_nonzero = max(max_nonzero, offsets[k+1, 16] - offsets[k, 16])
+    class_flags = np.zeros(4, dtype=np.int8)
+    class_flags[2] = 1
+    one = np.ones(1, dtype=array_ca.dtype)
+    unused_bhhh = np.zeros((0, 0), dtype=np.float64)
+    parent_edge = np.zeros(offsets[n_classes, 17], dtype=np.int32)
+    for k in range(n_classes):
+        parent_edge[offsets[k, 17]:offsets[k+1, 17]] = _bhhh_workspace(
+            edgeslots[offsets[k, 11]:offsets[k+1, 11]],
+            offsets[k+1, 17] - offsets[k, 17],
+            n_params,
+        )[0]
+
+    block_size = (n_cases + n_blocks - 1) // n_blocks
+    partial_ll = np.zeros(n_blocks, dtype=np.float64)
+    partial_dll = np.zeros((n_blocks, n_params), dtype=np.float64)
+    partial_bhhh = np.zeros((n_blocks, n_bhhh, n_bhhh), dtype=np.float64)
+
+    for b in prange(n_blocks):
+        utility = np.zeros(max_nodes, dtype=array_ca.dtype)
+        logprob = np.zeros(max_nodes, dtype=array_ca.dtype)
+        probability = np.zeros(max_nodes, dtype=array_ca.dtype)
+        dutility = np.zeros(max_nonzero, dtype=array_ca.dtype)
+        d_logprob = np.zeros(n_params, dtype=np.float64)
+        touched = np.zeros(n_params, dtype=np.int32)
+        touched_mark = np.zeros(n_params, dtype=np.int8)
+        class_loglike = np.zeros(1, dtype=np.float64)
+        class_d_loglike = np.zeros(n_params, dtype=np.float64)
+        membership_utility = np.zeros(n_classes, dtype=np.float64)
+        d_membership_utility = np.zeros((n_classes, n_params), dtype=np.float64)
+        log_joint = np.zeros(n_classes, dtype=np.float64)
+        d_log_joint = np.zeros((n_classes, n_params), dtype=np.float64)
+        gradient = np.zeros(n_params, dtype=np.float64)
+        for c in range(b * block_size, min((b + 1) * block_size, n_cases)):
+            n_chosen = 0.0
+            for a in range(n_alts):
+                n_chosen += array_ch[c, a]
+            if n_chosen == 0:
+                continue
+
+            # class membership, a MNL over the classes
+            membership_utility[:] = 0.0
+            d_membership_utility[:, :] = 0.0
+            for i in range(membership_co_alt.size):
+                if membership_co_data[i] >= 0:
+                    x = membership_co[c, membership_co_data[i]] * membership_co_param_scale[i]
+                else:
+                    x = membership_co_param_scale[i]
+                p = membership_co_param[i]
+                membership_utility[membership_co_alt[i]] += parameter_arr[p] * x
+                if not holdfast_arr[p]:
+                    d_membership_utility[membership_co_alt[i], p] += x
+            shifter = membership_utility.max()
+            total = 0.0
+            for k in range(n_classes):
+                total += np.exp(membership_utility[k] - shifter)
+            log_total = np.log(total) + shifter
+            gradient[:] = 0.0
+            for k in range(n_classes):
+                pr_k = np.exp(membership_utility[k] - log_total)
+                for p in range(n_params):
+                    gradient[p] += pr_k * d_membership_utility[k, p]
+            for k in range(n_classes):
+                log_joint[k] = membership_utility[k] - log_total
+                for p in range(n_params):
+                    d_log_joint[k, p] = d_membership_utility[k, p] - gradient[p]
+
+            # choice model for each class
+            for k in range(n_classes):
+                node_lo = offsets[k, 17]
+                node_hi = offsets[k+1, 17]
+                n_nodes_k = node_hi - node_lo
+                _numba_master_work(
+                    model_q_ca_param_scale[offsets[k, 0]:offsets[k+1, 0]],
+                    model_q_ca_param[offsets[k, 1]:offsets[k+1, 1]],
+                    model_q_ca_data[offsets[k, 2]:offsets[k+1, 2]],
+                    model_q_scale_param[offsets[k, 3]:offsets[k+1, 3]],
+                    model_utility_ca_param_scale[offsets[k, 4]:offsets[k+1, 4]],
+                    model_utility_ca_param[offsets[k, 5]:offsets[k+1, 5]],
+                    model_utility_ca_data[offsets[k, 6]:offsets[k+1, 6]],
+                    model_utility_co_alt[offsets[k, 7]:offsets[k+1, 7]],
+                    model_utility_co_param_scale[offsets[k, 8]:offsets[k+1, 8]],
+                    model_utility_co_param[offsets[k, 9]:offsets[k+1, 9]],
+                    model_utility_co_data[offsets[k, 10]:offsets[k+1, 10]],
+                    edgeslots[offsets[k, 11]:offsets[k+1, 11]],
+                    mu_slots[offsets[k, 12]:offsets[k+1, 12]],
+                    start_slots[offsets[k, 13]:offsets[k+1, 13]],
+                    len_slots[offsets[k, 14]:offsets[k+1, 14]],
+                    node_param_start[offsets[k, 15]:offsets[k+1, 15]],
+                    node_param_index[offsets[k, 16]:offsets[k+1, 16]],
+                    node_param_slot[node_lo:node_hi],
+                    holdfast_arr,
+                    parameter_arr,
+                    array_ch[c, node_lo:node_hi],
+                    array_av[c, node_lo:node_hi],
+                    one,
+                    array_co[c],
+                    array_ca[c],
+                    class_flags,
+                    utility[:n_nodes_k],
+                    logprob[:n_nodes_k],
+                    probability[:n_nodes_k],
+                    unused_bhhh,
+                    class_d_loglike,
+                    class_loglike,
+                    dutility[:offsets[k+1, 16] - offsets[k, 16]],
+                    parent_edge[node_lo:node_hi],
+                    d_logprob,
+                    touched,
+                    touched_mark,
+                )
+                log_joint[k] += class_loglike[0]
+                for p in range(n_params):
+                    d_log_joint[k, p] += class_d_loglike[p]
+
+            # mix the classes
+            shifter = log_joint.max()
+            total = 0.0
+            for k in range(n_classes):
+                total += np.exp(log_joint[k] - shifter)
+            log_likelihood = np.log(total) + shifter
+            gradient[:] = 0.0
+            for k in range(n_classes):
+                share = np.exp(log_joint[k] - log_likelihood)
+                for p in range(n_params):
+                    gradient[p] += share * d_log_joint[k, p]
+            weight = array_wt[c]
+            partial_ll[b] += log_likelihood * weight
+            for p in range(n_params):
+                partial_dll[b, p] += gradient[p] * weight
+            if return_bhhh:
+                for p in range(n_params):
+                    for q in range(n_params):
+                        partial_bhhh[b, p, q] += gradient[p] * gradient[q] * weight
+
+    loglike_total = np.zeros(1, dtype=np.float64)
+    d_loglike_total = np.zeros(n_params, dtype=np.float64)
+    bhhh_total = np.zeros((n_params, n_params), dtype=np.float64)
+    for b in range(n_blocks):
+        loglike_total[0] += partial_ll[b]
+        d_loglike_total[:] += partial_dll[b]
+        if return_bhhh:
+            bhhh_total[:, :] += partial_bhhh[b]
+    return loglike_total, d_loglike_total, bhhh_total
+
+
+class LatentClassModel(_BaseLatentClassModel):
+    """
+    A latent class model, with a fused numba kernel for the log likelihood.
+
+    The log likelihood, its gradient and the BHHH matrix over all cases
+    are computed in a single pass through the data, which evaluates the
+    class membership model and every class model for each case in turn.
+    Probabilities, and log likelihoods over a subset of cases, are
+    computed as in the base class.
+
+    The constituent models can be any larch models (MNL or nested logit),
+    and are specified exactly as for `larch.model.latentclass.LatentClassModel`.
+
+    Parameters
+    ----------
+    k_membership : Model
+        The class membership model.
+    k_models : MutableMapping[int,Model]
+        The individual class choice models.
+    float_dtype : dtype, default float64
+        The precision of the data arrays used by the kernel.  The
+        results are accumulated in float64 regardless.
+    **kwargs
+        Other arguments are passed to the base class.
+    """
+
+    def __init__(self, k_membership, k_models, *, float_dtype=np.float64, **kwargs):
+        self.float_dtype = float_dtype
+        self._fused_arrays = None
+        super().__init__(k_membership, k_models, **kwargs)
+
+    @property
+    def dataframes(self):
+        return self._dataframes
+
+    @dataframes.setter
+    def dataframes(self, x):
+        _BaseLatentClassModel.dataframes.fset(self, x)
+        self._fused_arrays = None
+
+    def mangle(self, *args, **kwargs):
+        self._fused_arrays = None
+        super().mangle(*args, **kwargs)
+
+    def _prepare_fused_arrays(self):
+        """
+        Pack the structure and data of all the constituent models for the kernel.
+        """
+        if self._fused_arrays is not None:
+            return self._fused_arrays
+        dtype = self.float_dtype
+        class_models = [self._k_models[k] for k in self._k_model_names()]
+        class_dataframes = class_models[0].dataframes
+        if class_dataframes.data_ch is None:
+            raise ValueError('latent class model dataframes do not define data_ch')
+        fixed, offsets = pack_fixed_arrays([
+            model_fixed_arrays(m.dataframes, m, dtype=dtype)[0]
+            for m in class_models
+        ])
+        array_ch = np.concatenate([
+            data_ch_cascade(m.dataframes, m.graph, dtype=dtype)
+            for m in class_models
+        ], axis=1)
+        array_av = np.concatenate([
+            data_av_cascade(m.dataframes, m.graph)
+            if m.dataframes.data_av is not None
+            else np.ones([m.dataframes.n_cases, len(m.graph)], dtype=np.int8)
+            for m in class_models
+        ], axis=1)
+        if class_dataframes.data_wt is not None:
+            array_wt = class_dataframes.array_wt().astype(dtype).reshape(-1)
+        else:
+            array_wt = np.ones(class_dataframes.n_cases, dtype=dtype)
+        membership = self._k_membership
+        (
+            membership_co_alt,
+            membership_co_param_scale,
+            membership_co_param,
+            membership_co_data,
+        ) = model_co_slots(membership.dataframes, membership, dtype=np.float64)
+        self._fused_arrays = (
+            membership_co_alt,
+            membership_co_param_scale,
+            membership_co_param,
+            membership_co_data,
+            np.ascontiguousarray(membership.dataframes.array_co(force=True), dtype=np.float64),
+            *fixed,
+            offsets,
+            array_ch,
+            array_av,
+            array_wt,
+            np.ascontiguousarray(class_dataframes.array_co(force=True), dtype=dtype),
+            np.ascontiguousarray(class_dataframes.array_ca(force=True), dtype=dtype),
+        )
+        return self._fused_arrays
+
+    def _fused_loglike(self, x=None, return_bhhh=False):
+        """
+        Run the fused kernel over all cases.
+
+        Returns
+        -------
+        ll : float
+        dll : ndarray
+        bhhh : ndarray or None
+        """
+        self.unmangle()
+        if x is not None:
+            self._k_membership.set_values(x)
+        arrays = self._prepare_fused_arrays()
+        holdfast_arr = self.pf.holdfast.to_numpy().astype(np.int8)
+        parameter_arr = self.pf.value.to_numpy().astype(np.float64)
+        n_cases = arrays[-1].shape[0]
+        n_blocks = max(min(n_cases, numba.get_num_threads() * 4), 1)
+        with np.errstate(divide='ignore', over='ignore', ):
+            ll, dll, bhhh = _latent_class_reduced(
+                *arrays[:-5],
+                holdfast_arr,
+                parameter_arr,
+                *arrays[-5:],
+                bool(return_bhhh),
+                n_blocks,
+            )
+        free = holdfast_arr == 0
+        dll = np.where(free, dll, 0.0)
+        if return_bhhh:
+            bhhh = bhhh * np.outer(free, free)
+        else:
+            bhhh = None
+        return ll[0], dll, bhhh
+
+    @staticmethod
+    def _use_fused(start_case, stop_case, step_case, persist, leave_out, keep_only, subsample):
+        return (
+            start_case == 0 and stop_case == -1 and step_case == 1
+            and (persist & ~persist_flags.PERSIST_BHHH) == 0
+            and leave_out == -1 and keep_only == -1 and subsample == -1
+        )
+
+    def loglike2(
+            self,
+            x=None,
+            *,
+            start_case=0,
+            stop_case=-1,
+            step_case=1,
+            persist=0,
+            leave_out=-1,
+            keep_only=-1,
+            subsample=-1,
+            return_series=True,
+            probability_only=False,
+    ):
+        if probability_only or not self._use_fused(
+                start_case, stop_case, step_case, persist, leave_out, keep_only, subsample,
+        ):
+            return super().loglike2(
+                x=x,
+                start_case=start_case,
+                stop_case=stop_case,
+                step_case=step_case,
+                persist=persist,
+                leave_out=leave_out,
+                keep_only=keep_only,
+                subsample=subsample,
+                return_series=return_series,
+                probability_only=probability_only,
+            )
+        ll, dll, bhhh = self._fused_loglike(x, return_bhhh=bool(persist & persist_flags.PERSIST_BHHH))
+        y = dictx(ll=ll, dll=dll)
+        if bhhh is not None:
+            y.bhhh = bhhh
+        self._check_if_best(y.ll)
+        return y
+
+    loglike2.__doc__ = _BaseLatentClassModel.loglike2.__doc__
+
+    def loglike(
+            self,
+            x=None,
+            *,
+            start_case=0, stop_case=-1, step_case=1,
+            persist=0,
+            leave_out=-1, keep_only=-1, subsample=-1,
+            probability_only=False,
+    ):
+        if probability_only or persist or not self._use_fused(
+                start_case, stop_case, step_case, persist, leave_out, keep_only, subsample,
+        ):
+            return super().loglike(
+                x=x,
+                start_case=start_case,
+                stop_case=stop_case,
+                step_case=step_case,
+                persist=persist,
+                leave_out=leave_out,
+                keep_only=keep_only,
+                subsample=subsample,
+                probability_only=probability_only,
+            )
+        ll = self._fused_loglike(x)[0]
+        self._check_if_best(ll)
+        return ll
+
+    loglike.__doc__ = _BaseLatentClassModel.loglike.__doc__
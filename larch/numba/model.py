@@ -1,6 +1,8 @@
+import numba
 import numpy as np
+from functools import lru_cache
 import pandas as pd
-from numba import guvectorize, njit
+from numba import guvectorize, njit, prange
 from numba import int8 as i8
 from numba import int32 as i32
 from numba import float32 as f32
@@ -9,7 +11,9 @@ from numba import boolean
 from ..model import Model as _BaseModel
 from ..exceptions import MissingDataError
 from ..util import dictx
-from .cascading import data_av_cascade, data_ch_cascade
+from .cascading import data_av_cascade, data_ch_cascade, array_av_cascade, array_ch_cascade
+from .compact import compact_arrays, expand_compact_arrays
+from .idce import ce_arrays, expand_ce_arrays
 
 import warnings
 warnings.warn( ### EXPERIMENTAL ### )
@@ -53,8 +57,9 @@ def utility_from_data_co(
         holdfast_arr,                  # float input shape=[n_params]
         array_av,                      # int8 input shape=[n_alts]
         data_co,                       # float input shape=[n_co_vars]
+        node_param_slot,               # int input shape=[n_nodes, n_params]
         utility_elem,                  # float output shape=[n_alts]
-        dutility_elem,                 # float output shape=[n_alts, n_params]
+        dutility,                      # float output shape=[n_nonzero]
 ):
     for i in range(model_utility_co_alt.shape[0]):
         altindex = model_utility_co_alt[i]
@@ -64,12 +69,12 @@ def utility_from_data_co(
             if model_utility_co_data[i] == -1:
                 utility_elem[altindex] += param_value * model_utility_co_param_scale[i]
                 if not param_holdfast:
-                    dutility_elem[altindex, model_utility_co_param[i]] += model_utility_co_param_scale[i]
+                    dutility[node_param_slot[altindex, model_utility_co_param[i]]] += model_utility_co_param_scale[i]
             else:
                 _temp = data_co[model_utility_co_data[i]] * model_utility_co_param_scale[i]
                 utility_elem[altindex] += _temp * param_value
                 if not param_holdfast:
-                    dutility_elem[altindex, model_utility_co_param[i]] += _temp
+                    dutility[node_param_slot[altindex, model_utility_co_param[i]]] += _temp
 
 
 
@@ -83,8 +88,9 @@ def quantity_from_data_ca(
         holdfast_arr,                   # float input shape=[n_params]
         array_av,                       # int8 input shape=[n_alts]
         array_ca,                       # float input shape=[n_alts, n_ca_vars]
+        node_param_slot,                # int input shape=[n_nodes, n_params]
         utility_elem,                   # float output shape=[n_alts]
-        dutility_elem,                  # float output shape=[n_alts, n_params]
+        dutility,                       # float output shape=[n_nonzero]
 ):
     n_alts = array_ca.shape[0]
 
@@ -118,16 +124,16 @@ def quantity_from_data_ca(
                     )
                     utility_elem[j] += _temp
                     if not holdfast_arr[model_q_ca_param[i]]:
-                        dutility_elem[j, model_q_ca_param[i]] += _temp * scale_param_value
+                        dutility[node_param_slot[j, model_q_ca_param[i]]] += _temp * scale_param_value
 
                 for i in range(model_q_ca_param.shape[0]):
                     if not holdfast_arr[model_q_ca_param[i]]:
-                        dutility_elem[j, model_q_ca_param[i]] /= utility_elem[j]
+                        dutility[node_param_slot[j, model_q_ca_param[i]]] /= utility_elem[j]
 
                 _tempsize = np.log(utility_elem[j])
                 utility_elem[j] = _tempsize * scale_param_value
                 if (model_q_scale_param[0] >= 0) and not scale_param_holdfast:
-                    dutility_elem[j, model_q_scale_param[0]] += _tempsize
+                    dutility[node_param_slot[j, model_q_scale_param[0]]] += _tempsize
 
         else:
             utility_elem[j] = -np.inf
@@ -142,8 +148,9 @@ def utility_from_data_ca(
         holdfast_arr,                   # float input shape=[n_params]
         array_av,                       # int8 input shape=[n_alts]
         array_ca,                       # float input shape=[n_alts, n_ca_vars]
+        node_param_slot,                # int input shape=[n_nodes, n_params]
         utility_elem,                   # float output shape=[n_alts]
-        dutility_elem,                  # float output shape=[n_alts, n_params]
+        dutility,                       # float output shape=[n_nonzero]
 ):
     n_alts = array_ca.shape[0]
     for j in range(n_alts):
@@ -191,7 +198,7 @@ def utility_from_data_ca(
                 _temp *= model_utility_ca_param_scale[i]
                 utility_elem[j] += _temp * parameter_arr[model_utility_ca_param[i]]
                 if not holdfast_arr[model_utility_ca_param[i]]:
-                    dutility_elem[j, model_utility_ca_param[i]] += _temp
+                    dutility[node_param_slot[j, model_utility_ca_param[i]]] += _temp
         else:
             utility_elem[j] = -np.inf
 
@@ -224,6 +231,39 @@ def _type_signatures(sig):
         _type_signature(sig, precision=64),
     ]
 
+
+@njit(cache=True)
+def _bhhh_workspace(edgeslots, n_nodes, n_params):
+    """
+    Scratch arrays for `_numba_utility_to_loglike`, reused across cases.
+
+    Returns
+    -------
+    parent_edge : int32 array, shape [n_nodes]
+        The edge leading into each node, or -1 for the root.
+    d_logprob : float64 array, shape [n_params]
+    touched : int32 array, shape [n_params]
+    touched_mark : int8 array, shape [n_params]
+        All zeros, and `_numba_utility_to_loglike` leaves them so.
+    """
+    parent_edge = np.full(n_nodes, -1, dtype=np.int32)
+    for s in range(edgeslots.shape[0]):
+        parent_edge[edgeslots[s, 1]] = s # FIXME: for CNL, use edge not dn
+    d_logprob = np.zeros(n_params, dtype=np.float64)
+    touched = np.zeros(n_params, dtype=np.int32)
+    touched_mark = np.zeros(n_params, dtype=np.int8)
+    return parent_edge, d_logprob, touched, touched_mark
+
+
+@njit(cache=True)
+def _touch(i, touched, touched_mark, n_touched):
+    if not touched_mark[i]:
+        touched_mark[i] = 1
+        touched[n_touched] = i
+        n_touched += 1
+    return n_touched
+
+
 @njit(error_model='numpy', fastmath=True, cache=True)
 def _numba_utility_to_loglike(
         n_alts,
@@ -231,19 +271,26 @@ def _numba_utility_to_loglike(
         mu_slots,      # int input shape=[nests]
         start_slots,   # int input shape=[nests]
         len_slots,     # int input shape=[nests]
+        node_param_start,  # int input shape=[nodes+1]
+        node_param_index,  # int input shape=[n_nonzero]
+        node_param_slot,   # int input shape=[nodes, n_params]
         holdfast_arr,  # int8 input shape=[n_params]
         parameter_arr, # float input shape=[n_params]
         array_ch,      # float input shape=[nodes]
         array_av,      # int8 input shape=[nodes]
         array_wt,      # float input shape=[]
         return_flags,  #
-        dutility,      #
+        dutility,      # float input shape=[n_nonzero]
         utility,       # float output shape=[nodes]
         logprob,       # float output shape=[nodes]
         probability,   # float output shape=[nodes]
-        bhhh,          # float output shape=[n_params, n_params]
+        bhhh,          # float accumulated shape=[n_params, n_params]
         d_loglike,     # float output shape=[n_params]
         loglike,       # float output shape=[]
+        parent_edge,   # int scratch shape=[nodes], see `_bhhh_workspace`
+        d_logprob,     # float scratch shape=[n_params]
+        touched,       # int scratch shape=[n_params]
+        touched_mark,  # int8 scratch shape=[n_params]
 ):
 
     assert edgeslots.shape[1] == 4
@@ -374,6 +421,8 @@ def _numba_utility_to_loglike(
             d_loglike[:] = 0.0
 
             # d utility
+            # Each node only carries derivatives for the parameters listed
+            # for it in node_param_index, see `model_dutility_slots`.
             for s in range(upslots.size):
                 dn = dnslots[s]
                 up = upslots[s]
@@ -382,85 +431,85 @@ def _numba_utility_to_loglike(
                     if dn >= n_alts:
                         dn_mu_slot = mu_slots[dn-n_alts]
                         if dn_mu_slot >= 0:
-                            dutility[dn, dn_mu_slot] += utility[dn]
-                            dutility[dn, dn_mu_slot] /= parameter_arr[dn_mu_slot]
+                            k = node_param_slot[dn, dn_mu_slot]
+                            dutility[k] += utility[dn]
+                            dutility[k] /= parameter_arr[dn_mu_slot]
                     up_mu_slot = mu_slots[up - n_alts]
                     if up_mu_slot >= 0:
                         # FIXME: alpha slots to appear here if cross-nesting is activated
-                        dutility[up, up_mu_slot] -= cond_prob * (utility[dn])
-                    dutility[up, :] += cond_prob * dutility[dn, :]
-
-            # d probability
-            # scratch = np.zeros_like(parameter_arr)
-            # d_probability = np.zeros_like(dutility)
-            # for s in range(upslots.size-1, -1, -1):
-            #     dn = dnslots[s]
-            #     if array_ch[dn]:
-            #         up = upslots[s]
-            #         scratch[:] = dutility[dn] - dutility[up]
-            #         up_mu_slot = mu_slots[up-n_alts]
-            #         if up_mu_slot < 0:
-            #             mu_up = 1.0
-            #         else:
-            #             mu_up = parameter_arr[up_mu_slot]
-            #         if mu_up:
-            #             if up_mu_slot >= 0:
-            #                 scratch[up_mu_slot] += (utility[up] - utility[dn]) / mu_up
-            #                 # FIXME: alpha slots to appear here if cross-nesting is activated
-            #             multiplier = probability[up] / mu_up
-            #         else:
-            #             multiplier = 0
-            #
-            #         scratch[:] *= multiplier
-            #         scratch[:] += d_probability[up, :]
-            #         d_probability[dn, :] += scratch[:] * conditional_probability[dn] # FIXME: for CNL, use edge not dn
+                        dutility[node_param_slot[up, up_mu_slot]] -= cond_prob * (utility[dn])
+                    for k in range(node_param_start[dn], node_param_start[dn+1]):
+                        dutility[node_param_slot[up, node_param_index[k]]] += cond_prob * dutility[k]
 
-            # d probability alternate path slightly lower memory usage and some faster
-            d_probability = np.zeros_like(dutility)
-            for s in range(upslots.size-1, -1, -1):
+            # d loglike
+            # The derivative of the log of the probability of an alternative
+            # is the sum over the edges on its path from the root of
+            # (d_utility[dn] - d_utility[up]) / mu_up, plus a logsum term for
+            # mu_up.  The cascaded choice on each edge is the total choice of
+            # all alternatives beneath it, so each edge is visited only once.
+            for s in range(upslots.size):
                 dn = dnslots[s]
-                if array_ch[dn]:
+                if array_ch[dn] and array_av[dn]:
                     up = upslots[s]
                     up_mu_slot = mu_slots[up - n_alts]
                     if up_mu_slot < 0:
                         mu_up = 1.0
                     else:
                         mu_up = parameter_arr[up_mu_slot]
-                    for p in range(parameter_arr.size):
-                        if mu_up:
-                            scratch_ = dutility[dn, p] - dutility[up, p]
-                            if p == up_mu_slot:
-                                scratch_ += (utility[up] - utility[dn]) / mu_up
-                                # FIXME: alpha slots to appear here if cross-nesting is activated
-                            scratch_ *= probability[up] / mu_up
-                        else:
-                            scratch_ = 0
-                        scratch_ += d_probability[up, p]
-                        d_probability[dn, p] += scratch_ * conditional_probability[dn] # FIXME: for CNL, use edge not dn
+                    if mu_up:
+                        multiplier = array_ch[dn] * array_wt[0] / mu_up
+                        for k in range(node_param_start[dn], node_param_start[dn+1]):
+                            d_loglike[node_param_index[k]] += dutility[k] * multiplier
+                        for k in range(node_param_start[up], node_param_start[up+1]):
+                            d_loglike[node_param_index[k]] -= dutility[k] * multiplier
+                        if up_mu_slot >= 0:
+                            # FIXME: alpha slots to appear here if cross-nesting is activated
+                            d_loglike[up_mu_slot] += (utility[up] - utility[dn]) / mu_up * multiplier
 
             if return_bhhh:
-                bhhh[:] = 0.0
-
-            # d loglike
-            for a in range(n_alts):
-                this_ch = array_ch[a]
-                if this_ch == 0:
-                    continue
-                total_probability_a = probability[a]
-                # if total_probability_a > 0:
-                #     tempvalue = d_probability[a, :] / total_probability_a
-                #     if return_bhhh:
-                #         bhhh += np.outer(tempvalue,tempvalue) * this_ch * array_wt[0]
-                #     d_loglike += tempvalue * array_wt[0]
-                #
-                if total_probability_a > 0:
-                    if total_probability_a < 1e-250:
-                        total_probability_a = 1e-250
-                    tempvalue = d_probability[a, :] * (this_ch / total_probability_a)
-                    dLL_temp = tempvalue / this_ch
-                    d_loglike += tempvalue * array_wt[0]
-                    if return_bhhh:
-                        bhhh += np.outer(dLL_temp,dLL_temp) * this_ch * array_wt[0]
+                # The casewise BHHH is added into `bhhh`, which the caller
+                # zeroes.  Only the parameters that appear on the path from
+                # the root to a chosen alternative have nonzero derivatives,
+                # so the outer product is taken over those alone.
+                for a in range(n_alts):
+                    this_ch = array_ch[a]
+                    if this_ch == 0 or not array_av[a]:
+                        continue
+                    n_touched = 0
+                    dn = a
+                    s = parent_edge[dn]
+                    while s >= 0:
+                        up = upslots[s]
+                        up_mu_slot = mu_slots[up - n_alts]
+                        if up_mu_slot < 0:
+                            mu_up = 1.0
+                        else:
+                            mu_up = parameter_arr[up_mu_slot]
+                        if mu_up:
+                            for k in range(node_param_start[dn], node_param_start[dn+1]):
+                                i = node_param_index[k]
+                                n_touched = _touch(i, touched, touched_mark, n_touched)
+                                d_logprob[i] += dutility[k] / mu_up
+                            for k in range(node_param_start[up], node_param_start[up+1]):
+                                i = node_param_index[k]
+                                n_touched = _touch(i, touched, touched_mark, n_touched)
+                                d_logprob[i] -= dutility[k] / mu_up
+                            if up_mu_slot >= 0:
+                                n_touched = _touch(up_mu_slot, touched, touched_mark, n_touched)
+                                d_logprob[up_mu_slot] += (utility[up] - utility[dn]) / (mu_up * mu_up)
+                        dn = up
+                        s = parent_edge[dn]
+                    w = this_ch * array_wt[0]
+                    for ti in range(n_touched):
+                        i = touched[ti]
+                        d_i = d_logprob[i] * w
+                        for tj in range(n_touched):
+                            j = touched[tj]
+                            bhhh[i, j] += d_i * d_logprob[j]
+                    for ti in range(n_touched):
+                        i = touched[ti]
+                        d_logprob[i] = 0.0
+                        touched_mark[i] = 0
 
 
 _master_shape_signature = (
@@ -469,6 +518,7 @@ _master_shape_signature = (
     '(uco),(uco),(uco),(uco), '
     '(edges,four), '
     '(nests),(nests),(nests), '
+    '(nodes1),(nnz),(nodes,params), '
     '(params),(params), '
     '(nodes),(nodes),(),(vco),(alts,vca), '
     '(four)->'
@@ -476,7 +526,8 @@ _master_shape_signature = (
 )
 
 
-def _numba_master(
+@njit(error_model='numpy', fastmath=True, cache=True)
+def _numba_master_work(
         model_q_ca_param_scale,  # float input shape=[n_q_ca_features]
         model_q_ca_param,        # int input shape=[n_q_ca_features]
         model_q_ca_data,         # int input shape=[n_q_ca_features]
@@ -501,6 +552,10 @@ def _numba_master(
         start_slots,   # [12] int input shape=[nests]
         len_slots,     # [13] int input shape=[nests]
 
+        node_param_start,  # int input shape=[nodes+1]
+        node_param_index,  # int input shape=[n_nonzero]
+        node_param_slot,   # int input shape=[nodes, n_params]
+
         holdfast_arr,  # [12] int8 input shape=[n_params]
         parameter_arr, # [13] float input shape=[n_params]
 
@@ -519,9 +574,15 @@ def _numba_master(
         utility,       # [23] float output shape=[nodes]
         logprob,       # [24] float output shape=[nodes]
         probability,   # [25] float output shape=[nodes]
-        bhhh,          # [26] float output shape=[n_params, n_params]
+        bhhh,          # [26] float accumulated shape=[n_params, n_params]
         d_loglike,     # [27] float output shape=[n_params]
         loglike,       # [28] float output shape=[]
+
+        dutility,      # float scratch shape=[n_nonzero]
+        parent_edge,   # int scratch shape=[nodes], see `_bhhh_workspace`
+        d_logprob,     # float scratch shape=[n_params]
+        touched,       # int scratch shape=[n_params]
+        touched_mark,  # int8 scratch shape=[n_params]
 ):
     n_alts = array_ca.shape[0]
 
@@ -538,7 +599,7 @@ def _numba_master(
     # return_bhhh = return_flags[3]           # bool input
 
     utility[:] = 0.0
-    dutility = np.zeros((utility.size, parameter_arr.size), dtype=utility.dtype)
+    dutility[:] = 0.0
 
     quantity_from_data_ca(
         model_q_ca_param_scale,  # float input shape=[n_q_ca_features]
@@ -549,8 +610,9 @@ def _numba_master(
         holdfast_arr,            # float input shape=[n_params]
         array_av,                # int8 input shape=[n_nodes]
         array_ca,                # float input shape=[n_alts, n_ca_vars]
+        node_param_slot,         # int input shape=[n_nodes, n_params]
         utility[:n_alts],        # float output shape=[n_alts]
-        dutility[:n_alts],
+        dutility,                # float output shape=[n_nonzero]
     )
 
     if only_utility == 3:
@@ -569,8 +631,9 @@ def _numba_master(
         holdfast_arr,                  # float input shape=[n_params]
         array_av,                      # int8 input shape=[n_nodes]
         array_ca,                      # float input shape=[n_alts, n_ca_vars]
+        node_param_slot,               # int input shape=[n_nodes, n_params]
         utility[:n_alts],              # float output shape=[n_alts]
-        dutility[:n_alts],
+        dutility,                      # float output shape=[n_nonzero]
     )
 
     utility_from_data_co(
@@ -582,8 +645,9 @@ def _numba_master(
         holdfast_arr,                  # float input shape=[n_params]
         array_av,                      # int8 input shape=[n_nodes]
         array_co,                      # float input shape=[n_co_vars]
+        node_param_slot,               # int input shape=[n_nodes, n_params]
         utility[:n_alts],              # float output shape=[n_alts]
-        dutility[:n_alts],
+        dutility,                      # float output shape=[n_nonzero]
     )
 
     if only_utility == 1: return
@@ -594,6 +658,9 @@ def _numba_master(
         mu_slots,       # int input shape=[nests]
         start_slots,    # int input shape=[nests]
         len_slots,      # int input shape=[nests]
+        node_param_start,  # int input shape=[nodes+1]
+        node_param_index,  # int input shape=[n_nonzero]
+        node_param_slot,   # int input shape=[nodes, n_params]
         holdfast_arr,   # int8 input shape=[n_params]
         parameter_arr,  # float input shape=[n_params]
         array_ch,       # float input shape=[nodes]
@@ -607,20 +674,901 @@ def _numba_master(
         bhhh,           # float output shape=[n_params, n_params]
         d_loglike,      # float output shape=[n_params]
         loglike,        # float output shape=[]
+        parent_edge,
+        d_logprob,
+        touched,
+        touched_mark,
     )
 
 
 
-_numba_master_vectorized = guvectorize(
-    _type_signatures("fiii fii ifii I iii bf fbffF b fffFff"),
-    _master_shape_signature,
-    nopython=True,
-    fastmath=True,
-    target='parallel',
-    cache=True,
-)(
-    _numba_master,
-)
+def _numba_master(
+        model_q_ca_param_scale,  # float input shape=[n_q_ca_features]
+        model_q_ca_param,        # int input shape=[n_q_ca_features]
+        model_q_ca_data,         # int input shape=[n_q_ca_features]
+        model_q_scale_param,     # int input scalar
+
+        model_utility_ca_param_scale,  # [0] float input shape=[n_u_ca_features]
+        model_utility_ca_param,        # [1] int input shape=[n_u_ca_features]
+        model_utility_ca_data,         # [2] int input shape=[n_u_ca_features]
+
+        model_utility_co_alt,          # [3] int input shape=[n_co_features]
+        model_utility_co_param_scale,  # [4] float input shape=[n_co_features]
+        model_utility_co_param,        # [5] int input shape=[n_co_features]
+        model_utility_co_data,         # [6] int input shape=[n_co_features]
+
+        edgeslots,     # int input shape=[edges, 4]
+        # upslots,       # [7] int input shape=[edges]
+        # dnslots,       # [8] int input shape=[edges]
+        # visit1,        # [9] int input shape=[edges]
+        # allocslot,     # [10] int input shape=[edges]
+
+        mu_slots,      # [11] int input shape=[nests]
+        start_slots,   # [12] int input shape=[nests]
+        len_slots,     # [13] int input shape=[nests]
+
+        node_param_start,  # int input shape=[nodes+1]
+        node_param_index,  # int input shape=[n_nonzero]
+        node_param_slot,   # int input shape=[nodes, n_params]
+
+        holdfast_arr,  # [12] int8 input shape=[n_params]
+        parameter_arr, # [13] float input shape=[n_params]
+
+        array_ch,      # [14] float input shape=[nodes]
+        array_av,      # [15] int8 input shape=[nodes]
+        array_wt,      # [16] float input shape=[]
+        array_co,      # [17] float input shape=[n_co_vars]
+        array_ca,      # [18] float input shape=[n_alts, n_ca_vars]
+
+        return_flags,
+        # only_utility,        # [19] int8 input
+        # return_probability,  # [20] bool input
+        # return_grad,         # [21] bool input
+        # return_bhhh,         # [22] bool input
+
+        utility,       # [23] float output shape=[nodes]
+        logprob,       # [24] float output shape=[nodes]
+        probability,   # [25] float output shape=[nodes]
+        bhhh,          # [26] float output shape=[n_params, n_params]
+        d_loglike,     # [27] float output shape=[n_params]
+        loglike,       # [28] float output shape=[]
+):
+    dutility = np.zeros(node_param_index.size, dtype=utility.dtype)
+    parent_edge, d_logprob, touched, touched_mark = _bhhh_workspace(
+        edgeslots, utility.size, parameter_arr.size,
+    )
+    if return_flags[3]:
+        bhhh[:] = 0.0
+    _numba_master_work(
+        model_q_ca_param_scale,
+        model_q_ca_param,
+        model_q_ca_data,
+        model_q_scale_param,
+        model_utility_ca_param_scale,
+        model_utility_ca_param,
+        model_utility_ca_data,
+        model_utility_co_alt,
+        model_utility_co_param_scale,
+        model_utility_co_param,
+        model_utility_co_data,
+        edgeslots,
+        mu_slots,
+        start_slots,
+        len_slots,
+        node_param_start,
+        node_param_index,
+        node_param_slot,
+        holdfast_arr,
+        parameter_arr,
+        array_ch,
+        array_av,
+        array_wt,
+        array_co,
+        array_ca,
+        return_flags,
+        utility,
+        logprob,
+        probability,
+        bhhh,
+        d_loglike,
+        loglike,
+        dutility,
+        parent_edge,
+        d_logprob,
+        touched,
+        touched_mark,
+    )
+
+
+@lru_cache(maxsize=None)
+def _numba_master_vectorized():
+    """
+    The casewise gufunc version of `_numba_master`.
+
+    Building a parallel gufunc compiles, or loads from numba's cache, all
+    its signatures, which takes several seconds, so this is deferred until
+    casewise results are first needed.  See `larch.numba.warmup`.
+    """
+    return guvectorize(
+        _type_signatures("fiii fii ifii I iii iiI bf fbffF b fffFff"),
+        _master_shape_signature,
+        nopython=True,
+        fastmath=True,
+        target='parallel',
+        cache=True,
+    )(
+        _numba_master,
+    )
+
+
+@njit(error_model='numpy', fastmath=True, cache=True)
+def _case_scratch(fixed, n_nodes, n_params, dtype_like):
+    """
+    The per-block scratch arrays for evaluating the loglike of one case.
+
+    The utility arrays take the dtype of `dtype_like`, while the loglike
+    and gradient of the case are always float64.
+    """
+    parent_edge, d_logprob, touched, touched_mark = _bhhh_workspace(
+        fixed.edge_slots, n_nodes, n_params,
+    )
+    return CaseScratch(
+        np.zeros(n_nodes, dtype=dtype_like.dtype),
+        np.zeros(n_nodes, dtype=dtype_like.dtype),
+        np.zeros(n_nodes, dtype=dtype_like.dtype),
+        np.zeros(fixed.node_param_index.size, dtype=dtype_like.dtype),
+        parent_edge,
+        d_logprob,
+        touched,
+        touched_mark,
+        np.zeros(n_params, dtype=np.float64),
+        np.zeros(1, dtype=np.float64),
+    )
+
+
+@njit(error_model='numpy', fastmath=True, cache=True)
+def _add_case(case, return_flags, loglike, d_loglike):
+    """
+    Add the loglike and gradient of one case to a block's partial sums.
+    """
+    loglike[0] += case.loglike[0]
+    if return_flags[2] or return_flags[3]:
+        for p in range(d_loglike.size):
+            d_loglike[p] += case.d_loglike[p]
+
+
+@njit(error_model='numpy', fastmath=True, cache=True)
+def _master_case(fixed, holdfast_arr, parameter_arr, data, c, array_ca, return_flags, case, bhhh):
+    """
+    Evaluate `_numba_master_work` for case `c` of `data`, into `case` and `bhhh`.
+    """
+    _numba_master_work(
+        fixed.qca_scale,
+        fixed.qca_param_slot,
+        fixed.qca_data_slot,
+        fixed.qscale_param_slot,
+        fixed.uca_scale,
+        fixed.uca_param_slot,
+        fixed.uca_data_slot,
+        fixed.uco_alt_slot,
+        fixed.uco_scale,
+        fixed.uco_param_slot,
+        fixed.uco_data_slot,
+        fixed.edge_slots,
+        fixed.mu_slot,
+        fixed.start_edges,
+        fixed.len_edges,
+        fixed.node_param_start,
+        fixed.node_param_index,
+        fixed.node_param_slot,
+        holdfast_arr,
+        parameter_arr,
+        data.ch[c],
+        data.av[c],
+        data.wt[c:c+1],
+        data.co[c],
+        array_ca,
+        return_flags,
+        case.utility,
+        case.logprob,
+        case.probability,
+        bhhh,
+        case.d_loglike,
+        case.loglike,
+        case.dutility,
+        case.parent_edge,
+        case.d_logprob,
+        case.touched,
+        case.touched_mark,
+    )
+
+
+@njit(error_model='numpy', fastmath=True, cache=True)
+def _elemental_case(fixed, holdfast_arr, parameter_arr, data, c, case):
+    """
+    Compute the utilities of the elemental alternatives of case `c`, and their derivatives.
+    """
+    n_alts = data.ca.shape[1]
+    case.utility[:] = 0.0
+    case.dutility[:] = 0.0
+    quantity_from_data_ca(
+        fixed.qca_scale,
+        fixed.qca_param_slot,
+        fixed.qca_data_slot,
+        fixed.qscale_param_slot,
+        parameter_arr,
+        holdfast_arr,
+        data.av[c],
+        data.ca[c],
+        fixed.node_param_slot,
+        case.utility[:n_alts],
+        case.dutility,
+    )
+    utility_from_data_ca(
+        fixed.uca_scale,
+        fixed.uca_param_slot,
+        fixed.uca_data_slot,
+        parameter_arr,
+        holdfast_arr,
+        data.av[c],
+        data.ca[c],
+        fixed.node_param_slot,
+        case.utility[:n_alts],
+        case.dutility,
+    )
+    utility_from_data_co(
+        fixed.uco_alt_slot,
+        fixed.uco_scale,
+        fixed.uco_param_slot,
+        fixed.uco_data_slot,
+        parameter_arr,
+        holdfast_arr,
+        data.av[c],
+        data.co[c],
+        fixed.node_param_slot,
+        case.utility[:n_alts],
+        case.dutility,
+    )
+
+
+@njit(error_model='numpy', fastmath=True, cache=True)
+def _nested_case(fixed, holdfast_arr, parameter_arr, data, c, return_flags, case, bhhh):
+    """
+    Evaluate the loglike of case `c` from the elemental utilities already in `case`.
+    """
+    _numba_utility_to_loglike(
+        data.ca.shape[1],
+        fixed.edge_slots,
+        fixed.mu_slot,
+        fixed.start_edges,
+        fixed.len_edges,
+        fixed.node_param_start,
+        fixed.node_param_index,
+        fixed.node_param_slot,
+        holdfast_arr,
+        parameter_arr,
+        data.ch[c],
+        data.av[c],
+        data.wt[c:c+1],
+        return_flags,
+        case.dutility,
+        case.utility,
+        case.logprob,
+        case.probability,
+        bhhh,
+        case.d_loglike,
+        case.loglike,
+        case.parent_edge,
+        case.d_logprob,
+        case.touched,
+        case.touched_mark,
+    )
+
+
+@njit(inline='always')
+def _reduce_blocks(
+        case_work,      # function evaluating one case, see below
+        workspace,      # function allocating the scratch for one block
+        fixed,          # FixedArrays
+        holdfast_arr,   # int8 input shape=[n_params]
+        parameters,     # float input shape=[n_points, n_params]
+        data,           # DataArrays, with arrays shaped [n_cases, ...]
+        extra,          # tuple of kernel specific inputs
+        return_flags,   # int8 input shape=[4]
+        n_blocks,       # int input scalar
+        n_hessian,      # int input scalar, n_params or 0
+):
+    """
+    Evaluate a per-case work function on all cases and sum the results.
+
+    Cases are split into `n_blocks` contiguous blocks that are processed
+    in parallel.  Each block allocates its scratch arrays once, by calling
+    `workspace(fixed, data, extra, n_params)`, and then for each of its
+    cases calls
+
+        case_work(
+            c, fixed, holdfast_arr, parameters, data, extra, return_flags,
+            scratch, loglike, d_loglike, bhhh, hessian,
+        )
+
+    which adds that case's results to the block's own float64 partial
+    sums, of shapes [n_points], [n_points, n_params], [n_bhhh, n_bhhh]
+    and [n_hessian, n_hessian].  The partial sums are added up only after
+    all blocks are done, so no casewise output arrays are allocated, and
+    the totals do not depend on thread scheduling.
+
+    This is inlined into each reduced kernel, so that the kernels can be
+    cached by numba.
+
+    Returns
+    -------
+    loglike : float64 array, shape [n_points]
+    d_loglike : float64 array, shape [n_points, n_params]
+    bhhh : float64 array, shape [n_params, n_params]
+        Zeros unless `return_flags` requests the BHHH matrix.
+    d2_loglike : float64 array, shape [n_hessian, n_hessian]
+    """
+    n_cases = data.av.shape[0]
+    n_points = parameters.shape[0]
+    n_params = parameters.shape[1]
+    n_bhhh = n_params if return_flags[3] else 0
+
+    block_size = (n_cases + n_blocks - 1) // n_blocks
+    partial_ll = np.zeros((n_blocks, n_points), dtype=np.float64)
+    partial_dll = np.zeros((n_blocks, n_points, n_params), dtype=np.float64)
+    partial_bhhh = np.zeros((n_blocks, n_bhhh, n_bhhh), dtype=np.float64)
+    partial_hessian = np.zeros((n_blocks, n_hessian, n_hessian), dtype=np.float64)
+
+    for b in prange(n_blocks):
+        scratch = workspace(fixed, data, extra, n_params)
+        for c in range(b * block_size, min((b + 1) * block_size, n_cases)):
+            case_work(
+                c, fixed, holdfast_arr, parameters, data, extra, return_flags,
+                scratch, partial_ll[b], partial_dll[b], partial_bhhh[b], partial_hessian[b],
+            )
+
+    loglike_total = np.zeros(n_points, dtype=np.float64)
+    d_loglike_total = np.zeros((n_points, n_params), dtype=np.float64)
+    bhhh_total = np.zeros((n_params, n_params), dtype=np.float64)
+    hessian_total = np.zeros((n_hessian, n_hessian), dtype=np.float64)
+    for b in range(n_blocks):
+        loglike_total[:] += partial_ll[b]
+        d_loglike_total[:, :] += partial_dll[b]
+        bhhh_total[:n_bhhh, :n_bhhh] += partial_bhhh[b]
+        hessian_total[:, :] += partial_hessian[b]
+    return loglike_total, d_loglike_total, bhhh_total, hessian_total
+
+
+@njit(error_model='numpy', fastmath=True, cache=True)
+def _master_workspace(fixed, data, extra, n_params):
+    return _case_scratch(fixed, data.av.shape[1], n_params, data.ca)
+
+
+@njit(error_model='numpy', fastmath=True, cache=True)
+def _master_case_work(
+        c, fixed, holdfast_arr, parameters, data, extra, return_flags,
+        case, loglike, d_loglike, bhhh, hessian,
+):
+    for j in range(parameters.shape[0]):
+        _master_case(fixed, holdfast_arr, parameters[j], data, c, data.ca[c], return_flags, case, bhhh)
+        _add_case(case, return_flags, loglike[j:j+1], d_loglike[j])
+
+
+@njit(error_model='numpy', fastmath=True, cache=True, parallel=True, nogil=True)
+def _numba_master_reduced(
+        fixed,         # FixedArrays
+        holdfast_arr,  # int8 input shape=[n_params]
+        parameter_arr, # float input shape=[n_params]
+        data,          # DataArrays, with arrays shaped [n_cases, ...]
+        return_flags,  # int8 input shape=[4]
+        n_blocks,      # int input scalar
+):
+    """
+    Evaluate the loglike kernel and sum the results across cases.
+
+    Cases are split into `n_blocks` contiguous blocks that are processed
+    in parallel, and each block accumulates its own partial sums of the
+    loglike, gradient and BHHH matrix in float64, see `_reduce_blocks`.
+    No casewise output arrays are allocated, so memory use does not grow
+    with the number of cases.
+
+    The data arrays and per-case utilities may be float32, but the
+    loglike, gradient and BHHH for each case are always computed and
+    accumulated in float64, and `parameter_arr` should be float64.
+
+    Returns
+    -------
+    loglike : float64 array, shape [1]
+    d_loglike : float64 array, shape [n_params]
+    bhhh : float64 array, shape [n_params, n_params]
+        Zeros unless `return_flags` requests the BHHH matrix.
+    """
+    loglike, d_loglike, bhhh, _ = _reduce_blocks(
+        _master_case_work, _master_workspace,
+        fixed, holdfast_arr, parameter_arr.reshape((1, parameter_arr.size)), data, (),
+        return_flags, n_blocks, 0,
+    )
+    return loglike, d_loglike[0], bhhh
+
+
+@njit(error_model='numpy', fastmath=True, cache=True)
+def _ce_workspace(fixed, data, extra, n_params):
+    ce_rows, ce_altindex, ce_case_start, n_alts = extra
+    return (
+        _case_scratch(fixed, data.av.shape[1], n_params, ce_rows),
+        np.zeros((n_alts, ce_rows.shape[1]), dtype=ce_rows.dtype),
+    )
+
+
+@njit(error_model='numpy', fastmath=True, cache=True)
+def _ce_case_work(
+        c, fixed, holdfast_arr, parameters, data, extra, return_flags,
+        scratch, loglike, d_loglike, bhhh, hessian,
+):
+    ce_rows, ce_altindex, ce_case_start, n_alts = extra
+    case, array_ca = scratch
+    for r in range(ce_case_start[c], ce_case_start[c+1]):
+        array_ca[ce_altindex[r], :] = ce_rows[r]
+    _master_case(fixed, holdfast_arr, parameters[0], data, c, array_ca, return_flags, case, bhhh)
+    for r in range(ce_case_start[c], ce_case_start[c+1]):
+        array_ca[ce_altindex[r], :] = 0
+    _add_case(case, return_flags, loglike, d_loglike[0])
+
+
+@njit(error_model='numpy', fastmath=True, cache=True, parallel=True, nogil=True)
+def _numba_master_reduced_ce(
+        fixed,         # FixedArrays
+        holdfast_arr,  # int8 input shape=[n_params]
+        parameter_arr, # float input shape=[n_params]
+        data,          # DataArrays, with arrays shaped [n_cases, ...], ca unused
+        ce_rows,       # float input shape=[n_rows, n_ca_vars]
+        ce_altindex,   # int input shape=[n_rows]
+        ce_case_start, # int input shape=[n_cases+1]
+        n_alts,        # int input scalar
+        return_flags,  # int8 input shape=[4]
+        n_blocks,      # int input scalar
+):
+    """
+    Evaluate the loglike kernel on idce data and sum the results across cases.
+
+    This is `_numba_master_reduced`, except that the idca data is given
+    only for the rows of `data_ce`, which are the available alternatives
+    of each case.  The rows of case `c` are `ce_rows[ce_case_start[c]:
+    ce_case_start[c+1]]`, and are copied into a per-block scratch array
+    of shape [n_alts, n_ca_vars] just before the case is evaluated, and
+    zeroed again after.  Alternatives without a row are never touched,
+    so they cost neither memory nor computation.
+
+    Returns
+    -------
+    loglike : float64 array, shape [1]
+    d_loglike : float64 array, shape [n_params]
+    bhhh : float64 array, shape [n_params, n_params]
+        Zeros unless `return_flags` requests the BHHH matrix.
+    """
+    loglike, d_loglike, bhhh, _ = _reduce_blocks(
+        _ce_case_work, _ce_workspace,
+        fixed, holdfast_arr, parameter_arr.reshape((1, parameter_arr.size)), data,
+        (ce_rows, ce_altindex, ce_case_start, n_alts),
+        return_flags, n_blocks, 0,
+    )
+    return loglike, d_loglike[0], bhhh
+
+
+@njit(error_model='numpy', fastmath=True, cache=True)
+def _cached_case_work(
+        c, fixed, holdfast_arr, parameters, data, extra, return_flags,
+        case, loglike, d_loglike, bhhh, hessian,
+):
+    elemental_utility, elemental_dutility, refresh = extra
+    n_alts = elemental_utility.shape[1]
+    n_elemental_nonzero = elemental_dutility.shape[1]
+    if refresh:
+        _elemental_case(fixed, holdfast_arr, parameters[0], data, c, case)
+        elemental_utility[c, :] = case.utility[:n_alts]
+        elemental_dutility[c, :] = case.dutility[:n_elemental_nonzero]
+    else:
+        case.utility[:] = 0.0
+        case.dutility[:] = 0.0
+        case.utility[:n_alts] = elemental_utility[c]
+        case.dutility[:n_elemental_nonzero] = elemental_dutility[c]
+    _nested_case(fixed, holdfast_arr, parameters[0], data, c, return_flags, case, bhhh)
+    _add_case(case, return_flags, loglike, d_loglike[0])
+
+
+@njit(error_model='numpy', fastmath=True, cache=True, parallel=True, nogil=True)
+def _numba_master_reduced_cached(
+        fixed,         # FixedArrays
+        holdfast_arr,  # int8 input shape=[n_params]
+        parameter_arr, # float input shape=[n_params]
+        data,          # DataArrays, with arrays shaped [n_cases, ...]
+        return_flags,  # int8 input shape=[4]
+        n_blocks,      # int input scalar
+
+        elemental_utility,   # float in/out shape=[n_cases, n_alts]
+        elemental_dutility,  # float in/out shape=[n_cases, n_elemental_nonzero]
+        refresh,             # bool input scalar
+):
+    """
+    Evaluate the loglike kernel like `_numba_master_reduced`, reusing elemental utilities.
+
+    The utilities of the elemental alternatives, and their derivatives,
+    depend only on the data and on the parameters of the utility and
+    quantity functions.  When `refresh` is true they are computed from
+    the data and stored in `elemental_utility` and `elemental_dutility`,
+    otherwise the stored values are used and only the nesting structure
+    is evaluated, which is all that is needed when only logsum parameters
+    have changed.
+    """
+    loglike, d_loglike, bhhh, _ = _reduce_blocks(
+        _cached_case_work, _master_workspace,
+        fixed, holdfast_arr, parameter_arr.reshape((1, parameter_arr.size)), data,
+        (elemental_utility, elemental_dutility, refresh),
+        return_flags, n_blocks, 0,
+    )
+    return loglike, d_loglike[0], bhhh
+
+
+@njit(error_model='numpy', fastmath=True, cache=True, parallel=True, nogil=True)
+def _numba_master_reduced_multi(
+        fixed,         # FixedArrays
+        holdfast_arr,  # int8 input shape=[n_params]
+        parameter_arr, # float input shape=[n_points, n_params]
+        data,          # DataArrays, with arrays shaped [n_cases, ...]
+        return_flags,  # int8 input shape=[4]
+        n_blocks,      # int input scalar
+):
+    """
+    Evaluate the loglike kernel at several parameter vectors in one pass.
+
+    This is `_numba_master_reduced` with a matrix of parameter vectors,
+    one per row.  Each case is evaluated at every row in turn while its
+    data is in cache, so the data arrays are read only once for all the
+    points.  The BHHH matrix is never computed.
+
+    Returns
+    -------
+    loglike : float64 array, shape [n_points]
+    d_loglike : float64 array, shape [n_points, n_params]
+        Zeros unless `return_flags` requests the gradient.
+    """
+    flags = return_flags.copy()
+    flags[3] = 0
+    loglike, d_loglike, _, _ = _reduce_blocks(
+        _master_case_work, _master_workspace,
+        fixed, holdfast_arr, parameter_arr, data, (),
+        flags, n_blocks, 0,
+    )
+    return loglike, d_loglike
+
+
+@njit(error_model='numpy', fastmath=True, cache=True)
+def quantity_d2_from_data_ca(
+        model_q_ca_param_scale,  # float input shape=[n_q_ca_features]
+        model_q_ca_param,        # int input shape=[n_q_ca_features]
+        model_q_ca_data,         # int input shape=[n_q_ca_features]
+        model_q_scale_param,     # int input shape=[1]
+        parameter_arr,           # float input shape=[n_params]
+        holdfast_arr,            # int8 input shape=[n_params]
+        array_av,                # int8 input shape=[n_alts]
+        array_ca,                # float input shape=[n_alts, n_ca_vars]
+        node_param_start,        # int input shape=[nodes+1]
+        node_param_slot,         # int input shape=[nodes, n_params]
+        d2_start,                # int input shape=[nodes+1]
+        d2utility,               # float output shape=[n_d2]
+        work,                    # float work shape=[max node params]
+):
+    """
+    Second derivatives of the quantity term of each elemental utility.
+
+    The quantity term is theta * log(Q) with Q = sum_i x_i * exp(beta_i),
+    so with w_p the share of Q attributable to parameter p, the second
+    derivative is theta * (w_p * I - w w') in the beta parameters and
+    w_p in the cross terms with theta.  All other utility terms are
+    linear in the parameters.
+    """
+    if model_q_ca_param.shape[0] == 0:
+        return
+    if model_q_scale_param[0] >= 0:
+        scale_param_value = parameter_arr[model_q_scale_param[0]]
+        scale_param_holdfast = holdfast_arr[model_q_scale_param[0]]
+    else:
+        scale_param_value = 1.0
+        scale_param_holdfast = 1
+    for j in range(array_ca.shape[0]):
+        if not array_av[j]:
+            continue
+        base = node_param_start[j]
+        k_j = node_param_start[j+1] - base
+        w = work[:k_j]
+        w[:] = 0.0
+        total = 0.0
+        for i in range(model_q_ca_param.shape[0]):
+            _temp = (
+                array_ca[j, model_q_ca_data[i]]
+                * model_q_ca_param_scale[i]
+                * np.exp(parameter_arr[model_q_ca_param[i]])
+            )
+            total += _temp
+            if not holdfast_arr[model_q_ca_param[i]]:
+                w[node_param_slot[j, model_q_ca_param[i]] - base] += _temp
+        if total <= 0:
+            continue
+        block = d2utility[d2_start[j]:d2_start[j+1]].reshape((k_j, k_j))
+        for a in range(k_j):
+            w[a] /= total
+        for a in range(k_j):
+            if w[a]:
+                block[a, a] += scale_param_value * w[a]
+                for b in range(k_j):
+                    block[a, b] -= scale_param_value * w[a] * w[b]
+        if (model_q_scale_param[0] >= 0) and not scale_param_holdfast:
+            t = node_param_slot[j, model_q_scale_param[0]] - base
+            for a in range(k_j):
+                block[t, a] += w[a]
+                block[a, t] += w[a]
+
+
+@njit(error_model='numpy', fastmath=True, cache=True)
+def _numba_d2_loglike(
+        n_alts,
+        edgeslots,         # int input shape=[edges, 4]
+        mu_slots,          # int input shape=[nests]
+        node_param_start,  # int input shape=[nodes+1]
+        node_param_index,  # int input shape=[n_nonzero]
+        node_param_slot,   # int input shape=[nodes, n_params]
+        d2_start,          # int input shape=[nodes+1]
+        parameter_arr,     # float input shape=[n_params]
+        array_ch,          # float input shape=[nodes]
+        array_av,          # int8 input shape=[nodes]
+        array_wt,          # float input shape=[]
+        utility,           # float input shape=[nodes]
+        conditional_probability,  # float input shape=[nodes]
+        dutility,          # float input shape=[n_nonzero]
+        d2utility,         # float input/output shape=[n_d2]
+        dz,                # float work shape=[max node params + 1]
+        loc,               # int work shape=[max node params + 1]
+        hessian,           # float output shape=[n_params, n_params]
+):
+    """
+    Add the second derivative of the log likelihood of one case to `hessian`.
+
+    The second derivatives of utility are carried for each node in a dense
+    block over the parameters listed for that node in `node_param_index`,
+    stored at `d2utility[d2_start[n]:d2_start[n+1]]`.  On entry these hold
+    only the elemental (quantity) terms.  Each nest has utility
+    U = mu * L, where L = log(sum(exp(U_k / mu))) over its children, and
+    the blocks are propagated up the tree using
+
+        d2U = dmu dL' + dL dmu' + mu * (sum(p_k d2z_k) + sum(p_k dz_k dz_k') - dL dL')
+
+    with z_k = U_k / mu.  The log likelihood is the sum over edges of the
+    cascaded choice times (U_dn - U_up) / mu_up, the same sum used for the
+    gradient, and each chosen edge adds the second derivative of that term.
+    """
+    upslots = edgeslots[:, 0]
+    dnslots = edgeslots[:, 1]
+    n_nodes = utility.size
+
+    # logsum terms for each nest, which depend only on the nest itself
+    for up in range(n_alts, n_nodes):
+        if not array_av[up]:
+            continue
+        up_mu_slot = mu_slots[up - n_alts]
+        if up_mu_slot < 0:
+            mu_up = 1.0
+        else:
+            mu_up = parameter_arr[up_mu_slot]
+        if not mu_up:
+            continue
+        base_up = node_param_start[up]
+        k_up = node_param_start[up+1] - base_up
+        block_up = d2utility[d2_start[up]:d2_start[up+1]].reshape((k_up, k_up))
+        # dz holds the gradient of the logsum L = U / mu here
+        for a in range(k_up):
+            dz[a] = dutility[base_up+a] / mu_up
+        if up_mu_slot >= 0:
+            m = node_param_slot[up, up_mu_slot] - base_up
+            dz[m] -= utility[up] / (mu_up * mu_up)
+            for a in range(k_up):
+                block_up[m, a] += dz[a]
+                block_up[a, m] += dz[a]
+        for a in range(k_up):
+            for b in range(k_up):
+                block_up[a, b] -= mu_up * dz[a] * dz[b]
+
+    # children terms, propagated bottom-up
+    for s in range(upslots.size):
+        dn = dnslots[s]
+        if not array_av[dn]:
+            continue
+        up = upslots[s]
+        up_mu_slot = mu_slots[up - n_alts]
+        if up_mu_slot < 0:
+            mu_up = 1.0
+        else:
+            mu_up = parameter_arr[up_mu_slot]
+        if not mu_up:
+            continue
+        p = conditional_probability[dn]
+        base_up = node_param_start[up]
+        k_up = node_param_start[up+1] - base_up
+        block_up = d2utility[d2_start[up]:d2_start[up+1]].reshape((k_up, k_up))
+        base_dn = node_param_start[dn]
+        k_dn = node_param_start[dn+1] - base_dn
+        block_dn = d2utility[d2_start[dn]:d2_start[dn+1]].reshape((k_dn, k_dn))
+        z = utility[dn] / mu_up
+        for a in range(k_dn):
+            loc[a] = node_param_slot[up, node_param_index[base_dn+a]] - base_up
+            dz[a] = dutility[base_dn+a] / mu_up
+        n_touch = k_dn
+        for a in range(k_dn):
+            for b in range(k_dn):
+                block_up[loc[a], loc[b]] += p * block_dn[a, b]
+        if up_mu_slot >= 0:
+            m = node_param_slot[up, up_mu_slot] - base_up
+            for a in range(k_dn):
+                v = p * dutility[base_dn+a] / mu_up
+                block_up[loc[a], m] -= v
+                block_up[m, loc[a]] -= v
+            block_up[m, m] += 2 * p * z / mu_up
+            m_dn = node_param_slot[dn, up_mu_slot]
+            if m_dn >= 0:
+                dz[m_dn - base_dn] -= z / mu_up
+            else:
+                loc[k_dn] = m
+                dz[k_dn] = -z / mu_up
+                n_touch += 1
+        for a in range(n_touch):
+            for b in range(n_touch):
+                block_up[loc[a], loc[b]] += mu_up * p * dz[a] * dz[b]
+
+    # log likelihood
+    for s in range(upslots.size):
+        dn = dnslots[s]
+        if not (array_ch[dn] and array_av[dn]):
+            continue
+        up = upslots[s]
+        up_mu_slot = mu_slots[up - n_alts]
+        if up_mu_slot < 0:
+            mu_up = 1.0
+        else:
+            mu_up = parameter_arr[up_mu_slot]
+        if not mu_up:
+            continue
+        multiplier = array_ch[dn] * array_wt[0] / mu_up
+        base_up = node_param_start[up]
+        k_up = node_param_start[up+1] - base_up
+        block_up = d2utility[d2_start[up]:d2_start[up+1]].reshape((k_up, k_up))
+        base_dn = node_param_start[dn]
+        k_dn = node_param_start[dn+1] - base_dn
+        block_dn = d2utility[d2_start[dn]:d2_start[dn+1]].reshape((k_dn, k_dn))
+        for a in range(k_dn):
+            pa = node_param_index[base_dn+a]
+            for b in range(k_dn):
+                hessian[pa, node_param_index[base_dn+b]] += block_dn[a, b] * multiplier
+        for a in range(k_up):
+            pa = node_param_index[base_up+a]
+            for b in range(k_up):
+                hessian[pa, node_param_index[base_up+b]] -= block_up[a, b] * multiplier
+        if up_mu_slot >= 0:
+            for a in range(k_dn):
+                v = dutility[base_dn+a] * multiplier / mu_up
+                hessian[node_param_index[base_dn+a], up_mu_slot] -= v
+                hessian[up_mu_slot, node_param_index[base_dn+a]] -= v
+            for a in range(k_up):
+                v = dutility[base_up+a] * multiplier / mu_up
+                hessian[node_param_index[base_up+a], up_mu_slot] += v
+                hessian[up_mu_slot, node_param_index[base_up+a]] += v
+            hessian[up_mu_slot, up_mu_slot] += (
+                2 * (utility[dn] - utility[up]) * multiplier / (mu_up * mu_up)
+            )
+
+
+@njit(error_model='numpy', fastmath=True, cache=True)
+def _hessian_workspace(fixed, data, extra, n_params):
+    d2_start, max_k = extra
+    return (
+        _case_scratch(fixed, data.av.shape[1], n_params, data.ca),
+        np.zeros(d2_start[-1], dtype=np.float64),
+        np.zeros(max_k + 1, dtype=np.float64),
+        np.zeros(max_k + 1, dtype=np.int32),
+    )
+
+
+@njit(error_model='numpy', fastmath=True, cache=True)
+def _hessian_case_work(
+        c, fixed, holdfast_arr, parameters, data, extra, return_flags,
+        scratch, loglike, d_loglike, bhhh, hessian,
+):
+    d2_start, max_k = extra
+    case, d2utility, dz, loc = scratch
+    parameter_arr = parameters[0]
+    d2utility[:] = 0.0
+    _elemental_case(fixed, holdfast_arr, parameter_arr, data, c, case)
+    _nested_case(fixed, holdfast_arr, parameter_arr, data, c, return_flags, case, bhhh)
+    quantity_d2_from_data_ca(
+        fixed.qca_scale,
+        fixed.qca_param_slot,
+        fixed.qca_data_slot,
+        fixed.qscale_param_slot,
+        parameter_arr,
+        holdfast_arr,
+        data.av[c],
+        data.ca[c],
+        fixed.node_param_start,
+        fixed.node_param_slot,
+        d2_start,
+        d2utility,
+        dz,
+    )
+    _numba_d2_loglike(
+        data.ca.shape[1],
+        fixed.edge_slots,
+        fixed.mu_slot,
+        fixed.node_param_start,
+        fixed.node_param_index,
+        fixed.node_param_slot,
+        d2_start,
+        parameter_arr,
+        data.ch[c],
+        data.av[c],
+        data.wt[c:c+1],
+        case.utility,
+        case.logprob,  # holds the conditional probability after the loglike kernel
+        case.dutility,
+        d2utility,
+        dz,
+        loc,
+        hessian,
+    )
+    _add_case(case, return_flags, loglike, d_loglike[0])
+
+
+@njit(error_model='numpy', fastmath=True, cache=True, parallel=True, nogil=True)
+def _numba_hessian_reduced(
+        fixed,         # FixedArrays
+        holdfast_arr,  # int8 input shape=[n_params]
+        parameter_arr, # float input shape=[n_params]
+        data,          # DataArrays, with arrays shaped [n_cases, ...]
+        return_flags,  # int8 input shape=[4]
+        n_blocks,      # int input scalar
+):
+    """
+    Evaluate the loglike kernel with its exact second derivative, summed across cases.
+
+    This works like `_numba_master_reduced`, and additionally returns the
+    analytic Hessian of the log likelihood.  The gradient is always
+    computed, and the BHHH matrix only if `return_flags` requests it.
+
+    Returns
+    -------
+    loglike : float64 array, shape [1]
+    d_loglike : float64 array, shape [n_params]
+    bhhh : float64 array, shape [n_params, n_params]
+    d2_loglike : float64 array, shape [n_params, n_params]
+    """
+    n_nodes = data.av.shape[1]
+    flags = return_flags.copy()
+    flags[0] = 0
+    flags[1] = 0
+    flags[2] = 1
+
+    d2_start = np.zeros(n_nodes + 1, dtype=np.int64)
+    max_k = 0
+    for n in range(n_nodes):
+        k_n = fixed.node_param_start[n+1] - fixed.node_param_start[n]
+        d2_start[n+1] = d2_start[n] + k_n * k_n
+        if k_n > max_k:
+            max_k = k_n
+
+    loglike, d_loglike, bhhh, hessian = _reduce_blocks(
+        _hessian_case_work, _hessian_workspace,
+        fixed, holdfast_arr, parameter_arr.reshape((1, parameter_arr.size)), data,
+        (d2_start, max_k),
+        flags, n_blocks, parameter_arr.size,
+    )
+    return loglike, d_loglike[0], bhhh, hessian
 
 
 @njit(cache=True)
@@ -715,18 +1663,23 @@ def _numba_penalty(
     bhhh[:] += np.outer(d_penalty, d_penalty)
 
 
-_numba_penalty_vectorized = guvectorize(
-    _type_signatures("fffffFff"),
-    (
-        '(params),(params),(params),(),()->(params,params),(params),()'
-    ),
-    nopython=True,
-    fastmath=True,
-    target='parallel',
-    cache=True,
-)(
-    _numba_penalty,
-)
+@lru_cache(maxsize=None)
+def _numba_penalty_vectorized():
+    """
+    The casewise gufunc version of `_numba_penalty`, built on first use.
+    """
+    return guvectorize(
+        _type_signatures("fffffFff"),
+        (
+            '(params),(params),(params),(),()->(params,params),(params),()'
+        ),
+        nopython=True,
+        fastmath=True,
+        target='parallel',
+        cache=True,
+    )(
+        _numba_penalty,
+    )
 
 
 
@@ -790,7 +1743,9 @@ def model_q_ca_slots(dataframes, model, dtype=np.float64):
     model_q_ca_param = np.zeros([len_model_q_ca], dtype=np.int32)
     model_q_ca_data = np.zeros([len_model_q_ca], dtype=np.int32)
     if model.quantity_scale:
-        model_q_scale_param = model._frame.index.get_loc(str(model.quantity_scale))
+        model_q_scale_param = np.asarray(
+            [model._frame.index.get_loc(str(model.quantity_scale))], dtype=np.int32,
+        )
     else:
         model_q_scale_param = np.zeros([1], dtype=np.int32)-1
     for n, i in enumerate(model.quantity_ca):
@@ -805,12 +1760,109 @@ def model_q_ca_slots(dataframes, model, dtype=np.float64):
     )
 
 
+def repack_data_slots(columns, *data_slots):
+    """
+    Renumber data slots to index only the data columns actually used.
+
+    Parameters
+    ----------
+    columns : pandas.Index
+        The data columns indexed by the original slots.
+    *data_slots : array of int32
+        Data slots, in the order the kernel visits them.  Negative slots
+        (which do not refer to a data column) are left unchanged.
+
+    Returns
+    -------
+    used_columns : pandas.Index
+        The used columns, in order of first visit.
+    *repacked_slots : array of int32
+        The data slots renumbered as positions in `used_columns`.
+    """
+    keep = []
+    lookup = {}
+    repacked = []
+    for slots in data_slots:
+        new_slots = slots.copy()
+        for n, i in enumerate(slots):
+            if i < 0:
+                continue
+            if i not in lookup:
+                lookup[i] = len(keep)
+                keep.append(i)
+            new_slots[n] = lookup[i]
+        repacked.append(new_slots)
+    return (columns[keep], *repacked)
+
+
+def model_dutility_slots(
+        graph,
+        n_params,
+        model_utility_co_alt,
+        model_utility_co_param,
+        model_utility_ca_param,
+        model_q_ca_param,
+        model_q_scale_param,
+        mu_slots,
+):
+    """
+    Build a compressed map of the parameters that can affect each node.
+
+    Elemental alternatives depend on their own idco parameters and on all
+    idca and quantity parameters.  Each nest depends on its own logsum
+    parameter and on every parameter of its children.
+
+    Returns
+    -------
+    node_param_start : int32 array, shape [n_nodes+1]
+        The parameters for node `n` are listed in
+        `node_param_index[node_param_start[n]:node_param_start[n+1]]`.
+    node_param_index : int32 array, shape [n_nonzero]
+    node_param_slot : int32 array, shape [n_nodes, n_params]
+        The position of each (node, parameter) pair within the compressed
+        list, or -1 if the parameter does not affect that node.
+    """
+    n_nodes = len(graph)
+    n_alts = graph.n_elementals()
+    shared = set(int(i) for i in model_utility_ca_param)
+    shared |= set(int(i) for i in model_q_ca_param)
+    if model_q_scale_param[0] >= 0:
+        shared.add(int(model_q_scale_param[0]))
+    node_params = [set(shared) for _ in range(n_alts)]
+    node_params += [set() for _ in range(n_nodes - n_alts)]
+    for alt, param in zip(model_utility_co_alt, model_utility_co_param):
+        node_params[alt].add(int(param))
+    for nest, mu_slot in enumerate(mu_slots):
+        if mu_slot >= 0:
+            node_params[n_alts + nest].add(int(mu_slot))
+    ups, dns, _1, _2 = graph.edge_slot_arrays()
+    for up, dn in zip(ups, dns):
+        node_params[up] |= node_params[dn]
+
+    node_param_start = np.zeros([n_nodes + 1], dtype=np.int32)
+    node_param_start[1:] = np.cumsum([len(i) for i in node_params])
+    node_param_index = np.zeros([node_param_start[-1]], dtype=np.int32)
+    node_param_slot = np.full([n_nodes, n_params], -1, dtype=np.int32)
+    for n, params in enumerate(node_params):
+        for k, param in enumerate(sorted(params), start=node_param_start[n]):
+            node_param_index[k] = param
+            node_param_slot[n, param] = k
+    return (
+        node_param_start,
+        node_param_index,
+        node_param_slot,
+    )
+
+
 class _case_slice:
     def __get__(self, obj, objtype=None):
         self.parent = obj
         return self
     def __getitem__(self, idx):
-        return type(self.parent)(**{k: getattr(self.parent, k)[idx] for k in self.parent._fields})
+        return type(self.parent)(**{
+            k: None if getattr(self.parent, k) is None else getattr(self.parent, k)[idx]
+            for k in self.parent._fields
+        })
 
 
 from collections import namedtuple
@@ -820,6 +1872,12 @@ WorkArrays = namedtuple(
 )
 WorkArrays.cs = _case_slice()
 
+ReducedArrays = namedtuple(
+    'ReducedArrays',
+    ['loglike', 'd_loglike', 'bhhh', 'd2_loglike'],
+    defaults=(None,),
+)
+
 DataArrays = namedtuple(
     'DataArrays',
     ['ch', 'av', 'wt', 'co', 'ca'],
@@ -835,26 +1893,292 @@ FixedArrays = namedtuple(
         'uco_alt_slot', 'uco_scale', 'uco_param_slot', 'uco_data_slot',
         'edge_slots',
         'mu_slot', 'start_edges', 'len_edges',
+        'node_param_start', 'node_param_index', 'node_param_slot',
     ]
 )
 
+CaseScratch = namedtuple(
+    'CaseScratch',
+    [
+        'utility', 'logprob', 'probability', 'dutility',
+        'parent_edge', 'd_logprob', 'touched', 'touched_mark',
+        'd_loglike', 'loglike',
+    ],
+)
+
+KernelArgs = namedtuple(
+    'KernelArgs',
+    ['fixed', 'holdfast', 'parameters', 'data', 'return_flags'],
+    defaults=(None,),
+)
+
+
+def _kernel_args(args):
+    """
+    Split the flat arguments of the casewise kernel into named parts.
+
+    Parameters
+    ----------
+    args : tuple
+        The fixed arrays, holdfast flags, parameter values and data
+        arrays, in the order taken by `_numba_master`, optionally
+        followed by the return flags.
+
+    Returns
+    -------
+    KernelArgs
+        The fixed arrays as `FixedArrays` and the data as `DataArrays`,
+        in the order taken by the reduced kernels.
+    """
+    n_fixed = len(FixedArrays._fields)
+    data_end = n_fixed + 2 + len(DataArrays._fields)
+    return KernelArgs(
+        FixedArrays(*args[:n_fixed]),
+        args[n_fixed],
+        args[n_fixed + 1],
+        DataArrays(*args[n_fixed + 2:data_end]),
+        *args[data_end:],
+    )
+
+
+def _read_only(df):
+    """
+    Whether a DataFrame holds its values in read-only memory.
+    """
+    return not df.values.flags.writeable
+
+
+def model_fixed_arrays(dataframes, model, dtype=np.float64, repack_data=False):
+    """
+    Build the fixed arrays that describe a model's structure to the kernel.
+
+    Parameters
+    ----------
+    dataframes : DataFrames
+        Data columns are located in these dataframes.
+    model : larch.Model
+        Any model with a graph, utility and quantity functions, whose
+        parameter frame defines the parameter slots.
+    dtype : dtype, default float64
+        The dtype for the parameter scale arrays.
+    repack_data : bool, default False
+        Renumber the data slots to index only the used data columns, see
+        `repack_data_slots`.  This is ignored for read-only data.
+
+    Returns
+    -------
+    fixed_arrays : FixedArrays
+    data_columns : tuple
+        The used idco and idca columns when `repack_data` is set (or None
+        for each where there is no such data, or where every column is
+        used), otherwise (None, None).
+    """
+    n_alts = model.graph.n_elementals()
+    n_params = len(model._frame)
+    (
+        model_utility_ca_param_scale,
+        model_utility_ca_param,
+        model_utility_ca_data,
+    ) = model_u_ca_slots(dataframes, model, dtype=dtype)
+    (
+        model_utility_co_alt,
+        model_utility_co_param_scale,
+        model_utility_co_param,
+        model_utility_co_data,
+    ) = model_co_slots(dataframes, model, dtype=dtype)
+    (
+        model_q_ca_param_scale,
+        model_q_ca_param,
+        model_q_ca_data,
+        model_q_scale_param,
+    ) = model_q_ca_slots(dataframes, model, dtype=dtype)
+
+    # When every column is used there is nothing to gain by repacking,
+    # and the data arrays can then be views of the dataframes (e.g. in
+    # shared or memory-mapped memory) instead of copies.  Read-only data
+    # is never repacked, as it is shared or memory-mapped for a reason,
+    # and a repacked copy would be private to this process.
+    columns_co = columns_ca = None
+    if repack_data and dataframes.data_co is not None and not _read_only(dataframes.data_co):
+        repacked = repack_data_slots(
+            dataframes.data_co.columns,
+            model_utility_co_data,
+        )
+        if len(repacked[0]) < len(dataframes.data_co.columns):
+            (
+                columns_co,
+                model_utility_co_data,
+            ) = repacked
+    if repack_data and dataframes.data_ca_or_ce is not None and not _read_only(dataframes.data_ca_or_ce):
+        repacked = repack_data_slots(
+            dataframes.data_ca_or_ce.columns,
+            model_q_ca_data,
+            model_utility_ca_data,
+        )
+        if len(repacked[0]) < len(dataframes.data_ca_or_ce.columns):
+            (
+                columns_ca,
+                model_q_ca_data,
+                model_utility_ca_data,
+            ) = repacked
+
+    node_slot_arrays = model.graph.node_slot_arrays(model)
+
+    (
+        node_param_start,
+        node_param_index,
+        node_param_slot,
+    ) = model_dutility_slots(
+        model.graph,
+        n_params,
+        model_utility_co_alt,
+        model_utility_co_param,
+        model_utility_ca_param,
+        model_q_ca_param,
+        model_q_scale_param,
+        node_slot_arrays[0][n_alts:],
+    )
+
+    fixed_arrays = FixedArrays(
+        model_q_ca_param_scale,
+        model_q_ca_param,
+        model_q_ca_data,
+        model_q_scale_param,
+
+        model_utility_ca_param_scale,
+        model_utility_ca_param,
+        model_utility_ca_data,
+
+        model_utility_co_alt,
+        model_utility_co_param_scale,
+        model_utility_co_param,
+        model_utility_co_data,
+
+        np.stack(model.graph.edge_slot_arrays()).T,
+        node_slot_arrays[0][n_alts:],
+        node_slot_arrays[1][n_alts:],
+        node_slot_arrays[2][n_alts:],
+
+        node_param_start,
+        node_param_index,
+        node_param_slot,
+    )
+    return fixed_arrays, (columns_co, columns_ca)
+
 
 class NumbaModel(_BaseModel):
 
     _null_slice = (None, None, None)
 
-    def __init__(self, *args, float_dtype = np.float64, **kwargs):
+    def __init__(
+            self,
+            *args,
+            float_dtype = np.float64,
+            repack_data = True,
+            cache_utility = False,
+            compact_data = False,
+            **kwargs,
+    ):
         super().__init__(*args, **kwargs)
         self._fixed_arrays = None
+        self._data_columns = None
+        self._utility_cache = None
+        self._utility_cache_hits = 0
+        self._compact_arrays = None
+        self._ce_arrays = None
+        self._repack_data = bool(repack_data)
+        self._compact_data = bool(compact_data)
+        self.cache_utility = cache_utility
         self.work_arrays = None
         self.float_dtype = float_dtype
         self.constraint_intensity = 0.0
         self.constraint_sharpness = 10.0
         self._constraint_funcs = None
+        self._case_stream = None
+        self._shard_pool = None
+
+    @property
+    def repack_data(self):
+        """
+        bool : Copy only the data columns used by the model into the kernel arrays.
+
+        When True (the default), the idco and idca arrays given to the
+        kernel hold only the columns referenced by the utility and
+        quantity functions, in the order the kernel visits them, so that
+        unused columns of wide data frames are never copied and each case
+        occupies a short contiguous stride.  The arrays are rebuilt from
+        the dataframes whenever the model specification changes.  If
+        every column is used, the dataframes' own arrays are used as is.
+
+        Data in read-only memory, such as DataFrames in shared memory
+        or memory-mapped from feather files, is never repacked, so that
+        it is not copied into each process that uses it.
+        """
+        return self._repack_data
+
+    @repack_data.setter
+    def repack_data(self, value):
+        value = bool(value)
+        if value != self._repack_data:
+            self._repack_data = value
+            self.mangle()
+
+    @property
+    def compact_data(self):
+        """
+        bool : Store choices and availability in compact form.
+
+        When True, the choices are stored as the position of the chosen
+        alternative and the amount chosen for each case, and availability
+        as one bit per elemental alternative, instead of as dense
+        `[n_cases, n_nodes]` arrays that include the nests.  The reduced
+        loglike, gradient and BHHH are then computed over blocks of cases,
+        expanding the choices and availability of each block, including
+        the nest cascades, just before it is evaluated.  Casewise results
+        expand the cases they need.
+
+        This requires that no case has more than one chosen alternative,
+        and disables `cache_utility`.
+        """
+        return self._compact_data
+
+    @compact_data.setter
+    def compact_data(self, value):
+        value = bool(value)
+        if value != self._compact_data:
+            self._compact_data = value
+            self.mangle()
+
+    # the bytes of dense data expanded at once when `compact_data` is set
+    # or the data is idce, see `_expand_block_size`
+    _expand_block_bytes = 1 << 26
+
+    @property
+    def cache_utility(self):
+        """
+        bool : Keep elemental utilities between evaluations of nested models.
+
+        When True, the reduced loglike kernel stores the utility of every
+        elemental alternative for every case, with its derivatives, and
+        reuses them in later evaluations where only the logsum parameters
+        have changed, as happens in many line search steps during
+        estimation of nested logit models.  This costs memory of about
+        n_cases * (n_alts + utility parameters per alternative) floats,
+        so it is off by default, and it is not used for MNL models or
+        while streaming cases.
+        """
+        return self._cache_utility
+
+    @cache_utility.setter
+    def cache_utility(self, value):
+        self._cache_utility = bool(value)
+        self._utility_cache = None
 
     def mangle(self, *args, **kwargs):
         super().mangle(*args, **kwargs)
         self._fixed_arrays = None
+        self._data_columns = None
+        self._utility_cache = None
         self.work_arrays = None
         self._array_ch_cascade = None
         self._array_av_cascade = None
@@ -864,16 +2188,26 @@ class NumbaModel(_BaseModel):
         """
         Reload the _data_arrays so they are consistent with the dataframes.
         """
+        self._utility_cache = None
+        self._compact_arrays = None
+        self._ce_arrays = None
         if self.graph is None:
             self._data_arrays = None
             return
 
         n_nodes = len(self.graph)
-        if self.dataframes.data_ch is not None:
+        if self.compact_data:
+            self._compact_arrays = compact_arrays(
+                self.dataframes, self.graph.n_elementals(), dtype=self.float_dtype,
+            )
+            _array_ch_cascade = _array_av_cascade = None
+        elif self.dataframes.data_ch is not None:
             _array_ch_cascade = data_ch_cascade(self.dataframes, self.graph, dtype=self.float_dtype)
         else:
             _array_ch_cascade = np.zeros([self.n_cases, 0], dtype=self.float_dtype)
-        if self.dataframes.data_av is not None:
+        if self.compact_data:
+            pass
+        elif self.dataframes.data_av is not None:
             _array_av_cascade = data_av_cascade(self.dataframes, self.graph)
         else:
             _array_av_cascade = np.ones([self.n_cases, n_nodes], dtype=np.int8)
@@ -882,13 +2216,19 @@ class NumbaModel(_BaseModel):
         else:
             _array_wt = np.ones(self.n_cases, dtype=self.float_dtype)
 
-        _array_co = self.dataframes.array_co(force=True)
+        columns_co, columns_ca = self._data_columns or (None, None)
+        _array_co = self.dataframes.array_co(force=True, columns=columns_co)
         if _array_co.dtype != self.float_dtype:
             _array_co = _array_co.astype(self.float_dtype)
 
-        _array_ca = self.dataframes.array_ca(force=True)
-        if _array_ca.dtype != self.float_dtype:
-            _array_ca = _array_ca.astype(self.float_dtype)
+        if self.dataframes.data_ca is None and self.dataframes.data_ce is not None:
+            # idce data is kept sparse, see `_numba_master_reduced_ce`
+            self._ce_arrays = ce_arrays(self.dataframes, columns=columns_ca, dtype=self.float_dtype)
+            _array_ca = None
+        else:
+            _array_ca = self.dataframes.array_ca(force=True, columns=columns_ca)
+            if _array_ca.dtype != self.float_dtype:
+                _array_ca = _array_ca.astype(self.float_dtype)
 
         self._data_arrays = DataArrays(
             (_array_ch_cascade),
@@ -908,71 +2248,52 @@ class NumbaModel(_BaseModel):
             ):
                 _rebuild_work_arrays = False
 
+        # The casewise bhhh array is by far the largest work array, and it is
+        # only needed when casewise results are persisted, so by default it
+        # is a zero-stride placeholder that the kernel never writes to.
+        # See `_ensure_casewise_bhhh`.
+        bhhh_placeholder = np.zeros([1, n_params, n_params], dtype=self.float_dtype)
         self.work_arrays = WorkArrays(
             utility=np.zeros([n_cases, n_nodes], dtype=self.float_dtype),
             logprob=np.zeros([n_cases, n_nodes], dtype=self.float_dtype),
             probability=np.zeros([n_cases, n_nodes], dtype=self.float_dtype),
-            bhhh=np.zeros([n_cases, n_params, n_params], dtype=self.float_dtype),
+            bhhh=np.lib.stride_tricks.as_strided(
+                bhhh_placeholder,
+                shape=(n_cases, n_params, n_params),
+                strides=(0, *bhhh_placeholder.strides[1:]),
+            ),
             d_loglike=np.zeros([n_cases, n_params], dtype=self.float_dtype),
             loglike=np.zeros([n_cases], dtype=self.float_dtype),
         )
 
+    def _ensure_casewise_bhhh(self):
+        """
+        Allocate a full [n_cases, n_params, n_params] casewise bhhh work array.
+        """
+        if self.work_arrays.bhhh.strides[0] == 0:
+            self.work_arrays = self.work_arrays._replace(
+                bhhh=np.zeros(self.work_arrays.bhhh.shape, dtype=self.float_dtype),
+            )
+
     def unmangle(self, force=False):
         super().unmangle(force=force)
         if self._fixed_arrays is None or force:
             n_nodes = len(self.graph)
-            n_alts = self.graph.n_elementals()
-            n_nests = n_nodes - n_alts
             n_params = len(self._frame)
             if self.dataframes is not None:
-                (
-                    model_utility_ca_param_scale,
-                    model_utility_ca_param,
-                    model_utility_ca_data,
-                ) = model_u_ca_slots(self.dataframes, self, dtype=self.float_dtype)
-                (
-                    model_utility_co_alt,
-                    model_utility_co_param_scale,
-                    model_utility_co_param,
-                    model_utility_co_data,
-                ) = model_co_slots(self.dataframes, self, dtype=self.float_dtype)
-                (
-                    model_q_ca_param_scale,
-                    model_q_ca_param,
-                    model_q_ca_data,
-                    model_q_scale_param,
-                ) = model_q_ca_slots(self.dataframes, self, dtype=self.float_dtype)
-
-                node_slot_arrays = self.graph.node_slot_arrays(self)
-
-                self._fixed_arrays = FixedArrays(
-                    model_q_ca_param_scale,
-                    model_q_ca_param,
-                    model_q_ca_data,
-                    model_q_scale_param,
-
-                    model_utility_ca_param_scale,
-                    model_utility_ca_param,
-                    model_utility_ca_data,
-
-                    model_utility_co_alt,
-                    model_utility_co_param_scale,
-                    model_utility_co_param,
-                    model_utility_co_data,
-
-                    np.stack(self.graph.edge_slot_arrays()).T,
-                    node_slot_arrays[0][n_alts:],
-                    node_slot_arrays[1][n_alts:],
-                    node_slot_arrays[2][n_alts:],
+                self._fixed_arrays, self._data_columns = model_fixed_arrays(
+                    self.dataframes,
+                    self,
+                    dtype=self.float_dtype,
+                    repack_data=self.repack_data,
                 )
-
                 self._reload_data_arrays()
             else:
                 self._fixed_arrays = None
                 self._data_arrays = None
 
             try:
-                n_cases = self.n_cases
+                n_cases = super().n_cases
             except MissingDataError:
                 self.work_arrays = None
             else:
@@ -986,7 +2307,21 @@ class NumbaModel(_BaseModel):
             allow_missing_ch=False,
             allow_missing_av=False,
             caseslice=None,
+            param_dtype=None,
+            dense=True,
     ):
+        """
+        Assemble the kernel arguments.
+
+        Parameters
+        ----------
+        dense : bool, default True
+            With `compact_data` or idce data, whether to expand the compact
+            choices and availability, or the idce rows, of the cases in
+            `caseslice` into dense arrays.  Otherwise they are given as
+            None, and the reduced kernels expand them block by block, or
+            read the idce rows directly, see `_run_reduced_blocks`.
+        """
         if caseslice is None:
             caseslice = slice(caseslice)
         missing_ch, missing_av = False, False
@@ -1000,6 +2335,7 @@ class NumbaModel(_BaseModel):
         if self.dataframes.data_ch is None:
             if allow_missing_ch:
                 missing_ch = True
+            if allow_missing_ch and self._compact_arrays is None:
                 self._data_arrays = DataArrays(
                     np.zeros(self._data_arrays.av.shape, dtype=self._data_arrays.wt.dtype),
                     self._data_arrays.av,
@@ -1007,20 +2343,49 @@ class NumbaModel(_BaseModel):
                     self._data_arrays.co,
                     self._data_arrays.ca,
                 )
-            else:
+            elif not allow_missing_ch:
                 raise MissingDataError('model.dataframes does not define data_ch')
         if self.dataframes.data_av is None:
             if allow_missing_av:
                 missing_av = True
             else:
                 raise MissingDataError('model.dataframes does not define data_av')
+        data_arrays = self._data_arrays.cs[caseslice]
+        if dense and (self._compact_arrays is not None or self._ce_arrays is not None):
+            cases = range(self.dataframes.n_cases)[caseslice]
+            if cases.step == 1:
+                expanded = self._expand_data(cases.start, cases.stop)
+            else:
+                expanded = {k: v[caseslice] for k, v in self._expand_data().items()}
+            data_arrays = data_arrays._replace(**expanded)
         return (
             *self._fixed_arrays,
             self._frame.holdfast.to_numpy(),
-            self.pvals.astype(self.float_dtype), # float input shape=[n_params]
-            *self._data_arrays.cs[caseslice],
+            self.pvals.astype(param_dtype or self.float_dtype), # float input shape=[n_params]
+            *data_arrays,
         )
 
+    def _expand_data(self, start=0, stop=None, ca=True):
+        """
+        Dense arrays for a range of cases, for the data not held densely.
+
+        Returns
+        -------
+        dict
+            The cascaded 'ch' and 'av' arrays if `compact_data` is set,
+            and the 'ca' array if the data is idce and `ca` is True.
+        """
+        expanded = {}
+        if self._compact_arrays is not None:
+            expanded['ch'], expanded['av'] = expand_compact_arrays(
+                self._compact_arrays, self.graph, start, stop, dtype=self.float_dtype,
+            )
+        if ca and self._ce_arrays is not None:
+            expanded['ca'] = expand_ce_arrays(
+                self._ce_arrays, self.graph.n_elementals(), start, stop,
+            )
+        return expanded
+
     def constraint_violation(
             self,
             on_violation='raise',
@@ -1111,10 +2476,25 @@ class NumbaModel(_BaseModel):
             )
         return penalty, dpenalty, dpenalty_binding
 
+    def _d2_penalty(self):
+        """
+        Second derivative of the constraint penalty, by finite differences.
+
+        The penalty depends only on the parameters and not on the data, so
+        this is cheap to compute.
+        """
+        from ..math.optimize import approx_fprime
+        x0 = self.pvals.copy()
+        try:
+            return approx_fprime(x0, lambda y: self.constraint_penalty(y)[1])
+        finally:
+            self.set_values(x0)
+
     def constraint_converge_tolerance(self, x=None):
         args = self.__prepare_for_compute(
             x,
             allow_missing_ch=False,
+            param_dtype=np.float64,
         )
         args_flags = args + (np.asarray([
             0,     # only_utility
@@ -1123,23 +2503,388 @@ class NumbaModel(_BaseModel):
             True,  # return_bhhh
         ], dtype=np.int8),)
         with np.errstate(divide='ignore', over='ignore', ):
-            _numba_master_vectorized(
-                *args_flags,
-                out=tuple(self.work_arrays),
-            )
+            loglike, dloglike, bhhh, n_cases = self._run_reduced(args_flags)
             if self.constraint_intensity:
                 penalty, dpenalty, dpenalty_binding = self.constraint_penalty()
-                self.work_arrays.loglike[:] += penalty
-                self.work_arrays.d_loglike[:] += np.expand_dims(dpenalty_binding, 0)
-                self.work_arrays.bhhh[:] = np.einsum('ij,ik->ijk', self.work_arrays.d_loglike, self.work_arrays.d_loglike)
-        bhhh = self.work_arrays.bhhh.sum(0)
-        dloglike = self.work_arrays.d_loglike.sum(0)
+                bhhh = self._penalized_bhhh(bhhh, dloglike, dpenalty_binding, n_cases)
+                dloglike = dloglike + dpenalty_binding * n_cases
         freedoms = (self.pf.holdfast == 0).to_numpy()
         from .optimization import propose_direction
         direction = propose_direction(bhhh, dloglike, freedoms)
         tolerance = np.dot(direction, dloglike) - self.n_cases
         return tolerance
 
+    def _run_reduced(self, args_flags, kernel=_numba_master_reduced, all_cases=False):
+        """
+        Run a reduced kernel, over each block of the case stream if one is
+        set, or on the workers of the shard pool if one is set.
+
+        Parameters
+        ----------
+        kernel : callable, default `_numba_master_reduced`
+            The reduced kernel, either `_numba_master_reduced` or
+            `_numba_hessian_reduced`.
+        all_cases : bool, default False
+            Whether `args_flags` covers all the cases in `_data_arrays`,
+            so that the elemental utilities may be cached, see
+            `cache_utility`.
+
+        Returns
+        -------
+        loglike, d_loglike, bhhh[, d2_loglike] : ndarray
+        n_cases : int
+        """
+        args = _kernel_args(args_flags)
+        if self._shard_pool is not None:
+            return self._shard_pool.evaluate(
+                self, args.holdfast, args.parameters, args.return_flags,
+                hessian=(kernel is _numba_hessian_reduced),
+            )
+        if self._case_stream is None:
+            n_cases = args.data.wt.shape[0]
+            if args.data.ch is None or args.data.ca is None:
+                return (*self._run_reduced_blocks(args, kernel), n_cases)
+            if all_cases and kernel is _numba_master_reduced and self._use_utility_cache():
+                return (*self._run_reduced_cached(args), n_cases)
+            return (*self._run_reduced_in_memory(args, kernel), n_cases)
+        totals = None
+        n_cases = 0
+        for block in self._case_stream.blocks():
+            data_arrays = self._stream_data_arrays(block)
+            block_results = self._run_reduced_in_memory(args._replace(data=data_arrays), kernel)
+            if totals is None:
+                totals = list(block_results)
+            else:
+                for total, block_result in zip(totals, block_results):
+                    total += block_result
+            n_cases += data_arrays.ca.shape[0]
+        return (*totals, n_cases)
+
+    def _run_reduced_blocks(self, args, kernel):
+        """
+        Run a reduced kernel over all cases, for data not held densely.
+
+        The compact choices and availability (see `compact_data`) are
+        expanded a block of cases at a time, see `_expand_block_size`.
+        Idce data is read directly by `_numba_master_reduced_ce`, or for
+        other kernels is also expanded block by block.
+        """
+        data_arrays = args.data
+        n_cases = data_arrays.wt.shape[0]
+        sparse = data_arrays.ca is None and kernel is _numba_master_reduced
+        if data_arrays.ch is None or not sparse:
+            block_size = self._expand_block_size(ca=not sparse)
+        else:
+            block_size = max(n_cases, 1)
+        totals = None
+        for start in range(0, n_cases, block_size):
+            stop = min(start + block_size, n_cases)
+            block = data_arrays.cs[start:stop]._replace(
+                **self._expand_data(start, stop, ca=not sparse)
+            )
+            if sparse:
+                ce = self._ce_arrays
+                block_results = _numba_master_reduced_ce(
+                    args.fixed,
+                    args.holdfast,
+                    args.parameters,
+                    block,
+                    ce.rows,
+                    ce.altindex,
+                    ce.case_start[start:stop+1],
+                    self.graph.n_elementals(),
+                    args.return_flags,
+                    max(min(stop - start, numba.get_num_threads() * 4), 1),
+                )
+            else:
+                block_results = self._run_reduced_in_memory(args._replace(data=block), kernel)
+            if totals is None:
+                totals = list(block_results)
+            else:
+                for total, block_result in zip(totals, block_results):
+                    total += block_result
+        return totals
+
+    def _expand_block_size(self, ca=True):
+        """
+        The number of cases to expand at once with `_expand_data`.
+
+        Each case expands to a cascaded choice and availability for every
+        node of the graph if `compact_data` is set, and to a dense idca
+        array if the data is idce and `ca` is True, so the block size is
+        the number of cases whose expanded arrays fit in
+        `_expand_block_bytes`.
+        """
+        itemsize = np.dtype(self.float_dtype).itemsize
+        case_bytes = 0
+        if self._compact_arrays is not None:
+            case_bytes += len(self.graph) * (itemsize + 1)
+        if ca and self._ce_arrays is not None:
+            ce_rows = self._ce_arrays.rows
+            case_bytes += self.graph.n_elementals() * ce_rows.shape[1] * ce_rows.dtype.itemsize
+        return max(self._expand_block_bytes // max(case_bytes, 1), 1)
+
+    def _use_utility_cache(self):
+        return bool(
+            self.cache_utility
+            and self._compact_arrays is None
+            and self._ce_arrays is None
+            and self._fixed_arrays is not None
+            and (self._fixed_arrays.mu_slot >= 0).any()
+        )
+
+    def _run_reduced_cached(self, args):
+        """
+        Run `_numba_master_reduced_cached`, reusing elemental utilities if possible.
+
+        The stored utilities are reused when the parameters of the utility
+        and quantity functions, and the holdfast flags, are the same as
+        when they were computed.
+        """
+        fixed = args.fixed
+        holdfast_arr, parameter_arr = args.holdfast, args.parameters
+        array_ca = args.data.ca
+        n_cases, n_alts = array_ca.shape[:2]
+        linear_slots = np.unique(np.concatenate([
+            fixed.qca_param_slot,
+            fixed.qscale_param_slot[fixed.qscale_param_slot >= 0],
+            fixed.uca_param_slot,
+            fixed.uco_param_slot,
+        ]))
+        key = (
+            parameter_arr[linear_slots].tobytes(),
+            np.asarray(holdfast_arr).tobytes(),
+        )
+        cache = self._utility_cache
+        if (
+            cache is None
+            or cache[1].shape[0] != n_cases
+            or cache[1].dtype != array_ca.dtype
+        ):
+            cache = (
+                None,
+                np.zeros([n_cases, n_alts], dtype=array_ca.dtype),
+                np.zeros([n_cases, fixed.node_param_start[n_alts]], dtype=array_ca.dtype),
+            )
+        refresh = cache[0] != key
+        if not refresh:
+            self._utility_cache_hits += 1
+        n_blocks = max(min(n_cases, numba.get_num_threads() * 4), 1)
+        result = _numba_master_reduced_cached(
+            *args, n_blocks, cache[1], cache[2], refresh,
+        )
+        self._utility_cache = (key, cache[1], cache[2])
+        return result
+
+    def _evaluate_reduced(self, holdfast_arr, parameter_arr, return_flags, hessian=False):
+        """
+        Run a reduced kernel over all the attached cases, for a ShardPool worker.
+
+        Returns
+        -------
+        loglike, d_loglike, bhhh[, d2_loglike] : ndarray
+        """
+        self._frame['holdfast'] = holdfast_arr
+        self._frame['value'] = parameter_arr
+        args = self.__prepare_for_compute(param_dtype=np.float64, dense=False)
+        kernel = _numba_hessian_reduced if hessian else _numba_master_reduced
+        with np.errstate(divide='ignore', over='ignore', ):
+            return self._run_reduced((*args, return_flags), kernel, all_cases=True)[:-1]
+
+    @staticmethod
+    def _run_reduced_in_memory(args, kernel=_numba_master_reduced):
+        n_cases = args.data.ca.shape[0]
+        n_blocks = max(min(n_cases, numba.get_num_threads() * 4), 1)
+        return kernel(*args, n_blocks)
+
+    def _stream_data_arrays(self, block):
+        """
+        Convert a block of raw arrays from the case stream into kernel inputs.
+        """
+        n_cases = block['ca'].shape[0] if 'ca' in block else block['co'].shape[0]
+        n_alts = self.graph.n_elementals()
+        if 'ch' in block:
+            ch = array_ch_cascade(block['ch'], self.graph, dtype=self.float_dtype)
+        else:
+            ch = np.zeros([n_cases, len(self.graph)], dtype=self.float_dtype)
+        if 'av' in block:
+            av = array_av_cascade(block['av'], self.graph)
+        else:
+            av = np.ones([n_cases, len(self.graph)], dtype=np.int8)
+        if 'wt' in block:
+            wt = np.asarray(block['wt'], dtype=self.float_dtype).reshape(-1)
+        else:
+            wt = np.ones(n_cases, dtype=self.float_dtype)
+        columns_co, columns_ca = self._data_columns or (None, None)
+        if 'co' in block:
+            co = block['co']
+            if columns_co is not None:
+                co = co[:, pd.Index(self._case_stream.columns_co).get_indexer(columns_co)]
+            co = np.ascontiguousarray(co, dtype=self.float_dtype)
+        else:
+            co = np.zeros([n_cases, 0], dtype=self.float_dtype)
+        if 'ca' in block:
+            ca = block['ca']
+            if columns_ca is not None:
+                ca = ca[:, :, pd.Index(self._case_stream.columns_ca).get_indexer(columns_ca)]
+            ca = np.ascontiguousarray(ca, dtype=self.float_dtype)
+        else:
+            ca = np.zeros([n_cases, n_alts, 0], dtype=self.float_dtype)
+        return DataArrays(ch, av, wt, co, ca)
+
+    def set_case_stream(self, stream):
+        """
+        Stream case data from disk in blocks for estimation.
+
+        The model is linked to the small DataFrames given by `stream.head()`,
+        which defines the data layout.  Thereafter the loglike, gradient and
+        BHHH are computed over all the cases in the stream, one block at a
+        time, so the full data never needs to fit in memory.  Casewise
+        results such as probabilities are not available while a stream is
+        set.
+
+        Parameters
+        ----------
+        stream : larch.numba.streaming.CaseStream or None
+            Set to None to stop streaming and return to in-memory data.
+        """
+        self._case_stream = None
+        if stream is not None:
+            self.dataframes = stream.head()
+        self._case_stream = stream
+
+    def set_shard_pool(self, pool, send_data=True):
+        """
+        Evaluate the loglike over shards of cases held by worker processes.
+
+        Thereafter the loglike, gradient and BHHH are computed by the
+        workers of the pool, each over its own shard of cases, and summed.
+        Casewise results such as probabilities are not available while a
+        pool is set.
+
+        Parameters
+        ----------
+        pool : larch.numba.sharding.ShardPool or None
+            Set to None to return to evaluating the attached data here.
+        send_data : bool, default True
+            Split the cases of the attached dataframes among the workers.
+            Set to False if the workers are shard servers that already
+            hold their own data, in which case the attached dataframes need
+            only define the data layout, like `CaseStream.head`.
+        """
+        self._shard_pool = None
+        if pool is not None:
+            pool.load(self, send_data=send_data)
+        self._shard_pool = pool
+
+    def _resampling_arrays(self):
+        """
+        The kernel arguments for a ResamplingPool.
+
+        Returns
+        -------
+        fixed_args : tuple
+            The `FixedArrays` and the holdfast flags.
+        data_arrays : DataArrays
+            The ch, av, wt, co and ca arrays for all cases.
+        """
+        if self._case_stream is not None:
+            raise ValueError('resampling is not available while streaming cases')
+        if self._shard_pool is not None:
+            raise ValueError('resampling is not available with a shard pool')
+        if self.constraints:
+            raise NotImplementedError('resampling does not support constraints other than bounds')
+        args = _kernel_args(self.__prepare_for_compute(param_dtype=np.float64))
+        return (args.fixed, args.holdfast), args.data
+
+    def cross_validate(self, cv=5, *, n_workers=None, options=None):
+        """
+        A cross-validated log likelihood, with the folds estimated in parallel.
+
+        Case `c` is in fold `c % cv`, so this method assumes that cases
+        are already ordered randomly.  The model is re-estimated without
+        each fold, starting from the current parameter values, in a
+        `ResamplingPool` whose workers share one copy of the data, and
+        the log likelihood of each fold is then computed at the estimates
+        made without it.  The estimates for fold `i` are stored in the
+        parameter frame column 'cv_{i:03d}'.
+
+        Parameters
+        ----------
+        cv : int
+            The number of folds in k-fold cross-validation.
+        n_workers : int, optional
+            The number of worker processes.  Defaults to the number of CPUs.
+        options : dict, optional
+            Options passed to `scipy.optimize.minimize` in the workers.
+
+        Returns
+        -------
+        float
+            The log likelihood as computed from the holdout folds.
+        """
+        from .resampling import ResamplingPool
+        with ResamplingPool(self, n_workers=n_workers, options=options) as pool:
+            estimates, holdout_ll = pool.cross_validate(cv)
+        for fold in range(cv):
+            self._frame[f'cv_{fold:03d}'] = estimates[fold]
+        return float(holdout_ll.sum())
+
+    def bootstrap(self, n_replicates=100, *, n_workers=None, seed=None, options=None):
+        """
+        Bootstrap estimates of the parameters, with the replicates estimated in parallel.
+
+        Each replicate re-estimates the model, starting from the current
+        parameter values, on a sample of cases drawn with replacement.
+        The samples are drawn as case weight multipliers, so the data is
+        never copied, and the replicates are run in a `ResamplingPool`
+        whose workers share one copy of the data.  The standard deviation
+        of the replicates is stored in the parameter frame column
+        'bootstrap_std_err'.
+
+        Parameters
+        ----------
+        n_replicates : int, default 100
+            The number of bootstrap samples.
+        n_workers : int, optional
+            The number of worker processes.  Defaults to the number of CPUs.
+        seed : int, optional
+            Seed for drawing the bootstrap samples.
+        options : dict, optional
+            Options passed to `scipy.optimize.minimize` in the workers.
+
+        Returns
+        -------
+        pandas.DataFrame
+            The estimates from each replicate, one row per replicate.
+        """
+        from .resampling import ResamplingPool
+        with ResamplingPool(self, n_workers=n_workers, options=options) as pool:
+            estimates = pool.bootstrap(n_replicates, seed=seed)
+        result = pd.DataFrame(estimates, columns=self._frame.index)
+        self._frame['bootstrap_std_err'] = result.std(ddof=1).to_numpy()
+        return result
+
+    @property
+    def n_cases(self):
+        """int : The number of cases in the attached data, case stream or shard pool."""
+        if getattr(self, '_shard_pool', None) is not None:
+            return self._shard_pool.n_cases
+        if getattr(self, '_case_stream', None) is not None:
+            return self._case_stream.n_cases
+        return super().n_cases
+
+    @staticmethod
+    def _penalized_bhhh(bhhh, d_loglike, d_penalty, n_cases):
+        """
+        Adjust a summed bhhh matrix for a penalty gradient added to every case.
+
+        This is the sum over cases of the outer product of the penalized
+        casewise gradient, computed from the totals alone.
+        """
+        cross = np.outer(d_loglike, d_penalty)
+        return bhhh + cross + cross.T + np.outer(d_penalty, d_penalty) * n_cases
+
     def _loglike_runner(
             self,
             x=None,
@@ -1150,12 +2895,35 @@ class NumbaModel(_BaseModel):
             start_case=None,
             stop_case=None,
             step_case=None,
+            reduced=False,
+            return_hessian=False,
     ):
+        """
+        Run the loglike kernel.
+
+        Parameters
+        ----------
+        reduced : bool, default False
+            If True, the loglike, gradient and bhhh are summed across cases
+            inside the kernel, and a `ReducedArrays` of totals is returned
+            instead of casewise `WorkArrays`.  This avoids allocating and
+            summing casewise arrays, and cannot be combined with
+            `return_probability` or `only_utility`.
+        return_hessian : bool, default False
+            Also compute the analytic second derivative of the log
+            likelihood.  This requires `reduced`.
+
+        Returns
+        -------
+        WorkArrays or ReducedArrays, float
+        """
         caseslice = slice(start_case, stop_case, step_case)
         args = self.__prepare_for_compute(
             x,
             allow_missing_ch=return_probability or (only_utility>0),
             caseslice=caseslice,
+            param_dtype=np.float64 if reduced else None,
+            dense=not (reduced and caseslice == slice(None)),
         )
         args_flags = args + (np.asarray([
             only_utility,
@@ -1163,15 +2931,51 @@ class NumbaModel(_BaseModel):
             return_gradient,
             return_bhhh,
         ], dtype=np.int8),)
+        if reduced:
+            if return_probability or only_utility:
+                raise ValueError('reduced results are only available for loglike, gradient and bhhh')
+            if self._case_stream is not None and caseslice != slice(None):
+                raise ValueError('case slicing is not available while streaming cases')
+            if self._shard_pool is not None and caseslice != slice(None):
+                raise ValueError('case slicing is not available with a shard pool')
+            with np.errstate(divide='ignore', over='ignore', ):
+                if return_hessian:
+                    loglike, d_loglike, bhhh, d2_loglike, n_cases = self._run_reduced(
+                        args_flags, _numba_hessian_reduced,
+                    )
+                else:
+                    loglike, d_loglike, bhhh, n_cases = self._run_reduced(
+                        args_flags, all_cases=(caseslice == slice(None)),
+                    )
+                    d2_loglike = None
+                if self.constraint_intensity:
+                    penalty, dpenalty, dpenalty_binding = self.constraint_penalty()
+                    loglike += penalty * n_cases
+                    if return_bhhh:
+                        bhhh = self._penalized_bhhh(bhhh, d_loglike, dpenalty, n_cases)
+                    d_loglike += dpenalty * n_cases
+                    if return_hessian:
+                        d2_loglike += self._d2_penalty() * n_cases
+                else:
+                    penalty = 0.0
+            return ReducedArrays(loglike[0], d_loglike, bhhh, d2_loglike), penalty
+        if return_hessian:
+            raise ValueError('the analytic hessian is only available for reduced results')
+        if self._case_stream is not None:
+            raise ValueError('casewise results are not available while streaming cases')
+        if self._shard_pool is not None:
+            raise ValueError('casewise results are not available with a shard pool')
+        if return_bhhh:
+            self._ensure_casewise_bhhh()
         try:
             with np.errstate(divide='ignore', over='ignore', ):
                 try:
-                    result_arrays = WorkArrays(*_numba_master_vectorized(
+                    result_arrays = WorkArrays(*_numba_master_vectorized()(
                         *args_flags,
                         out=tuple(self.work_arrays.cs[caseslice]),
                     ))
                 except ValueError:
-                    result_arrays = WorkArrays(*_numba_master_vectorized(
+                    result_arrays = WorkArrays(*_numba_master_vectorized()(
                         *args_flags,
                         #out=tuple(self.work_arrays.cs[caseslice]),
                     ))
@@ -1180,11 +2984,12 @@ class NumbaModel(_BaseModel):
                     penalty, dpenalty, dpenalty_binding = self.constraint_penalty()
                     self.work_arrays.loglike[caseslice] += penalty
                     self.work_arrays.d_loglike[caseslice] += np.expand_dims(dpenalty, 0)
-                    self.work_arrays.bhhh[caseslice] = np.einsum(
-                        'ij,ik->ijk',
-                        self.work_arrays.d_loglike[caseslice],
-                        self.work_arrays.d_loglike[caseslice],
-                    )
+                    if return_bhhh:
+                        self.work_arrays.bhhh[caseslice] = np.einsum(
+                            'ij,ik->ijk',
+                            self.work_arrays.d_loglike[caseslice],
+                            self.work_arrays.d_loglike[caseslice],
+                        )
                 else:
                     penalty = 0.0
 
@@ -1221,9 +3026,10 @@ class NumbaModel(_BaseModel):
             probability_only=False,
     ):
         result_arrays, penalty = self._loglike_runner(
-            x, start_case=start_case, stop_case=stop_case, step_case=step_case
+            x, start_case=start_case, stop_case=stop_case, step_case=step_case,
+            reduced=True,
         )
-        result = result_arrays.loglike.sum() * self.dataframes.weight_normalization
+        result = result_arrays.loglike * self.dataframes.weight_normalization
         if start_case is None and stop_case is None and step_case is None:
             self._check_if_best(result)
         return result
@@ -1242,8 +3048,9 @@ class NumbaModel(_BaseModel):
             stop_case=stop_case,
             step_case=step_case,
             return_gradient=True,
+            reduced=True,
         )
-        result = result_arrays.d_loglike.sum(0) * self.dataframes.weight_normalization
+        result = result_arrays.d_loglike * self.dataframes.weight_normalization
         if return_series:
             result = pd.Series(result, index=self._frame.index)
         return result
@@ -1293,8 +3100,9 @@ class NumbaModel(_BaseModel):
             stop_case=stop_case,
             step_case=step_case,
             return_bhhh=True,
+            reduced=True,
         )
-        result = result_arrays.bhhh.sum(0) * self.dataframes.weight_normalization
+        result = result_arrays.bhhh * self.dataframes.weight_normalization
         if return_dataframe:
             result = pd.DataFrame(
                 result, columns=self._frame.index, index=self._frame.index
@@ -1423,6 +3231,62 @@ class NumbaModel(_BaseModel):
             return arr
         return result_arrays.utility[:,-1]
 
+    def loglike_multi(self, x, *, return_gradient=False):
+        """
+        Compute the log likelihood at several sets of parameter values at once.
+
+        All the points are evaluated in a single pass through the data,
+        which reads the data for each case only once, so evaluating a few
+        points costs little more than evaluating one.  When cases are
+        streamed or sharded, the points are instead evaluated one at a
+        time.  The parameter values of the model are not changed.
+
+        Parameters
+        ----------
+        x : array-like, shape [n_points, n_params]
+            Each row is a complete vector of parameter values, in the
+            order of `pnames`.
+        return_gradient : bool, default False
+            Whether to also compute the gradient at each point.
+
+        Returns
+        -------
+        dictx
+            The log likelihood at each point is given by key 'll', and if
+            `return_gradient` the gradients by key 'dll', as an array of
+            shape [n_points, n_params].
+        """
+        if self._case_stream is not None or self._shard_pool is not None:
+            # each pass reads the whole stream or visits every shard, so
+            # the points are evaluated one at a time
+            return super().loglike_multi(x, return_gradient=return_gradient)
+        args = _kernel_args(self.__prepare_for_compute(param_dtype=np.float64))
+        points = np.array(x, dtype=np.float64, ndmin=2, order='C')
+        if points.ndim != 2 or points.shape[1] != len(self._frame):
+            raise ValueError(f'x must have shape [n_points, {len(self._frame)}], not {points.shape}')
+        return_flags = np.asarray([0, 0, return_gradient, 0], dtype=np.int8)
+        n_cases = args.data.ca.shape[0]
+        n_blocks = max(min(n_cases, numba.get_num_threads() * 4), 1)
+        with np.errstate(divide='ignore', over='ignore', ):
+            loglike, d_loglike = _numba_master_reduced_multi(
+                args.fixed, args.holdfast, points, args.data, return_flags, n_blocks,
+            )
+        if self.constraint_intensity:
+            current_values = self.pvals.copy()
+            try:
+                for j in range(points.shape[0]):
+                    penalty, dpenalty, dpenalty_binding = self.constraint_penalty(points[j])
+                    loglike[j] += penalty * n_cases
+                    d_loglike[j] += dpenalty * n_cases
+            finally:
+                self.set_values(current_values)
+        result = dictx(ll=loglike * self.dataframes.weight_normalization)
+        if return_gradient:
+            result['dll'] = d_loglike * self.dataframes.weight_normalization
+        best = int(np.argmax(result.ll))
+        self._check_if_best(result.ll[best], points[best])
+        return result
+
     def loglike2(
             self,
             x=None,
@@ -1437,17 +3301,30 @@ class NumbaModel(_BaseModel):
             return_series=True,
             probability_only=False,
     ):
+        from ..model.persist_flags import PERSIST_LOGLIKE_CASEWISE, PERSIST_D_LOGLIKE_CASEWISE
+        casewise = bool(persist & (PERSIST_LOGLIKE_CASEWISE | PERSIST_D_LOGLIKE_CASEWISE))
         result_arrays, penalty = self._loglike_runner(
             x,
             start_case=start_case,
             stop_case=stop_case,
             step_case=step_case,
             return_gradient=True,
+            reduced=not casewise,
         )
-        result = dictx(
-            ll=result_arrays.loglike.sum() * self.dataframes.weight_normalization,
-            dll=result_arrays.d_loglike.sum(0) * self.dataframes.weight_normalization,
-        )
+        if casewise:
+            result = dictx(
+                ll=result_arrays.loglike.sum(dtype=np.float64) * self.dataframes.weight_normalization,
+                dll=result_arrays.d_loglike.sum(0, dtype=np.float64) * self.dataframes.weight_normalization,
+            )
+            if persist & PERSIST_LOGLIKE_CASEWISE:
+                result['ll_casewise'] = result_arrays.loglike * self.dataframes.weight_normalization
+            if persist & PERSIST_D_LOGLIKE_CASEWISE:
+                result['dll_casewise'] = result_arrays.d_loglike * self.dataframes.weight_normalization
+        else:
+            result = dictx(
+                ll=result_arrays.loglike * self.dataframes.weight_normalization,
+                dll=result_arrays.d_loglike * self.dataframes.weight_normalization,
+            )
         if start_case is None and stop_case is None and step_case is None:
             self._check_if_best(result.ll)
         if return_series:
@@ -1465,6 +3342,8 @@ class NumbaModel(_BaseModel):
             persist=0,
             leave_out=-1, keep_only=-1, subsample=-1,
     ):
+        from ..model.persist_flags import PERSIST_LOGLIKE_CASEWISE, PERSIST_D_LOGLIKE_CASEWISE
+        casewise = bool(persist & (PERSIST_LOGLIKE_CASEWISE | PERSIST_D_LOGLIKE_CASEWISE))
         result_arrays, penalty = self._loglike_runner(
             x,
             start_case=start_case,
@@ -1472,17 +3351,24 @@ class NumbaModel(_BaseModel):
             step_case=step_case,
             return_gradient=True,
             return_bhhh=True,
+            reduced=not casewise,
         )
-        result = dictx(
-            ll=result_arrays.loglike.sum() * self.dataframes.weight_normalization,
-            dll=result_arrays.d_loglike.sum(0) * self.dataframes.weight_normalization,
-            bhhh=result_arrays.bhhh.sum(0) * self.dataframes.weight_normalization,
-        )
-        from ..model.persist_flags import PERSIST_LOGLIKE_CASEWISE, PERSIST_D_LOGLIKE_CASEWISE
-        if persist & PERSIST_LOGLIKE_CASEWISE:
-            result['ll_casewise'] = result_arrays.loglike * self.dataframes.weight_normalization
-        if persist & PERSIST_D_LOGLIKE_CASEWISE:
-            result['dll_casewise'] = result_arrays.d_loglike * self.dataframes.weight_normalization
+        if casewise:
+            result = dictx(
+                ll=result_arrays.loglike.sum(dtype=np.float64) * self.dataframes.weight_normalization,
+                dll=result_arrays.d_loglike.sum(0, dtype=np.float64) * self.dataframes.weight_normalization,
+                bhhh=result_arrays.bhhh.sum(0, dtype=np.float64) * self.dataframes.weight_normalization,
+            )
+            if persist & PERSIST_LOGLIKE_CASEWISE:
+                result['ll_casewise'] = result_arrays.loglike * self.dataframes.weight_normalization
+            if persist & PERSIST_D_LOGLIKE_CASEWISE:
+                result['dll_casewise'] = result_arrays.d_loglike * self.dataframes.weight_normalization
+        else:
+            result = dictx(
+                ll=result_arrays.loglike * self.dataframes.weight_normalization,
+                dll=result_arrays.d_loglike * self.dataframes.weight_normalization,
+                bhhh=result_arrays.bhhh * self.dataframes.weight_normalization,
+            )
         if start_case is None and stop_case is None and step_case is None:
             self._check_if_best(result.ll)
         if return_series:
@@ -1493,6 +3379,146 @@ class NumbaModel(_BaseModel):
         result['penalty'] = penalty
         return result
 
+    def reference_loglike2_bhhh(self, x=None, block_size=100_000):
+        """
+        Compute the log likelihood, gradient and BHHH entirely in float64.
+
+        When the model uses a `float_dtype` of float32, the stored data is
+        converted to float64 one block of cases at a time, so this needs
+        only a little extra memory.  Use it to check that an estimation run
+        in reduced precision has converged: the 'tolerance' in the result is
+        the BHHH convergence tolerance at `x`, computed in float64 on the
+        same data.
+
+        Parameters
+        ----------
+        x : {'null', 'init', 'best', array-like, dict, scalar}, optional
+            Values for the parameters.  See :ref:`set_values` for details.
+        block_size : int, default 100_000
+            The number of cases converted to float64 at a time.  This is
+            ignored if a case stream is set, which uses its own blocks.
+
+        Returns
+        -------
+        dictx
+            With keys 'll', 'dll', 'bhhh' and 'tolerance'.
+        """
+        if self._shard_pool is not None:
+            raise ValueError('the reference loglike is not available with a shard pool')
+        args = _kernel_args(self.__prepare_for_compute(x, param_dtype=np.float64))
+        args = args._replace(
+            fixed=FixedArrays(*(
+                np.asarray(a, dtype=np.float64) if a.dtype.kind == 'f' else a
+                for a in args.fixed
+            )),
+            return_flags=np.asarray([0, False, True, True], dtype=np.int8),
+        )
+
+        def float64_blocks():
+            if self._case_stream is not None:
+                for block in self._case_stream.blocks():
+                    yield self._stream_data_arrays(block)
+            else:
+                data_arrays = args.data
+                n_cases = data_arrays.ca.shape[0]
+                for start in range(0, n_cases, block_size):
+                    yield data_arrays.cs[start:start+block_size]
+
+        loglike = 0.0
+        d_loglike = bhhh = 0
+        n_cases = 0
+        with np.errstate(divide='ignore', over='ignore', ):
+            for data_arrays in float64_blocks():
+                data_arrays = DataArrays(*(
+                    np.asarray(a, dtype=np.float64) if a.dtype.kind == 'f' else a
+                    for a in data_arrays
+                ))
+                block_results = self._run_reduced_in_memory(args._replace(data=data_arrays))
+                loglike += block_results[0][0]
+                d_loglike = d_loglike + block_results[1]
+                bhhh = bhhh + block_results[2]
+                n_cases += data_arrays.ca.shape[0]
+            if self.constraint_intensity:
+                penalty, dpenalty, dpenalty_binding = self.constraint_penalty()
+                loglike += penalty * n_cases
+                bhhh = self._penalized_bhhh(bhhh, d_loglike, dpenalty, n_cases)
+                d_loglike = d_loglike + dpenalty * n_cases
+        from .optimization import propose_direction
+        freedoms = (self.pf.holdfast == 0).to_numpy()
+        direction = propose_direction(bhhh, d_loglike, freedoms)
+        w = self.dataframes.weight_normalization
+        return dictx(
+            ll=loglike * w,
+            dll=d_loglike * w,
+            bhhh=bhhh * w,
+            tolerance=np.dot(direction, d_loglike),
+        )
+
+    def loglike3(
+            self,
+            x=None,
+            *,
+            start_case=None,
+            stop_case=None,
+            step_case=None,
+            leave_out=-1,
+            keep_only=-1,
+            subsample=-1,
+            return_series=False,
+            return_bhhh=False,
+    ):
+        """
+        Compute a log likelihood value, its first derivative, and its second derivative.
+
+        Unlike the finite-difference approximation used by other models, the
+        second derivative here is exact, and is accumulated across cases in
+        the same pass of the kernel as the log likelihood and gradient.
+        Derivatives with respect to holdfast parameters are reported as zero.
+
+        Parameters
+        ----------
+        return_bhhh : bool, default False
+            Also compute the BHHH matrix in the same pass, under key 'bhhh'.
+
+        Returns
+        -------
+        dictx
+            The log likelihood is given by key 'll', the first derivative by
+            key 'dll', and the second derivative by 'd2ll'.
+        """
+        result_arrays, penalty = self._loglike_runner(
+            x,
+            start_case=start_case,
+            stop_case=stop_case,
+            step_case=step_case,
+            return_gradient=True,
+            return_bhhh=return_bhhh,
+            reduced=True,
+            return_hessian=True,
+        )
+        holdfast = self._frame.holdfast.to_numpy() != 0
+        d2ll = result_arrays.d2_loglike * self.dataframes.weight_normalization
+        d2ll[holdfast, :] = 0.0
+        d2ll[:, holdfast] = 0.0
+        result = dictx(
+            ll=result_arrays.loglike * self.dataframes.weight_normalization,
+            dll=result_arrays.d_loglike * self.dataframes.weight_normalization,
+            d2ll=d2ll,
+        )
+        if return_bhhh:
+            result['bhhh'] = result_arrays.bhhh * self.dataframes.weight_normalization
+        if start_case is None and stop_case is None and step_case is None:
+            self._check_if_best(result.ll)
+        if return_series:
+            result['dll'] = pd.Series(result['dll'], index=self._frame.index, )
+            for k in ('d2ll', 'bhhh'):
+                if k in result:
+                    result[k] = pd.DataFrame(
+                        result[k], index=self._frame.index, columns=self._frame.index
+                    )
+        result['penalty'] = penalty
+        return result
+
     def d2_loglike(
             self,
             x=None,
@@ -1504,7 +3530,16 @@ class NumbaModel(_BaseModel):
             keep_only=-1,
             subsample=-1,
     ):
-        return super().d2_loglike(
+        """
+        Compute the exact second derivative of log likelihood with respect to the parameters.
+
+        See `loglike3` for details.
+
+        Returns
+        -------
+        ndarray
+        """
+        return self.loglike3(
             x=x,
             start_case=start_case,
             stop_case=stop_case,
@@ -1512,7 +3547,7 @@ class NumbaModel(_BaseModel):
             leave_out=leave_out,
             keep_only=keep_only,
             subsample=subsample,
-        )
+        ).d2ll
 
     def neg_loglike(
             self,
@@ -1655,6 +3690,9 @@ class NumbaModel(_BaseModel):
     def __getstate__(self):
         state = dict(
             float_dtype=self.float_dtype,
+            repack_data=self.repack_data,
+            compact_data=self.compact_data,
+            cache_utility=self.cache_utility,
             constraint_intensity=self.constraint_intensity,
             constraint_sharpness=self.constraint_sharpness,
             _constraint_funcs=self._constraint_funcs,
@@ -1663,8 +3701,17 @@ class NumbaModel(_BaseModel):
 
     def __setstate__(self, state):
         self.float_dtype = state[1]['float_dtype']
+        self._repack_data = state[1].get('repack_data', True)
+        self._compact_data = state[1].get('compact_data', False)
+        self._compact_arrays = None
+        self._ce_arrays = None
+        self._data_columns = None
+        self.cache_utility = state[1].get('cache_utility', True)
+        self._utility_cache = None
         self.constraint_intensity = state[1]['constraint_intensity']
         self.constraint_sharpness = state[1]['constraint_sharpness']
         self._constraint_funcs = state[1]['_constraint_funcs']
+        self._case_stream = None
+        self._shard_pool = None
         super().__setstate__(state[0])
 
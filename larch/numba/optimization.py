@@ -40,6 +40,7 @@ def fit_bhhh(
         max_constraint_sharpness=1e6,
         jumpstart=0,
         jumpstart_split=5,
+        line_search_points=1,
 ):
     """
     Makes a series of steps using the BHHH algorithm.
@@ -48,6 +49,13 @@ def fit_bhhh(
     ----------
     steplen: float
     logger: logging.Logger
+    line_search_points: int, default 1
+        The number of step lengths to try at once, each half the one
+        before, using `model.loglike_multi`.  The longest step that
+        improves the log likelihood is taken.  With the default of 1,
+        step lengths are tried one at a time, as they also are when
+        `leave_out`, `keep_only` or `subsample` is given, or the model
+        streams its cases or has a shard pool.
 
     Returns
     -------
@@ -99,6 +107,15 @@ def fit_bhhh(
 
     direction, tolerance = find_direction(current_dll, current_bhhh)
 
+    # `loglike_multi` is not available for subsets of cases, streamed
+    # cases or a shard pool, so step lengths are then tried one at a time
+    batched_line_search = (
+        line_search_points > 1
+        and leave_out == -1 and keep_only == -1 and subsample == -1
+        and getattr(model, '_case_stream', None) is None
+        and getattr(model, '_shard_pool', None) is None
+    )
+
     message = "Optimization terminated for undetermined reason."
 
     while True:
@@ -125,18 +142,36 @@ def fit_bhhh(
         iter += 1
         if steps:
             steplen = min(2.0*sum(steps[-momentum:]) / len(steps[-momentum:]), maximum_steplen)
-        while True:
+        if batched_line_search:
+            while True:
+                steplens = steplen * 0.5 ** np.arange(line_search_points)
+                trial_ll = model.loglike_multi(current_pvals + np.outer(steplens, direction)).ll
+                improved = np.flatnonzero(trial_ll > current_ll)
+                if improved.size:
+                    steplen = steplens[improved[0]]
+                    break
+                logger.debug(f"failed simple steps bhhh {steplens[0]} to {steplens[-1]}")
+                steplen = steplens[-1] * 0.5
+                if steplen < minimum_steplen:
+                    break
             model.set_values(current_pvals + direction * steplen)
             proposed = model.loglike2_bhhh(
                 leave_out=leave_out, keep_only=keep_only, subsample=subsample,
             )
             proposed_ll = proposed.ll
-            if proposed_ll > current_ll:
-                break
-            logger.debug(f"failed simple step bhhh {steplen}, degraded {current_ll - proposed_ll}")
-            steplen *= 0.5
-            if steplen < minimum_steplen:
-                break
+        else:
+            while True:
+                model.set_values(current_pvals + direction * steplen)
+                proposed = model.loglike2_bhhh(
+                    leave_out=leave_out, keep_only=keep_only, subsample=subsample,
+                )
+                proposed_ll = proposed.ll
+                if proposed_ll > current_ll:
+                    break
+                logger.debug(f"failed simple step bhhh {steplen}, degraded {current_ll - proposed_ll}")
+                steplen *= 0.5
+                if steplen < minimum_steplen:
+                    break
         if proposed_ll <= current_ll:
             logger.debug("no improvement found, reset to prior x")
             model.set_values(current_pvals)
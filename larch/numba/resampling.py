@@ -0,0 +1,199 @@
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import warnings
+import numpy as np
+from ..util.shared_memory import share_arrays, attach_arrays, release_blocks
+
+# the arrays attached by each worker process, see `_attach`
+_worker_arrays = {}
+
+
+def _attach(fixed_args, specs, weight_normalization, n_threads):
+    """
+    Initialize a worker process, mapping the shared data arrays.
+    """
+    if n_threads:
+        import numba
+        numba.set_num_threads(n_threads)
+    blocks, data = attach_arrays(specs)
+    _worker_arrays.update(
+        blocks=blocks,
+        fixed_args=fixed_args,
+        data=data,
+        weight_normalization=weight_normalization,
+    )
+
+
+def _weighted_loglike(x, wt, return_gradient=True):
+    import numba
+    from .model import _numba_master_reduced, DataArrays
+    fixed, holdfast_arr = _worker_arrays['fixed_args']
+    ch, av, _, co, ca = _worker_arrays['data']
+    return_flags = np.asarray([0, 0, return_gradient, 0], dtype=np.int8)
+    n_blocks = max(min(ch.shape[0], numba.get_num_threads() * 4), 1)
+    with np.errstate(divide='ignore', over='ignore', ):
+        ll, dll, _ = _numba_master_reduced(
+            fixed, holdfast_arr, np.asarray(x, dtype=np.float64),
+            DataArrays(ch, av, wt, co, ca), return_flags, n_blocks,
+        )
+    scale = _worker_arrays['weight_normalization']
+    return ll[0] * scale, dll * scale
+
+
+def _fit_weighted(x0, bounds, wt, options):
+    """
+    Maximize the log likelihood with the given case weights, from `x0`.
+    """
+    from scipy.optimize import minimize
+
+    def objective(x):
+        ll, dll = _weighted_loglike(x, wt)
+        return -ll, -dll
+
+    result = minimize(
+        objective, x0, jac=True, method='L-BFGS-B', bounds=bounds, options=options,
+    )
+    return result.x, -result.fun, result.success
+
+
+def _fit_fold(x0, bounds, fold, cv, options):
+    wt = _worker_arrays['data'][2]
+    holdout = (np.arange(wt.shape[0]) % cv) == fold
+    x, ll, success = _fit_weighted(x0, bounds, np.where(holdout, 0, wt).astype(wt.dtype), options)
+    holdout_ll = _weighted_loglike(x, np.where(holdout, wt, 0).astype(wt.dtype), return_gradient=False)[0]
+    return x, holdout_ll, success
+
+
+def _fit_bootstrap(x0, bounds, seed, options):
+    wt = _worker_arrays['data'][2]
+    n_cases = wt.shape[0]
+    counts = np.random.default_rng(seed).multinomial(n_cases, np.full(n_cases, 1.0 / n_cases))
+    x, ll, success = _fit_weighted(x0, bounds, (wt * counts).astype(wt.dtype), options)
+    return x, ll, success
+
+
+def _warn_failures(label, success):
+    failed = [i for i, ok in enumerate(success) if not ok]
+    if failed:
+        warnings.warn(
+            f'estimation did not converge for {len(failed)} of {len(success)} '
+            f'resampled fits ({label} {", ".join(str(i) for i in failed[:10])}'
+            f'{", ..." if len(failed) > 10 else ""})',
+            stacklevel=3,
+        )
+
+
+class ResamplingPool:
+    """
+    A pool of worker processes that re-estimate a NumbaModel on reweighted cases.
+
+    The data arrays of the model are copied once into shared memory,
+    which every worker maps, so no worker holds its own copy of the data.
+    Each job is a re-estimation of the model, starting from the current
+    parameter values, with case weights that leave out a cross
+    validation fold or draw a bootstrap sample.
+
+    The workers maximize the log likelihood with L-BFGS-B, honoring the
+    parameter bounds and holdfast flags.  Other constraints are not
+    supported.
+
+    Parameters
+    ----------
+    model : NumbaModel
+        The model, with data loaded.
+    n_workers : int, optional
+        The number of worker processes.  Defaults to the number of CPUs.
+    options : dict, optional
+        Options passed to `scipy.optimize.minimize` in the workers.
+    """
+
+    def __init__(self, model, n_workers=None, options=None):
+        fixed_args, data_arrays = model._resampling_arrays()
+        self.names = model.pf.index.copy()
+        self.x0 = model.pvals.astype(np.float64)
+        holdfast = model.pf.holdfast.to_numpy() != 0
+        self.bounds = [
+            (x, x) if fix else (lo if np.isfinite(lo) else None, hi if np.isfinite(hi) else None)
+            for x, fix, lo, hi in zip(
+                self.x0, holdfast, model.pf.minimum.to_numpy(), model.pf.maximum.to_numpy(),
+            )
+        ]
+        self.options = options
+        n_workers = n_workers or os.cpu_count() or 1
+        self._blocks, specs = share_arrays(data_arrays)
+        try:
+            self._executor = ProcessPoolExecutor(
+                max_workers=n_workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_attach,
+                initargs=(
+                    fixed_args,
+                    specs,
+                    model.dataframes.weight_normalization,
+                    max((os.cpu_count() or 1) // n_workers, 1),
+                ),
+            )
+        except:
+            release_blocks(self._blocks)
+            raise
+
+    def cross_validate(self, cv=5):
+        """
+        Estimate the model on each of `cv` folds, leaving out the cases in the fold.
+
+        Case `c` is in fold `c % cv`, as for `leave_out` and `subsample`.
+
+        Returns
+        -------
+        estimates : ndarray, shape [cv, n_params]
+            A warning is issued for any fold whose estimation did not
+            converge.
+        holdout_loglike : ndarray, shape [cv]
+            The log likelihood of the cases in each fold, at the
+            estimates made without them.
+        """
+        futures = [
+            self._executor.submit(_fit_fold, self.x0, self.bounds, fold, cv, self.options)
+            for fold in range(cv)
+        ]
+        results = [f.result() for f in futures]
+        _warn_failures('fold', [r[2] for r in results])
+        return np.stack([r[0] for r in results]), np.asarray([r[1] for r in results])
+
+    def bootstrap(self, n_replicates=100, seed=None):
+        """
+        Estimate the model on bootstrap samples of cases.
+
+        Each sample is drawn by giving every case a weight multiplier,
+        the number of times it is drawn with replacement, so no data is
+        copied.
+
+        Returns
+        -------
+        estimates : ndarray, shape [n_replicates, n_params]
+            A warning is issued for any replicate whose estimation did
+            not converge.
+        """
+        seeds = np.random.SeedSequence(seed).spawn(n_replicates)
+        futures = [
+            self._executor.submit(_fit_bootstrap, self.x0, self.bounds, s, self.options)
+            for s in seeds
+        ]
+        results = [f.result() for f in futures]
+        _warn_failures('bootstrap replicate', [r[2] for r in results])
+        return np.stack([r[0] for r in results])
+
+    def close(self):
+        """Shut down the workers and release the shared memory."""
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+            release_blocks(self._blocks)
+            self._blocks = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,302 @@
+import numpy as np
+import pandas as pd
+from typing import NamedTuple
+from numba import njit, prange
+
+
+@njit(parallel=True, cache=True)
+def _draw_alternatives(
+        cum_prob,     # float input shape=[n_cases, n_alts]
+        uniforms,     # float input shape=[n_cases, n_sample]
+        chosen,       # int input shape=[n_cases]
+        alt_index,    # int output shape=[n_cases, n_sample+1]
+        pick_count,   # int output shape=[n_cases, n_sample+1]
+):
+    n_cases, n_alts = cum_prob.shape
+    n_sample = uniforms.shape[1]
+    for c in prange(n_cases):
+        n_unique = 0
+        if cum_prob[c, n_alts-1] > 0:
+            for s in range(n_sample):
+                a = np.searchsorted(cum_prob[c], uniforms[c, s] * cum_prob[c, n_alts-1])
+                if a >= n_alts:
+                    a = n_alts - 1
+                found = -1
+                for k in range(n_unique):
+                    if alt_index[c, k] == a:
+                        found = k
+                        break
+                if found >= 0:
+                    pick_count[c, found] += 1
+                else:
+                    alt_index[c, n_unique] = a
+                    pick_count[c, n_unique] = 1
+                    n_unique += 1
+        if chosen[c] >= 0:
+            found = -1
+            for k in range(n_unique):
+                if alt_index[c, k] == chosen[c]:
+                    found = k
+                    break
+            if found < 0:
+                alt_index[c, n_unique] = chosen[c]
+                pick_count[c, n_unique] = 1
+            else:
+                pick_count[c, found] += 1
+
+
+_BLOCK_BYTES = 1 << 25
+
+
+def _ca_block(dataframes, lo, hi, columns=None):
+    """
+    The idca data for cases `lo` to `hi`, as a dense float64 array.
+
+    Only the rows for these cases are copied, from either the idca or
+    the idce data; alternatives missing from idce data are zeros.
+
+    Returns
+    -------
+    float64 array, shape [hi-lo, n_alts, n_vars]
+    """
+    n_alts = dataframes.n_alts
+    if dataframes.data_ca is not None:
+        rows = dataframes.data_ca.iloc[lo*n_alts:hi*n_alts]
+        if columns is not None:
+            rows = rows[columns]
+        return rows.to_numpy(dtype=np.float64).reshape(hi-lo, n_alts, -1)
+    frame = dataframes.data_ce
+    if frame is None:
+        return np.zeros([hi-lo, n_alts, 0 if columns is None else len(columns)])
+    caseindexes = dataframes.array_ce_caseindexes
+    r0, r1 = np.searchsorted(caseindexes, [lo, hi])
+    rows = frame.iloc[r0:r1]
+    if columns is not None:
+        rows = rows[columns]
+    block = np.zeros([hi-lo, n_alts, rows.shape[1]])
+    block[caseindexes[r0:r1] - lo, dataframes.array_ce_altindexes[r0:r1]] = rows.to_numpy(dtype=np.float64)
+    return block
+
+
+@njit(parallel=True, cache=True)
+def _gather_sampled(
+        array_ca,     # float input shape=[n_cases, n_alts, n_vars]
+        alt_index,    # int input shape=[n_cases, n_slots]
+        result,       # float output shape=[n_cases, n_slots, n_vars]
+):
+    for c in prange(alt_index.shape[0]):
+        for k in range(alt_index.shape[1]):
+            a = alt_index[c, k]
+            if a >= 0:
+                result[c, k, :] = array_ca[c, a, :]
+
+
+class SampledAlternatives(NamedTuple):
+    """
+    A sample of alternatives drawn for each case.
+
+    The `dataframes` hold compact data with one pseudo-alternative per
+    sampled slot, so that models estimated on them run the kernel over
+    `[n_cases, n_slots, n_vars]` arrays instead of the full choice set.
+    """
+
+    dataframes: object
+    """DataFrames : Compact data, with alternative codes 1 to n_slots."""
+
+    alt_index: np.ndarray
+    """int32 array [n_cases, n_slots] : Position of the sampled alternative
+    in the full choice set, or -1 for unused slots."""
+
+    pick_count: np.ndarray
+    """int32 array [n_cases, n_slots] : Number of times each alternative was drawn,
+    plus one for the chosen alternative."""
+
+    sampling_probability: np.ndarray
+    """float array [n_cases, n_slots] : Probability of drawing each alternative in one draw."""
+
+    correction_name: str = '_sampling_correction_'
+
+    def apply_to(self, model):
+        """
+        Set up a model to be estimated on the sampled alternatives.
+
+        The sampling correction is added to the utility function with a
+        parameter locked at 1, the nesting graph is reset to a MNL over
+        the sampled slots, and the compact dataframes are attached.
+
+        Parameters
+        ----------
+        model : NumbaModel
+
+        Raises
+        ------
+        ValueError
+            If the model has any idco utility terms, which are specific to
+            alternatives and cannot be mapped onto sampled slots, or if the
+            model has nests, for which this correction is not valid.
+        """
+        from ..roles import P, X
+        if len(model.utility_co):
+            raise ValueError('sampled alternatives cannot be used with utility_co terms')
+        if model._graph is not None and len(model._graph) > model._graph.n_elementals() + 1:
+            raise ValueError('sampled alternatives can only be used with MNL models')
+        if self.correction_name not in {str(i.data) for i in model.utility_ca}:
+            model.utility_ca = model.utility_ca + P(self.correction_name) * X(self.correction_name)
+        model.graph = None
+        model.dataframes = self.dataframes
+        model.lock_value(self.correction_name, 1.0)
+        return model
+
+
+def sample_alternatives(
+        dataframes,
+        n_sample,
+        sampling_weights=None,
+        seed=None,
+        correction_name='_sampling_correction_',
+):
+    """
+    Draw a sample of alternatives for each case with known probabilities.
+
+    Alternatives are drawn with replacement, with probability proportional
+    to `sampling_weights` among the available alternatives.  Duplicate
+    draws are combined, and the chosen alternative is always included
+    with one more pick than the number of times it was drawn.  Each
+    sampled alternative gets the McFadden sampling correction
+    log(pick_count / (n_sample * sampling_probability)) as an extra idca
+    variable, which is added to utility by `SampledAlternatives.apply_to`.
+
+    The data are read one block of cases at a time, so no array with a
+    row for every case and alternative is built.
+
+    Parameters
+    ----------
+    dataframes : DataFrames
+        The full data, with at most one chosen alternative per case.
+    n_sample : int
+        Number of draws per case.
+    sampling_weights : array-like or str, optional
+        Relative sampling weights, either as an array of shape [n_alts]
+        or [n_cases, n_alts], or as the name of an idca variable.  If not
+        given, all available alternatives are equally likely.
+    seed : int, optional
+        Seed for the random number generator.
+    correction_name : str, default '_sampling_correction_'
+        Name for the sampling correction variable and its parameter.
+
+    Returns
+    -------
+    SampledAlternatives
+    """
+    from ..dataframes import DataFrames
+    n_cases = dataframes.n_cases
+    n_alts = dataframes.n_alts
+    ca_frame = dataframes.data_ca_or_ce
+    ca_columns = ca_frame.columns if ca_frame is not None else pd.Index([])
+    n_vars = len(ca_columns)
+    if sampling_weights is not None and not isinstance(sampling_weights, str):
+        sampling_weights = np.broadcast_to(
+            np.asarray(sampling_weights, dtype=np.float64), (n_cases, n_alts),
+        )
+
+    # Cases are processed in blocks, so that only the output arrays are
+    # the size of the whole data.
+    block_cases = max(1, _BLOCK_BYTES // (8 * n_alts * (n_vars + 3)))
+    blocks = [(lo, min(lo + block_cases, n_cases)) for lo in range(0, n_cases, block_cases)]
+
+    rng = np.random.default_rng(seed)
+    alt_index = np.full([n_cases, n_sample+1], -1, dtype=np.int32)
+    pick_count = np.zeros([n_cases, n_sample+1], dtype=np.int32)
+    sampling_probability = np.zeros([n_cases, n_sample+1], dtype=np.float64)
+    for lo, hi in blocks:
+        if sampling_weights is None:
+            weights = np.ones([hi-lo, n_alts], dtype=np.float64)
+        elif isinstance(sampling_weights, str):
+            weights = _ca_block(dataframes, lo, hi, [sampling_weights])[:, :, 0]
+        else:
+            weights = np.array(sampling_weights[lo:hi])
+        if dataframes.data_av is not None:
+            weights *= dataframes.data_av.iloc[lo:hi].to_numpy() != 0
+        cum_prob = np.cumsum(weights, axis=1)
+        total = cum_prob[:, -1:]
+
+        if dataframes.data_ch is not None:
+            array_ch = dataframes.data_ch.iloc[lo:hi].to_numpy()
+            chosen = np.where(array_ch.any(axis=1), array_ch.argmax(axis=1), -1).astype(np.int32)
+        else:
+            chosen = np.full(hi-lo, -1, dtype=np.int32)
+        has_choice = np.flatnonzero(chosen >= 0)
+        if np.any(weights[has_choice, chosen[has_choice]] <= 0):
+            raise ValueError('some chosen alternatives have zero sampling probability')
+
+        _draw_alternatives(
+            cum_prob, rng.random([hi-lo, n_sample]), chosen, alt_index[lo:hi], pick_count[lo:hi],
+        )
+        valid = alt_index[lo:hi] >= 0
+        rows = np.arange(hi-lo)[:, np.newaxis]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            sampling_probability[lo:hi] = np.where(
+                valid, weights[rows, np.where(valid, alt_index[lo:hi], 0)] / total, 0.0,
+            )
+
+    n_slots = max(int((alt_index >= 0).sum(1).max()), 1)
+    alt_index = alt_index[:, :n_slots]
+    pick_count = pick_count[:, :n_slots]
+    sampling_probability = sampling_probability[:, :n_slots]
+    valid = alt_index >= 0
+
+    compact_ca = np.zeros([n_cases, n_slots, n_vars+1], dtype=np.float64)
+    compact_ch = np.zeros([n_cases, n_slots], dtype=np.float64)
+    for lo, hi in blocks:
+        _gather_sampled(_ca_block(dataframes, lo, hi), alt_index[lo:hi], compact_ca[lo:hi, :, :-1])
+        if dataframes.data_ch is not None:
+            block_valid = valid[lo:hi]
+            compact_ch[lo:hi] = np.where(
+                block_valid,
+                dataframes.data_ch.iloc[lo:hi].to_numpy()[
+                    np.arange(hi-lo)[:, np.newaxis], np.where(block_valid, alt_index[lo:hi], 0)
+                ],
+                0.0,
+            )
+    with np.errstate(divide='ignore'):
+        compact_ca[:, :, -1] = np.where(
+            valid,
+            np.log(np.maximum(pick_count, 1)) - np.log(n_sample * np.where(valid, sampling_probability, 1.0)),
+            0.0,
+        )
+
+    caseindex = dataframes.caseindex
+    slot_codes = np.arange(1, n_slots+1)
+    kwargs = dict(
+        ca=pd.DataFrame(
+            compact_ca.reshape(-1, compact_ca.shape[2]),
+            columns=list(ca_columns) + [correction_name],
+            index=pd.MultiIndex.from_product(
+                [caseindex, slot_codes], names=[caseindex.name or '_caseid_', '_altid_'],
+            ),
+        ),
+        av=pd.DataFrame(valid.astype(np.int8), columns=slot_codes, index=caseindex),
+    )
+    if dataframes.data_co is not None:
+        kwargs['co'] = dataframes.data_co
+    if dataframes.data_ch is not None:
+        kwargs['ch'] = pd.DataFrame(
+            compact_ch,
+            columns=slot_codes,
+            index=caseindex,
+        )
+    if dataframes.data_wt is not None:
+        kwargs['wt'] = dataframes.data_wt
+    compact = DataFrames(
+        alt_codes=slot_codes,
+        alt_names=[f'sample_{i}' for i in slot_codes],
+        **kwargs,
+    )
+    compact.weight_normalization = dataframes.weight_normalization
+    return SampledAlternatives(
+        compact,
+        alt_index,
+        pick_count,
+        sampling_probability,
+        correction_name,
+    )
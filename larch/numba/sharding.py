@@ -0,0 +1,263 @@
+import os
+import multiprocessing
+from multiprocessing.connection import Client, Listener
+import numpy as np
+
+_DATA_SEGMENTS = ('co', 'ca', 'ce', 'av', 'ch', 'wt')
+
+
+def _dataframes_parts(dataframes):
+    """
+    The pandas parts of a DataFrames, which unlike the DataFrames can be pickled.
+    """
+    parts = dict(
+        alt_codes=dataframes.alternative_codes(),
+        alt_names=dataframes.alternative_names(),
+    )
+    for seg in _DATA_SEGMENTS:
+        data = getattr(dataframes, f'data_{seg}')
+        if data is not None:
+            parts[seg] = data
+    return parts, dataframes.weight_normalization
+
+
+def _dataframes_from_parts(parts, weight_normalization):
+    from ..dataframes import DataFrames
+    result = DataFrames(**parts)
+    result.weight_normalization = weight_normalization
+    return result
+
+
+def _serve(conn, dataframes=None, n_threads=None):
+    """
+    Answer requests from a ShardPool on one connection, until it is closed.
+    """
+    if n_threads:
+        import numba
+        numba.set_num_threads(n_threads)
+    model = None
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            return
+        command = message[0]
+        try:
+            if command == 'data':
+                dataframes = _dataframes_from_parts(*message[1:])
+                if model is not None:
+                    model.dataframes = dataframes
+                result = dataframes.n_cases
+            elif command == 'model':
+                model = message[1]
+                model.constraint_intensity = 0.0
+                if dataframes is None:
+                    raise ValueError('shard has no data')
+                model.dataframes = dataframes
+                result = dataframes.n_cases
+            elif command == 'evaluate':
+                if model is None:
+                    raise ValueError('shard has no model')
+                result = model._evaluate_reduced(*message[1:])
+            elif command == 'close':
+                conn.close()
+                return
+            else:
+                raise ValueError(f'unknown command {command!r}')
+        except Exception as err:
+            conn.send(('error', err))
+        else:
+            conn.send(('ok', result))
+
+
+def _check_authkey(authkey):
+    """
+    Require a secret for a shard connection over the network.
+
+    Connections exchange pickles, which can run arbitrary code when
+    loaded, so a listener without a secret would let anyone who can
+    reach its port run code on its host.
+    """
+    if not isinstance(authkey, bytes) or len(authkey) == 0:
+        raise ValueError('authkey must be non-empty bytes, e.g. from os.urandom(32)')
+
+
+def _local_shard(conn, n_threads):
+    _serve(conn, n_threads=n_threads)
+
+
+def serve_shard(address, authkey, dataframes=None, n_threads=None):
+    """
+    Run a shard server for a ShardPool on another host.
+
+    The server accepts one connection from a ShardPool at a time, and
+    evaluates the model it is sent over its data until the pool closes
+    the connection.
+
+    Parameters
+    ----------
+    address : tuple
+        The (host, port) on which to listen.
+    authkey : bytes
+        The shared secret the ShardPool must present, which must not be
+        empty.  Use a random one, e.g. from `os.urandom(32)`.
+    dataframes : DataFrames, optional
+        The data for this shard.  If given, the data stays on this host,
+        and the pool must be loaded with `send_data=False`.  Otherwise
+        the pool sends a share of the data when it is loaded.
+    n_threads : int, optional
+        The number of threads numba uses on this host.
+
+    Raises
+    ------
+    ValueError
+        If `authkey` is not non-empty bytes.
+    """
+    _check_authkey(authkey)
+    with Listener(address, authkey=authkey) as listener:
+        while True:
+            with listener.accept() as conn:
+                _serve(conn, dataframes, n_threads)
+
+
+class ShardPool:
+    """
+    Evaluate the log likelihood of a NumbaModel over shards of cases held by workers.
+
+    Each worker keeps its share of the cases in memory, and for each
+    evaluation receives only the parameter values, and returns its
+    partial sums of the loglike, gradient and BHHH matrix (or hessian).
+    Workers are local processes, or servers started with `serve_shard`
+    on other hosts.
+
+    A pool is attached to a model with `NumbaModel.set_shard_pool`, after
+    which the reduced loglike, gradient and BHHH, and hence `fit_bhhh`
+    and `maximize_loglike`, are evaluated by the pool.  If the model
+    specification changes, the new specification is sent to the workers
+    before the next evaluation.
+
+    Parameters
+    ----------
+    n_shards : int, default 2
+        The number of local worker processes to start.  Ignored if
+        `addresses` is given.
+    addresses : Sequence[tuple], optional
+        The (host, port) addresses of shard servers to connect to,
+        instead of starting local processes.
+    authkey : bytes, optional
+        The shared secret for connecting to shard servers, required
+        when `addresses` is given.  Local workers are connected by
+        anonymous pipes, which no other process can reach, and each is
+        given its own random process `authkey`.
+    n_threads : int, optional
+        The number of threads numba uses in each local worker.
+
+    Raises
+    ------
+    ValueError
+        If `addresses` is given without an `authkey` of non-empty bytes.
+    """
+
+    def __init__(self, n_shards=2, addresses=None, authkey=None, n_threads=None):
+        self._processes = []
+        if addresses is not None:
+            _check_authkey(authkey)
+            self._connections = [Client(address, authkey=authkey) for address in addresses]
+        else:
+            ctx = multiprocessing.get_context('spawn')
+            self._connections = []
+            for _ in range(n_shards):
+                parent_conn, child_conn = ctx.Pipe()
+                process = ctx.Process(
+                    target=_local_shard, args=(child_conn, n_threads), daemon=True,
+                )
+                process.authkey = os.urandom(32)
+                process.start()
+                child_conn.close()
+                self._connections.append(parent_conn)
+                self._processes.append(process)
+        self.shard_n_cases = None
+        self._specification = None
+
+    @property
+    def n_shards(self):
+        """int : The number of shards."""
+        return len(self._connections)
+
+    @property
+    def n_cases(self):
+        """int : The total number of cases in all shards."""
+        return int(sum(self.shard_n_cases))
+
+    def _broadcast(self, messages):
+        for conn, message in zip(self._connections, messages):
+            conn.send(message)
+        results = []
+        error = None
+        for conn in self._connections:
+            status, result = conn.recv()
+            if status == 'error':
+                error = error or result
+            results.append(result)
+        if error is not None:
+            raise error
+        return results
+
+    def load(self, model, send_data=True):
+        """
+        Send the model, and optionally its data, to the workers.
+
+        Parameters
+        ----------
+        model : NumbaModel
+        send_data : bool, default True
+            Split the cases in `model.dataframes` into contiguous shards and
+            send one to each worker.  Set to False when every worker is a
+            shard server that already holds its own data.
+        """
+        if send_data:
+            if self.n_shards > 1:
+                shards = model.dataframes.split(self.n_shards)
+            else:
+                shards = [model.dataframes]
+            self._broadcast([('data', *_dataframes_parts(d)) for d in shards])
+        self._send_model(model)
+
+    def _send_model(self, model):
+        self._specification = model.specification_hash()
+        self.shard_n_cases = self._broadcast([('model', model)] * self.n_shards)
+
+    def evaluate(self, model, holdfast_arr, parameter_arr, return_flags, hessian=False):
+        """
+        Sum the reduced kernel results over all shards.
+
+        Returns
+        -------
+        loglike, d_loglike, bhhh[, d2_loglike] : ndarray
+        n_cases : int
+        """
+        if model.specification_hash() != self._specification:
+            self._send_model(model)
+        message = ('evaluate', holdfast_arr, parameter_arr, return_flags, hessian)
+        results = self._broadcast([message] * self.n_shards)
+        totals = [np.sum(parts, axis=0) for parts in zip(*results)]
+        return (*totals, self.n_cases)
+
+    def close(self):
+        """Shut down the workers."""
+        for conn in self._connections:
+            try:
+                conn.send(('close',))
+                conn.close()
+            except (OSError, EOFError):
+                pass
+        for process in self._processes:
+            process.join(timeout=5)
+        self._connections = []
+        self._processes = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
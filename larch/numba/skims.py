@@ -0,0 +1,338 @@
+import os
+import json
+from collections.abc import Mapping
+import numpy as np
+import pandas as pd
+from numba import njit, prange
+
+
+@njit(parallel=True, nogil=True, cache=True)
+def gather_od(skim, orig, dest, out):
+    """
+    Gather `skim[orig[i], dest[i]]` into `out[i]`.
+    """
+    for i in prange(orig.size):
+        out[i] = skim[orig[i], dest[i]]
+
+
+@njit(parallel=True, nogil=True, cache=True)
+def gather_odt(skim, orig, dest, period, out):
+    """
+    Gather `skim[orig[i], dest[i], period[i]]` into `out[i]`.
+    """
+    for i in prange(orig.size):
+        out[i] = skim[orig[i], dest[i], period[i]]
+
+
+def _positions(values, n, label):
+    values = np.ascontiguousarray(values, dtype=np.int64).reshape(-1)
+    if values.size and (values.min() < 0 or values.max() >= n):
+        raise IndexError(f'{label} out of bounds for {n} positions')
+    return values
+
+
+class DenseSkims:
+    """
+    Skim matrices held in memory as contiguous arrays, with fast gathers.
+
+    Each skim is a C-contiguous array of shape [n_zones, n_zones], or
+    [n_zones, n_zones, n_periods] for skims that vary by time period, so
+    that looking up the values for many origin-destination pairs is a
+    parallel gather instead of an HDF5 read and decompression.  Build
+    one from an `OMX` file with `from_omx`, and `save` it to reopen the
+    arrays later as memory-mapped files, shared by every process that
+    uses them.
+
+    Parameters
+    ----------
+    skims : Mapping[str, array-like]
+        The skim arrays, all with the same leading [n_zones, n_zones]
+        shape.
+    time_periods : Sequence[str], optional
+        The labels of the time periods, which index the last dimension
+        of any 3-d skims.
+    zone_labels, zone_positions : array-like, optional
+        The sorted zone codes, and the matrix position of each, used by
+        `zone_index`.
+    """
+
+    def __init__(self, skims, time_periods=None, zone_labels=None, zone_positions=None):
+        self._skims = {}
+        shape = None
+        for name, arr in skims.items():
+            if not isinstance(arr, np.memmap):
+                arr = np.ascontiguousarray(arr)
+            if arr.ndim not in (2, 3):
+                raise ValueError(f'skim {name!r} has {arr.ndim} dimensions, not 2 or 3')
+            if shape is None:
+                shape = arr.shape[:2]
+            elif arr.shape[:2] != shape:
+                raise ValueError(f'skim {name!r} has shape {arr.shape}, not {shape}')
+            self._skims[name] = arr
+        self._shape = shape
+        self.time_periods = list(time_periods) if time_periods is not None else None
+        if (zone_labels is None) != (zone_positions is None):
+            raise ValueError('give both zone_labels and zone_positions, or neither')
+        self._zone_labels = np.asarray(zone_labels) if zone_labels is not None else None
+        self._zone_positions = np.asarray(zone_positions) if zone_positions is not None else None
+
+    @classmethod
+    def from_omx(cls, omx, mat_names=None, lookup=None, time_periods=None, dtype=np.float32):
+        """
+        Read skims from an OMX file into memory.
+
+        Parameters
+        ----------
+        omx : OMX
+        mat_names : Sequence[str], optional
+            The matrices to read, by default all of them.
+        lookup : str, optional
+            The name of a lookup in the OMX file holding the zone code
+            of each matrix row, for use by `zone_index`.
+        time_periods : Sequence[str], optional
+            Time period labels.  Matrices named like `'{name}__{period}'`
+            for every one of these periods are stacked into a single 3-d
+            skim `name`, with the periods in this order.
+        dtype : dtype, default float32
+
+        Returns
+        -------
+        DenseSkims
+        """
+        if mat_names is None:
+            mat_names = list(omx.data._v_children.keys())
+        skims = {}
+        stacked = set()
+        if time_periods is not None:
+            time_periods = list(time_periods)
+            bases = {n.rsplit('__', 1)[0] for n in mat_names if '__' in n}
+            for base in sorted(bases):
+                members = [f'{base}__{tp}' for tp in time_periods]
+                if all(m in mat_names for m in members):
+                    arr = np.empty(tuple(omx.shape) + (len(time_periods),), dtype=dtype)
+                    for t, m in enumerate(members):
+                        arr[:, :, t] = omx[m][:]
+                    skims[base] = arr
+                    stacked.update(members)
+        for name in mat_names:
+            if name not in stacked:
+                skims[name] = np.ascontiguousarray(omx[name][:], dtype=dtype)
+        zone_labels = zone_positions = None
+        if lookup is not None:
+            zone_labels = np.unique(omx.lookup._v_children[lookup][:])
+            zone_positions = omx.lookup_to_index(lookup, zone_labels)
+        return cls(skims, time_periods, zone_labels, zone_positions)
+
+    def save(self, directory):
+        """
+        Write the skims to a directory of .npy files.
+
+        Parameters
+        ----------
+        directory : path-like
+            Created if it does not exist.
+        """
+        directory = os.fspath(directory)
+        os.makedirs(directory, exist_ok=True)
+        files = {}
+        for n, (name, arr) in enumerate(self._skims.items()):
+            files[name] = f'skim{n:04d}.npy'
+            np.save(os.path.join(directory, files[name]), arr)
+        if self._zone_labels is not None:
+            np.save(os.path.join(directory, 'zone_labels.npy'), self._zone_labels)
+            np.save(os.path.join(directory, 'zone_positions.npy'), self._zone_positions)
+        with open(os.path.join(directory, 'skims.json'), 'w') as f:
+            json.dump(
+                dict(
+                    files=files,
+                    time_periods=self.time_periods,
+                    zones=self._zone_labels is not None,
+                ),
+                f,
+                indent=1,
+            )
+
+    @classmethod
+    def load(cls, directory, memory_map=True):
+        """
+        Open skims written by `save`.
+
+        Parameters
+        ----------
+        directory : path-like
+        memory_map : bool, default True
+            Memory-map the arrays (read-only) instead of reading them.
+
+        Returns
+        -------
+        DenseSkims
+        """
+        directory = os.fspath(directory)
+        with open(os.path.join(directory, 'skims.json'), 'r') as f:
+            meta = json.load(f)
+        mmap_mode = 'r' if memory_map else None
+        skims = {
+            name: np.load(os.path.join(directory, filename), mmap_mode=mmap_mode)
+            for name, filename in meta['files'].items()
+        }
+        zone_labels = zone_positions = None
+        if meta['zones']:
+            zone_labels = np.load(os.path.join(directory, 'zone_labels.npy'))
+            zone_positions = np.load(os.path.join(directory, 'zone_positions.npy'))
+        return cls(skims, meta['time_periods'], zone_labels, zone_positions)
+
+    @property
+    def shape(self):
+        """tuple : The (n_zones, n_zones) shape of the skims."""
+        return self._shape
+
+    @property
+    def names(self):
+        """list : The names of the skims."""
+        return list(self._skims)
+
+    @property
+    def nbytes(self):
+        """int : The total size of the skim arrays."""
+        return sum(arr.nbytes for arr in self._skims.values())
+
+    def __contains__(self, name):
+        return name in self._skims
+
+    def __getitem__(self, name):
+        return self._skims[name]
+
+    def __repr__(self):
+        return f"<larch.DenseSkims {len(self._skims)} skims, shape {self._shape}>"
+
+    def zone_index(self, codes):
+        """
+        Convert zone codes into 0-based matrix positions.
+
+        Parameters
+        ----------
+        codes : array-like
+
+        Returns
+        -------
+        array of int
+
+        Raises
+        ------
+        ValueError
+            If there is no zone lookup, see `from_omx`.
+        KeyError
+            If any code is not a zone.
+        """
+        if self._zone_labels is None:
+            raise ValueError('no zone lookup, give `lookup` to `from_omx`')
+        codes = np.asarray(codes)
+        i = np.searchsorted(self._zone_labels, codes)
+        found = i < len(self._zone_labels)
+        found[found] = self._zone_labels[i[found]] == codes[found]
+        if not found.all():
+            raise KeyError(f'unknown zone codes: {np.unique(codes[~found])[:10]}')
+        return self._zone_positions[i]
+
+    def period_index(self, periods):
+        """
+        Convert time period labels into positions.
+
+        Parameters
+        ----------
+        periods : str or array-like of str
+
+        Returns
+        -------
+        int or array of int
+        """
+        if self.time_periods is None:
+            raise ValueError('no time periods are defined')
+        lookup = {tp: t for t, tp in enumerate(self.time_periods)}
+        if isinstance(periods, str):
+            return lookup[periods]
+        return np.asarray([lookup[tp] for tp in np.asarray(periods).reshape(-1)]).reshape(np.shape(periods))
+
+    def gather(self, name, orig, dest, period=None):
+        """
+        The values of one skim for origin-destination(-period) tuples.
+
+        Parameters
+        ----------
+        name : str
+        orig, dest : int or array-like of int
+            The 0-based matrix positions of the origins and destinations.
+            These are broadcast against each other (and `period`).
+        period : int, str, or array-like, optional
+            The time period positions or labels, required for 3-d skims.
+
+        Returns
+        -------
+        array
+        """
+        skim = self._skims[name]
+        if skim.ndim == 3 and period is None:
+            raise ValueError(f'skim {name!r} varies by time period, give `period`')
+        if skim.ndim == 2 and period is not None:
+            raise ValueError(f'skim {name!r} does not vary by time period')
+        if period is not None and np.asarray(period).dtype.kind in 'OUS':
+            period = self.period_index(period)
+        arrays = np.broadcast_arrays(orig, dest, *(() if period is None else (period,)))
+        shape = arrays[0].shape
+        o = _positions(arrays[0], skim.shape[0], 'origins')
+        d = _positions(arrays[1], skim.shape[1], 'destinations')
+        out = np.empty(o.size, dtype=skim.dtype)
+        if period is None:
+            gather_od(skim, o, d, out)
+        else:
+            t = _positions(arrays[2], skim.shape[2], 'periods')
+            gather_odt(skim, o, d, t, out)
+        return out.reshape(shape)
+
+    def get_rc_dataframe(self, row_indexes, col_indexes, mat_names=None, index=None, period=None):
+        """
+        Build a DataFrame containing values pulled from these skims.
+
+        This is a drop-in replacement for `OMX.get_rc_dataframe`.
+
+        Parameters
+        ----------
+        row_indexes, col_indexes : array-like or int
+            The 0-based row and column within the matrix for each output
+            row, broadcast against each other.
+        mat_names : Sequence or Mapping, optional
+            The skims to draw values from, by default all of them.  If
+            given as a mapping, the keys are used to identify the skims
+            and the mapping is then used to rename the columns.
+        index : array-like, optional
+            An array to use as the index on the returned DataFrame.  If
+            not given, the index of `row_indexes` (or `col_indexes`) is
+            used if it is a pandas object.
+        period : int, str, or array-like, optional
+            The time period of each output row, for 3-d skims.
+
+        Returns
+        -------
+        pandas.DataFrame
+        """
+        if mat_names is None:
+            mat_names = self.names
+        _mat_names = list(mat_names.keys()) if isinstance(mat_names, Mapping) else list(mat_names)
+        if index is None:
+            for i in (row_indexes, col_indexes):
+                if isinstance(i, (pd.Series, pd.Index)):
+                    index = i.index if isinstance(i, pd.Series) else i
+                    break
+        data = {
+            name: self.gather(
+                name,
+                row_indexes,
+                col_indexes,
+                period if self._skims[name].ndim == 3 else None,
+            ).reshape(-1)
+            for name in _mat_names
+        }
+        result = pd.DataFrame(data, index=index)
+        if isinstance(mat_names, Mapping):
+            result = result.rename(columns=mat_names)
+        return result
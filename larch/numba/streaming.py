@@ -0,0 +1,267 @@
+import os
+import pickle
+import numpy as np
+import pandas as pd
+
+_SEGMENTS = ('co', 'ca', 'av', 'ch', 'wt')
+
+
+def _from_metadata(metadata, tag):
+    import pyarrow as pa
+    raw_ = metadata.get(tag, None)
+    len_ = int(metadata.get(tag+b'BYTES', 0))
+    if raw_:
+        return pickle.loads(pa.decompress(raw_, len_))
+    else:
+        return None
+
+
+class CaseStream:
+    """
+    Case data read from disk in blocks, for out-of-core estimation.
+
+    A CaseStream is attached to a NumbaModel with
+    `NumbaModel.set_case_stream`.  The model is then linked to a small
+    in-memory DataFrames built from the first block (see `head`), which
+    defines the data columns and alternatives, while loglike, gradient
+    and BHHH evaluations run the kernel over each block in turn and
+    sum the results.
+
+    Parameters
+    ----------
+    block_size : int
+        The number of cases in each block.
+    """
+
+    def __init__(self, block_size=100_000):
+        self.block_size = int(block_size)
+        self.n_cases = 0
+        self.columns_co = None
+        self.columns_ca = None
+        self.alt_codes = None
+        self.alt_names = None
+        self.weight_normalization = 1.0
+
+    def blocks(self):
+        """
+        Iterate over blocks of cases.
+
+        Yields
+        ------
+        dict
+            Arrays for each data segment available on disk, keyed by
+            segment name from {'co','ca','av','ch','wt'}.  The `co`,
+            `av` and `ch` arrays have shape [n_block_cases, ...], `ca`
+            has shape [n_block_cases, n_alts, n_vars_ca], and `wt` has
+            shape [n_block_cases].
+        """
+        raise NotImplementedError
+
+    def head(self):
+        """
+        Build an in-memory DataFrames from the first block of cases.
+
+        Returns
+        -------
+        DataFrames
+        """
+        from ..dataframes import DataFrames
+        block = next(iter(self.blocks()))
+        n = next(iter(block.values())).shape[0]
+        caseindex = pd.RangeIndex(n, name='_caseid_')
+        kwargs = {}
+        if 'co' in block:
+            kwargs['co'] = pd.DataFrame(
+                np.asarray(block['co']), columns=self.columns_co, index=caseindex,
+            )
+        if 'ca' in block:
+            kwargs['ca'] = pd.DataFrame(
+                np.asarray(block['ca']).reshape(-1, len(self.columns_ca)),
+                columns=self.columns_ca,
+                index=pd.MultiIndex.from_product(
+                    [caseindex, self.alt_codes], names=['_caseid_', '_altid_'],
+                ),
+            )
+        for seg in ('av', 'ch'):
+            if seg in block:
+                kwargs[seg] = pd.DataFrame(
+                    np.array(block[seg]), columns=self.alt_codes, index=caseindex,
+                )
+        if 'wt' in block:
+            kwargs['wt'] = pd.Series(np.array(block['wt']), index=caseindex, name='wt')
+        result = DataFrames(
+            alt_codes=self.alt_codes,
+            alt_names=self.alt_names,
+            **kwargs,
+        )
+        result.weight_normalization = self.weight_normalization
+        return result
+
+
+class NpyCaseStream(CaseStream):
+    """
+    Stream cases from memory-mapped .npy files.
+
+    The files are written by `NpyCaseStream.write`.
+
+    Parameters
+    ----------
+    directory : path-like
+    block_size : int
+        The number of cases in each block.
+    """
+
+    def __init__(self, directory, block_size=100_000):
+        super().__init__(block_size)
+        self.directory = directory
+        with open(os.path.join(directory, 'metadata.pkl'), 'rb') as f:
+            meta = pickle.load(f)
+        self.columns_co = meta['columns_co']
+        self.columns_ca = meta['columns_ca']
+        self.alt_codes = meta['alt_codes']
+        self.alt_names = meta['alt_names']
+        self.weight_normalization = meta['weight_normalization']
+        self._arrays = {}
+        for seg in _SEGMENTS:
+            filename = os.path.join(directory, f'data_{seg}.npy')
+            if os.path.exists(filename):
+                self._arrays[seg] = np.load(filename, mmap_mode='r')
+        self.n_cases = next(iter(self._arrays.values())).shape[0]
+
+    @classmethod
+    def write(cls, dataframes, directory):
+        """
+        Write the arrays of a DataFrames to .npy files for streaming.
+
+        Parameters
+        ----------
+        dataframes : DataFrames
+        directory : path-like
+            This directory is created if it does not already exist.
+        """
+        os.makedirs(directory, exist_ok=True)
+        for seg in _SEGMENTS:
+            arr = getattr(dataframes, f'array_{seg}')()
+            if arr is not None:
+                np.save(os.path.join(directory, f'data_{seg}.npy'), np.ascontiguousarray(arr))
+        meta = dict(
+            columns_co=None if dataframes.data_co is None else dataframes.data_co.columns,
+            columns_ca=None if dataframes.data_ca is None else dataframes.data_ca.columns,
+            alt_codes=dataframes.alternative_codes(),
+            alt_names=dataframes.alternative_names(),
+            weight_normalization=dataframes.weight_normalization,
+        )
+        with open(os.path.join(directory, 'metadata.pkl'), 'wb') as f:
+            pickle.dump(meta, f)
+
+    def blocks(self):
+        for start in range(0, self.n_cases, self.block_size):
+            stop = start + self.block_size
+            yield {seg: arr[start:stop] for seg, arr in self._arrays.items()}
+
+
+class FeatherCaseStream(CaseStream):
+    """
+    Stream cases from Feather files written by `DataFrames.to_feathers`.
+
+    Segments stored in case-major order are read one record batch at a
+    time, so that only about one block of cases is held in memory.
+    Segments that `to_feathers` stored transposed (variable-major, as is
+    common for small idco arrays) cannot be split by case on disk, and
+    are read in full and then sliced.
+
+    Parameters
+    ----------
+    filename : path-like
+        The base filename given to `DataFrames.to_feathers`.  It must have
+        been written including the 'meta' component.
+    block_size : int
+        The number of cases in each block.
+    """
+
+    def __init__(self, filename, block_size=100_000):
+        super().__init__(block_size)
+        import pyarrow as pa
+        import pyarrow.feather as pf
+        self.filename = filename
+
+        filename_meta = str(filename)+".metadata"
+        if not os.path.exists(filename_meta):
+            raise FileNotFoundError(filename_meta)
+        tb = pf.read_table(filename_meta)
+        if 'altcodes' in tb.column_names:
+            self.alt_codes = tb['altcodes'].to_numpy()
+        if 'altnames' in tb.column_names:
+            self.alt_names = tb['altnames'].to_numpy()
+        caseindex = _from_metadata(tb.schema.metadata, b'CASEINDEX')
+        raw_wgtnorm = tb.schema.metadata.get(b'WGT_NORM', None)
+        if raw_wgtnorm:
+            self.weight_normalization = float.fromhex(raw_wgtnorm)
+
+        self._segments = {}
+        for seg in _SEGMENTS:
+            filename_seg = str(filename)+f".data_{seg}"
+            if not os.path.exists(filename_seg):
+                continue
+            schema = pa.ipc.open_file(pa.memory_map(filename_seg, 'r')).schema
+            metadata = schema.metadata or {}
+            if seg == 'co':
+                self.columns_co = _from_metadata(metadata, b'COLUMNS')
+                shape = (len(self.columns_co),)
+            elif seg == 'ca':
+                self.columns_ca = _from_metadata(metadata, b'COLUMNS')
+                shape = (len(self.alt_codes), len(self.columns_ca))
+            elif seg in ('av', 'ch'):
+                shape = (len(self.alt_codes),)
+            else:
+                shape = ()
+            self._segments[seg] = (
+                filename_seg,
+                shape,
+                metadata.get(b'T', b'N') == b'Y',
+            )
+        if caseindex is not None:
+            self.n_cases = len(caseindex)
+        else:
+            filename_seg, shape, transpose = next(iter(self._segments.values()))
+            reader = pa.ipc.open_file(pa.memory_map(filename_seg, 'r'))
+            self.n_cases = sum(
+                reader.get_batch(i).num_rows for i in range(reader.num_record_batches)
+            ) // int(np.prod(shape))
+
+    def _segment_blocks(self, seg):
+        import pyarrow as pa
+        filename_seg, shape, transpose = self._segments[seg]
+        width = int(np.prod(shape))
+        reader = pa.ipc.open_file(pa.memory_map(filename_seg, 'r'))
+        if transpose:
+            arr = reader.read_all().column(0).to_numpy()
+            arr = arr.reshape(tuple(reversed(shape)) + (self.n_cases,)).T
+            for start in range(0, self.n_cases, self.block_size):
+                yield np.ascontiguousarray(arr[start:start+self.block_size])
+            return
+        block_len = self.block_size * width
+        pending = []
+        n_pending = 0
+        for i in range(reader.num_record_batches):
+            chunk = reader.get_batch(i).column(0).to_numpy(zero_copy_only=False)
+            pending.append(chunk)
+            n_pending += chunk.size
+            while n_pending >= block_len:
+                flat = np.concatenate(pending) if len(pending) > 1 else pending[0]
+                yield flat[:block_len].reshape((-1,) + shape)
+                pending = [flat[block_len:]]
+                n_pending = pending[0].size
+        if n_pending:
+            yield np.concatenate(pending).reshape((-1,) + shape)
+
+    def blocks(self):
+        segment_iters = {seg: self._segment_blocks(seg) for seg in self._segments}
+        while True:
+            block = {}
+            for seg, it in segment_iters.items():
+                try:
+                    block[seg] = next(it)
+                except StopIteration:
+                    return
+            yield block
@@ -0,0 +1,364 @@
+import numpy as np
+import pandas as pd
+import numba
+from numba import njit, prange
+
+
+@njit(parallel=True, cache=True)
+def _validate_cases(
+        ch,            # float input/output shape=[n_cases, n_ch]
+        av,            # int8 input shape=[n_cases, n_av]
+        zq,            # int8 input shape=[n_cases, n_zq]
+        wt,            # float input shape=[n_cases] or [0]
+        co,            # float input shape=[n_cases, n_co_vars]
+        av_out,        # int8 output shape=[n_cases, <=n_av]
+        repair_zq,     # int input, 1 makes chosen-but-zero-quantity not chosen
+        repair_av,     # int input, 1 makes chosen-but-not-available available, 2 not chosen
+        nan_co_zero,   # bool input, count NaN in co as zero for the variance
+        n_examples,    # int input
+        n_blocks,      # int input
+):
+    n_cases = ch.shape[0]
+    w_zq = min(zq.shape[1], ch.shape[1])
+    w_av = min(av.shape[1], ch.shape[1])
+    has_ch = ch.shape[1] > 0
+    has_wt = wt.shape[0] > 0
+    n_co = co.shape[1]
+
+    zq_count = np.zeros((n_blocks, w_zq), dtype=np.int64)
+    zq_examples = np.full((n_blocks, w_zq, n_examples), -1, dtype=np.int64)
+    av_count = np.zeros((n_blocks, w_av), dtype=np.int64)
+    av_examples = np.full((n_blocks, w_av, n_examples), -1, dtype=np.int64)
+    noch_count = np.zeros(n_blocks, dtype=np.int64)
+    noch_examples = np.full((n_blocks, n_examples), -1, dtype=np.int64)
+    nan_wt_count = np.zeros((n_blocks, 2), dtype=np.int64)
+    nan_wt_examples = np.full((n_blocks, 2, n_examples), -1, dtype=np.int64)
+    nothing_chosen = np.zeros(n_cases, dtype=np.int8)
+    co_nan = np.zeros((n_blocks, n_co), dtype=np.int64)
+    co_n = np.zeros((n_blocks, n_co), dtype=np.float64)
+    co_mean = np.zeros((n_blocks, n_co), dtype=np.float64)
+    co_m2 = np.zeros((n_blocks, n_co), dtype=np.float64)
+
+    block_size = (n_cases + n_blocks - 1) // n_blocks
+    for b in prange(n_blocks):
+        for c in range(b * block_size, min((b + 1) * block_size, n_cases)):
+
+            # chosen but zero quantity
+            for j in range(w_zq):
+                if zq[c, j] > 0 and ch[c, j] > 0:
+                    if zq_count[b, j] < n_examples:
+                        zq_examples[b, j, zq_count[b, j]] = c
+                    zq_count[b, j] += 1
+                    if repair_zq == 1:
+                        ch[c, j] = 0
+
+            # chosen but not available
+            for j in range(w_av):
+                if av[c, j] == 0 and ch[c, j] > 0:
+                    if av_count[b, j] < n_examples:
+                        av_examples[b, j, av_count[b, j]] = c
+                    av_count[b, j] += 1
+                    if repair_av == 1:
+                        if j < av_out.shape[1]:
+                            av_out[c, j] = 1
+                    elif repair_av == 2:
+                        ch[c, j] = 0
+
+            # nothing chosen but nonzero weight
+            noch = 0
+            if has_ch and has_wt:
+                total = 0.0
+                for j in range(ch.shape[1]):
+                    total += ch[c, j]
+                if total == 0:
+                    noch = 1
+                    nothing_chosen[c] = 1
+                    if wt[c] > 0:
+                        if noch_count[b] < n_examples:
+                            noch_examples[b, noch_count[b]] = c
+                        noch_count[b] += 1
+
+            # nan weight, counted apart for cases with nothing chosen,
+            # whose weights may be zeroed by repairing the previous check
+            if has_wt and np.isnan(wt[c]):
+                if nan_wt_count[b, noch] < n_examples:
+                    nan_wt_examples[b, noch, nan_wt_count[b, noch]] = c
+                nan_wt_count[b, noch] += 1
+
+            # nan data_co, and running variance of data_co
+            for k in range(n_co):
+                x = co[c, k]
+                if np.isnan(x):
+                    co_nan[b, k] += 1
+                    if not nan_co_zero:
+                        continue
+                    x = 0.0
+                co_n[b, k] += 1
+                delta = x - co_mean[b, k]
+                co_mean[b, k] += delta / co_n[b, k]
+                co_m2[b, k] += delta * (x - co_mean[b, k])
+
+    return (
+        zq_count, zq_examples,
+        av_count, av_examples,
+        noch_count, noch_examples,
+        nan_wt_count, nan_wt_examples,
+        nothing_chosen,
+        co_nan, co_n, co_mean, co_m2,
+    )
+
+
+def _first_examples(examples, n_examples):
+    """
+    The first valid row numbers from per-block example arrays, shape [n_blocks, ..., n].
+    """
+    flat = np.moveaxis(examples, 0, -2)
+    flat = flat.reshape(*flat.shape[:-2], -1)
+    flat = np.sort(np.where(flat < 0, np.iinfo(np.int64).max, flat), axis=-1)[..., :n_examples]
+    return flat
+
+
+def _example_text(rows):
+    return ", ".join(str(j) for j in rows if j != np.iinfo(np.int64).max)
+
+
+def _alternatives_diagnosis(count, examples, columns, verbose):
+    count = pd.Series(count.sum(0), index=columns)
+    if count.sum() == 0:
+        return None
+    first = _first_examples(examples, verbose)
+    diagnosis = pd.DataFrame(
+        count[count > 0],
+        columns=['n', ],
+    )
+    for colnum, colname in enumerate(columns):
+        if count[colname] > 0:
+            diagnosis.loc[colname, 'example rows'] = _example_text(first[colnum])
+    return diagnosis
+
+
+def _co_variance(co_n, co_mean, co_m2):
+    """
+    Combine the per-block running variances into the sample variance of each column.
+    """
+    n = np.zeros(co_n.shape[1])
+    mean = np.zeros(co_n.shape[1])
+    m2 = np.zeros(co_n.shape[1])
+    for b in range(co_n.shape[0]):
+        n_b = co_n[b]
+        total = n + n_b
+        safe = np.where(total > 0, total, 1)
+        delta = co_mean[b] - mean
+        m2 = m2 + co_m2[b] + delta ** 2 * n * n_b / safe
+        mean = mean + delta * n_b / safe
+        n = total
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(n > 1, m2 / (n - 1), np.nan)
+
+
+def _values(frame, dtype=None):
+    if frame is None:
+        return None
+    return frame.values if dtype is None else np.ascontiguousarray(frame.values, dtype=dtype)
+
+
+def _write_back(dfs, name, array):
+    """
+    Copy a repaired array into a frame of `dfs`, unless it already is a view of it.
+
+    Read-only frames, such as memory-mapped or shared data, are replaced
+    by a new frame instead of being written to.
+    """
+    frame = getattr(dfs, name)
+    values = frame.values
+    if np.shares_memory(array, values):
+        return
+    if values.flags.writeable:
+        frame.iloc[:, :] = array
+    else:
+        setattr(dfs, name, pd.DataFrame(
+            array.astype(values.dtype), index=frame.index, columns=frame.columns,
+        ))
+
+
+def validate_data(
+        dfs,
+        repair_ch_av=None,
+        repair_ch_zq=None,
+        repair_noch_nowt=None,
+        repair_nan_wt=None,
+        repair_nan_data_co=None,
+        verbose=3,
+):
+    """
+    Run the data checks of `larch.troubleshooting.doctor` in one pass.
+
+    The chosen-but-zero-quantity, chosen-but-not-available,
+    nothing-chosen-but-nonzero-weight, nan-weight, nan-data_co and
+    low-variance-data-co checks are run together by one parallel
+    compiled kernel, which reads each case once, and applies the
+    choice and availability repairs in place as it goes.  The
+    findings and repairs are the same as running the individual
+    checks in that order, which is what `doctor` does without this.
+
+    Parameters
+    ----------
+    dfs : DataFrames or Model
+        The data to check.
+    repair_ch_av, repair_ch_zq, repair_noch_nowt, repair_nan_wt, repair_nan_data_co
+        How to repair each problem, as for the individual checks.
+    verbose : int, default 3
+        The number of example rows (or columns) to list for each problem.
+
+    Returns
+    -------
+    dfs : DataFrames or Model
+        The checked (and possibly repaired) data, or its model.
+    diagnoses : dict
+        The diagnosis of each check, keyed by the name of the check,
+        or None where the check found no problem.
+    """
+    from ..model import Model
+
+    if repair_ch_zq not in ('-', None):
+        raise ValueError(f'invalid repair setting "{repair_ch_zq}"')
+    if repair_noch_nowt == '+':
+        raise ValueError("cannot resolve chosen_but_zero_quantity by assuming some choice")
+
+    if isinstance(dfs, Model):
+        m = dfs
+        dfs = m.dataframes
+    else:
+        m = None
+    if dfs is None:
+        raise ValueError('data not loaded')
+
+    n_cases = dfs.n_cases
+    ch = _values(dfs.data_ch)
+    if ch is None:
+        ch = np.zeros([n_cases, 0])
+    elif not ch.flags.writeable:
+        # the kernel repairs choices in place
+        ch = ch.copy()
+    av_out = np.zeros([n_cases, 0], dtype=np.int8)
+    if dfs.data_av is None:
+        av_frame = None
+        av = av_out
+    else:
+        if m is not None and dfs.data_ch is not None and dfs.data_ch.shape[1] == len(m.graph):
+            # choice data is wide, make availability data wide
+            av_frame = dfs.data_av_cascade(m.graph)
+        else:
+            av_frame = dfs.data_av
+        av = _values(av_frame, np.int8)
+        if repair_ch_av == '+':
+            av_out = np.array(dfs.data_av.values, dtype=np.int8)
+    try:
+        zq = _values(dfs.get_zero_quantity_ca(), np.int8)
+    except ValueError:
+        zq = np.zeros([n_cases, 0], dtype=np.int8)
+    wt = _values(dfs.data_wt)
+    wt = np.zeros(0) if wt is None else wt[:, 0]
+    co = _values(dfs.data_co)
+    if co is None:
+        co = np.zeros([n_cases, 0])
+    elif co.dtype.kind != 'f':
+        co = co.astype(np.float64)
+
+    (
+        zq_count, zq_examples,
+        av_count, av_examples,
+        noch_count, noch_examples,
+        nan_wt_count, nan_wt_examples,
+        nothing_chosen,
+        co_nan, co_n, co_mean, co_m2,
+    ) = _validate_cases(
+        ch,
+        av,
+        zq,
+        wt,
+        co,
+        av_out,
+        1 if repair_ch_zq == '-' else 0,
+        {'+': 1, '-': 2}.get(repair_ch_av, 0),
+        bool(repair_nan_data_co),
+        verbose,
+        max(min(n_cases, numba.get_num_threads() * 4), 1),
+    )
+    diagnoses = {}
+
+    columns = av_frame.columns if av_frame is not None else None
+    diagnoses['chosen_but_zero_quantity'] = _alternatives_diagnosis(
+        zq_count, zq_examples, dfs.data_av.columns[:zq_count.shape[1]] if zq_count.shape[1] else [], verbose,
+    )
+    diagnoses['chosen_but_not_available'] = _alternatives_diagnosis(
+        av_count, av_examples, columns[:av_count.shape[1]] if av_count.shape[1] else [], verbose,
+    )
+    if (zq_count.sum() and repair_ch_zq) or (av_count.sum() and repair_ch_av == '-'):
+        _write_back(dfs, 'data_ch', ch)
+    if av_count.sum() and repair_ch_av == '+':
+        _write_back(dfs, 'data_av', av_out)
+
+    diagnosis = None
+    n_noch = noch_count.sum()
+    if n_noch > 0:
+        diagnosis = pd.DataFrame(
+            [n_noch, ],
+            columns=['n', ],
+            index=['nothing_chosen_some_weight', ]
+        )
+        first = _first_examples(noch_examples[:, None, :], verbose)[0]
+        diagnosis.loc['nothing_chosen_some_weight', 'example rows'] = _example_text(first)
+        if repair_noch_nowt in ('-', '*'):
+            dfs.array_wt()[nothing_chosen.astype(bool)] = 0
+            if repair_noch_nowt == '*':
+                dfs.autoscale_weights()
+    diagnoses['nothing_chosen_but_nonzero_weight'] = diagnosis
+
+    diagnosis = None
+    if dfs.data_wt is not None:
+        if n_noch > 0 and repair_noch_nowt in ('-', '*'):
+            # the weights of cases with nothing chosen are now zero
+            nan_wt_count[:, 1] = 0
+            nan_wt_examples[:, 1, :] = -1
+        n_nan = nan_wt_count.sum()
+        if n_nan:
+            diagnosis = pd.DataFrame(
+                data=[[n_nan, '']],
+                columns=['n', 'example rows'],
+                index=['nan_weight'],
+            )
+            first = _first_examples(nan_wt_examples.reshape(-1, 1, 2 * verbose), verbose)[0]
+            diagnosis.loc['nan_weight', 'example rows'] = _example_text(first)
+        if repair_nan_wt:
+            dfs.data_wt.fillna(0, inplace=True)
+    diagnoses['nan_weight'] = diagnosis
+
+    diagnosis = None
+    variance = None
+    if dfs.data_co is not None:
+        nan_dat = pd.Series(co_nan.sum(0), index=dfs.data_co.columns)
+        if nan_dat.sum():
+            diagnosis = pd.DataFrame(nan_dat[nan_dat > 0].iloc[:verbose])
+            if repair_nan_data_co:
+                dfs.data_co.fillna(0, inplace=True)
+        variance = pd.Series(_co_variance(co_n, co_mean, co_m2), index=dfs.data_co.columns)
+    diagnoses['nan_data_co'] = diagnosis
+
+    diagnosis = None
+    if variance is not None and variance.min() < 1e-3:
+        i = np.where(variance < 1e-3)[0]
+        diagnosis = pd.DataFrame(
+            data=[[len(i), '']],
+            columns=['n', 'example cols'],
+            index=['low_variance_co'],
+        )
+        diagnosis.loc['low_variance_co', 'example cols'] = ", ".join(
+            str(dfs.data_co.columns[j]) for j in i[:verbose]
+        )
+    diagnoses['low_variance_data_co'] = diagnosis
+
+    if m is None:
+        return dfs, diagnoses
+    else:
+        return m, diagnoses
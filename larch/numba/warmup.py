@@ -0,0 +1,155 @@
+import json
+import subprocess
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+
+def _warmup_dataframes(n_cases=8):
+    from ..dataframes import DataFrames
+    rng = np.random.default_rng(0)
+    alt_codes = [1, 2, 3]
+    caseindex = pd.RangeIndex(n_cases, name='_caseid_')
+    co = pd.DataFrame({'x': rng.random(n_cases)}, index=caseindex)
+    ca = pd.DataFrame(
+        {'z': rng.random(n_cases * 3), 's': rng.random(n_cases * 3) + 1.0},
+        index=pd.MultiIndex.from_product([caseindex, alt_codes], names=['_caseid_', '_altid_']),
+    )
+    choice = rng.integers(0, 3, n_cases)
+    ch = pd.DataFrame(np.eye(3)[choice], columns=alt_codes, index=caseindex)
+    av = pd.DataFrame(np.ones([n_cases, 3], dtype=np.int8), columns=alt_codes, index=caseindex)
+    return DataFrames(co=co, ca=ca, ch=ch, av=av, alt_codes=alt_codes)
+
+
+def _warmup_model(float_dtype, dataframes):
+    from .model import NumbaModel
+    from ..roles import P, X
+    m = NumbaModel(float_dtype=float_dtype)
+    m.utility_co[2] = P.ASC_2 + P.x_2 * X.x
+    m.utility_co[3] = P.ASC_3
+    m.utility_ca = P.z * X.z
+    m.quantity_ca = P.s * X.s
+    m.quantity_scale = P.theta
+    m.dataframes = dataframes
+    m.graph.new_node(parameter='mu', children=[2, 3], name='nest')
+    m.set_values(mu=0.5, theta=0.9)
+    return m
+
+
+def warmup(float_dtypes=(np.float32, np.float64), casewise=True):
+    """
+    Compile, or load from the on-disk cache, the numba kernels used by NumbaModel.
+
+    The kernels are compiled lazily by numba on their first call, which
+    otherwise adds a delay to the first log likelihood evaluation in each
+    new process.  This function builds the casewise gufuncs, for both
+    float32 and float64, and runs a tiny nested logit model with idco,
+    idca and quantity terms through every public entry point, so that all
+    the kernels are ready before any real work begins.  Kernels that were
+    compiled in an earlier process are loaded from numba's cache.
+
+    Parameters
+    ----------
+    float_dtypes : Collection[dtype], default (float32, float64)
+        The floating point precisions to prepare.
+    casewise : bool, default True
+        Whether to prepare the casewise gufuncs, which are needed only for
+        probabilities, utilities and other casewise results.  Workers that
+        only evaluate the log likelihood and its derivatives can skip them.
+
+    Returns
+    -------
+    dict
+        The time in seconds taken to build the casewise gufuncs, under
+        key 'gufuncs' (if `casewise`), and to prepare each precision.
+    """
+    from ..model.persist_flags import PERSIST_LOGLIKE_CASEWISE
+    from .model import _numba_master_vectorized, _numba_penalty_vectorized
+    dataframes = _warmup_dataframes()
+    timings = {}
+    if casewise:
+        start = time.perf_counter()
+        _numba_master_vectorized()
+        _numba_penalty_vectorized()
+        timings['gufuncs'] = time.perf_counter() - start
+    for float_dtype in float_dtypes:
+        start = time.perf_counter()
+        m = _warmup_model(float_dtype, dataframes)
+        m.loglike()
+        m.d_loglike()
+        m.bhhh()
+        m.loglike2_bhhh()
+        m.d2_loglike()
+        if casewise:
+            m.loglike2_bhhh(persist=PERSIST_LOGLIKE_CASEWISE)
+            m.probability()
+            m.utility()
+            m.quantity()
+        m.constraint_intensity = 1.0
+        m.loglike2_bhhh()
+        timings[np.dtype(float_dtype).name] = time.perf_counter() - start
+    return timings
+
+
+def _benchmark(import_time, n_repeat=5, with_warmup=True):
+    import larch.numba
+    from larch.numba import example
+    result = dict(import_time=import_time)
+    if with_warmup:
+        start = time.perf_counter()
+        larch.numba.warmup()
+        result['warmup_time'] = time.perf_counter() - start
+    m = example(1)
+    m.load_data()
+    start = time.perf_counter()
+    m.loglike2_bhhh()
+    result['first_call_time'] = time.perf_counter() - start
+    steady = []
+    for _ in range(n_repeat):
+        start = time.perf_counter()
+        m.loglike2_bhhh()
+        steady.append(time.perf_counter() - start)
+    result['steady_state_time'] = float(np.median(steady))
+    return result
+
+
+def startup_benchmark(n_repeat=5, with_warmup=True):
+    """
+    Measure the start up costs of `larch.numba` in a fresh Python process.
+
+    A new interpreter is started, which imports larch.numba, optionally
+    runs `warmup`, and then evaluates the log likelihood, gradient and
+    BHHH matrix of the MTC example model, first once and then
+    `n_repeat` more times.
+
+    Parameters
+    ----------
+    n_repeat : int, default 5
+        The number of evaluations used to measure the steady state time.
+    with_warmup : bool, default True
+        Whether to call `warmup` before the first evaluation.
+
+    Returns
+    -------
+    dict
+        Times in seconds, with keys 'import_time', 'warmup_time' (if
+        `with_warmup`), 'first_call_time' and 'steady_state_time' (the
+        median of the repeated evaluations).
+    """
+    code = (
+        "import json, sys, time\n"
+        "start = time.perf_counter()\n"
+        "import larch.numba\n"
+        "import_time = time.perf_counter() - start\n"
+        "from larch.numba.warmup import _benchmark\n"
+        f"result = _benchmark(import_time, {int(n_repeat)}, {bool(with_warmup)})\n"
+        "print(json.dumps(result))\n"
+    )
+    output = subprocess.run(
+        [sys.executable, "-W", "ignore", "-c", code],
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    return json.loads(output.stdout.strip().splitlines()[-1])
@@ -830,7 +830,7 @@ class OMX(_omx_base_class):
 			result[name] = vals[r,c]
 		return result
 
-	def get_rc_dataframe(self, row_indexes, col_indexes, mat_names=None, index=None):
+	def get_rc_dataframe(self, row_indexes, col_indexes, mat_names=None, index=None, tile_cache=True):
 		"""
 		Build a DataFrame containing values pulled from this OMX.
 
@@ -853,11 +853,21 @@ class OMX(_omx_base_class):
 		index : array-like, or 'rc', optional
 			An array to use as the index on the returned DataFrame.
 			Set to 'rc' to get a row-and-column MultiIndex.
+		tile_cache : TileCache or bool, default True
+			Values are read by HDF5 chunk, reading only the chunks that
+			hold at least one requested row-and-column pair.  The chunks
+			read are kept in this cache for later calls, or in the cache
+			shared by all skims if True.  Set to None to read without
+			caching, or to False to read the values by point selection.
 
 		Returns
 		-------
 		pandas.DataFrame
 		"""
+		from .data_services.h5.h5tiles import read_pairs, shared_tile_cache
+		if tile_cache is True:
+			tile_cache = shared_tile_cache
+
 		if mat_names is None:
 			mat_names = list(self.data._v_children.keys())
 		if isinstance(mat_names, Mapping):
@@ -872,10 +882,16 @@ class OMX(_omx_base_class):
 		elif isinstance(col_indexes, int):
 			col_indexes = numpy.full_like(row_indexes, col_indexes)
 
-		data = {
-			mat: self[mat][row_indexes, col_indexes]
-			for mat in _mat_names
-		}
+		if tile_cache is False:
+			data = {
+				mat: self[mat][row_indexes, col_indexes]
+				for mat in _mat_names
+			}
+		else:
+			data = {
+				mat: read_pairs(self[mat], row_indexes, col_indexes, cache=tile_cache)
+				for mat in _mat_names
+			}
 
 		if index is None:
 			try:
@@ -922,6 +938,7 @@ class OMX(_omx_base_class):
 			colidx,
 			mat_names=None,
 			prefix='',
+			tile_cache=True,
 	):
 		"""
 		Join RC data pulled from this OMX with an existing DataFrame.
@@ -944,6 +961,8 @@ class OMX(_omx_base_class):
 			from, and the mapping is then used to rename the columns.
 		prefix : str, optional
 			Add this prefix to every matrix name used.
+		tile_cache : TileCache or bool, default True
+			How to read the values, see `get_rc_dataframe`.
 
 		Returns
 		-------
@@ -962,6 +981,7 @@ class OMX(_omx_base_class):
 			_col,
 			mat_names,
 			index=df.index,
+			tile_cache=tile_cache,
 		)
 		if prefix:
 			data = data.add_prefix(prefix)
@@ -18,47 +18,85 @@ def doctor(
 		repair_nan_wt=None,
 		repair_nan_data_co=None,
 		verbose=3,
+		fused=True,
 ):
+	"""
+	Check the data for common problems, and optionally repair them.
+
+	Parameters
+	----------
+	dfs : DataFrames or Model
+		The data to check
+	repair_ch_av, repair_ch_zq, repair_noch_nowt, repair_nan_wt, repair_nan_data_co
+		How to repair each problem, see `chosen_but_not_available`,
+		`chosen_but_zero_quantity`, `nothing_chosen_but_nonzero_weight`,
+		`nan_weight` and `nan_data_co`.
+	repair_asc
+		Not implemented.
+	verbose : int, default 3
+		The number of example rows to list for each problem.
+	fused : bool, default True
+		Run all the checks in one compiled pass over the data, using
+		`larch.numba.validation.validate_data`, if numba is available.
+		Otherwise each check makes its own pass.
+
+	Returns
+	-------
+	dfs : DataFrames or Model
+		The revised data
+	problems : dictx
+		The diagnosis of each problem found.
+	"""
 	problems = dictx()
 
 	if isinstance(dfs, Model) and dfs.dataframes is None:
 		raise ValueError('no dataframes loaded, try `.load_data()` first')
 
-	logger.info("checking for chosen-but-zero-quantity")
-	dfs, diagnosis = chosen_but_zero_quantity(dfs, repair=repair_ch_zq, verbose=verbose)
-	if diagnosis is not None:
-		logger.warning(f'problem: chosen-but-zero-quantity ({len(diagnosis)} issues)')
-		problems['chosen_but_zero_quantity'] = diagnosis
-
-	logger.info("checking for chosen-but-not-available")
-	dfs, diagnosis = chosen_but_not_available(dfs, repair=repair_ch_av, verbose=verbose)
-	if diagnosis is not None:
-		logger.warning(f'problem: chosen-but-not-available ({len(diagnosis)} issues)')
-		problems['chosen_but_not_available'] = diagnosis
-
-	logger.info("checking for nothing-chosen-but-nonzero-weight")
-	dfs, diagnosis = nothing_chosen_but_nonzero_weight(dfs, repair=repair_noch_nowt, verbose=verbose)
-	if diagnosis is not None:
-		logger.warning(f'problem: nothing-chosen-but-nonzero-weight ({len(diagnosis)} issues)')
-		problems['nothing_chosen_but_nonzero_weight'] = diagnosis
-
-	logger.info("checking for nan-weight")
-	dfs, diagnosis = nan_weight(dfs, repair=repair_nan_wt, verbose=verbose)
-	if diagnosis is not None:
-		logger.warning(f'problem: nan-weight ({len(diagnosis)} issues)')
-		problems['nan_weight'] = diagnosis
-
-	logger.info("checking for nan-data_co")
-	dfs, diagnosis = nan_data_co(dfs, repair=repair_nan_data_co, verbose=verbose)
-	if diagnosis is not None:
-		logger.warning(f'problem: nan-data_co')
-		problems['nan_data_co'] = diagnosis
-
-	logger.info("checking for low-variance-data-co")
-	dfs, diagnosis = low_variance_data_co(dfs, repair=None, verbose=verbose)
-	if diagnosis is not None:
-		logger.warning(f'problem: low-variance-data-co ({len(diagnosis)} issues)')
-		problems['low_variance_data_co'] = diagnosis
+	if fused:
+		try:
+			from .numba.validation import validate_data
+		except ImportError:
+			fused = False
+
+	if fused:
+		logger.info("checking data")
+		dfs, diagnoses = validate_data(
+			dfs,
+			repair_ch_av=repair_ch_av,
+			repair_ch_zq=repair_ch_zq,
+			repair_noch_nowt=repair_noch_nowt,
+			repair_nan_wt=repair_nan_wt,
+			repair_nan_data_co=repair_nan_data_co,
+			verbose=verbose,
+		)
+	else:
+		diagnoses = {}
+
+		logger.info("checking for chosen-but-zero-quantity")
+		dfs, diagnoses['chosen_but_zero_quantity'] = chosen_but_zero_quantity(dfs, repair=repair_ch_zq, verbose=verbose)
+
+		logger.info("checking for chosen-but-not-available")
+		dfs, diagnoses['chosen_but_not_available'] = chosen_but_not_available(dfs, repair=repair_ch_av, verbose=verbose)
+
+		logger.info("checking for nothing-chosen-but-nonzero-weight")
+		dfs, diagnoses['nothing_chosen_but_nonzero_weight'] = nothing_chosen_but_nonzero_weight(dfs, repair=repair_noch_nowt, verbose=verbose)
+
+		logger.info("checking for nan-weight")
+		dfs, diagnoses['nan_weight'] = nan_weight(dfs, repair=repair_nan_wt, verbose=verbose)
+
+		logger.info("checking for nan-data_co")
+		dfs, diagnoses['nan_data_co'] = nan_data_co(dfs, repair=repair_nan_data_co, verbose=verbose)
+
+		logger.info("checking for low-variance-data-co")
+		dfs, diagnoses['low_variance_data_co'] = low_variance_data_co(dfs, repair=None, verbose=verbose)
+
+	for name, diagnosis in diagnoses.items():
+		if diagnosis is not None:
+			if name == 'nan_data_co':
+				logger.warning(f'problem: nan-data_co')
+			else:
+				logger.warning(f'problem: {name.replace("_", "-")} ({len(diagnosis)} issues)')
+			problems[name] = diagnosis
 
 	# if repair_asc:
 	# 	x = self.cleanup_asc_problems()
@@ -54,3 +54,37 @@ def define_min_masks_from_df( df ):
 	"""
 	bitmask_sizes = [ int(numpy.ceil(numpy.log2(len(numpy.unique(df[s]))))) for s in df.columns ]
 	return define_masks(bitmask_sizes)
+
+
+def pack_bits(flags):
+	"""
+	Pack a two dimensional array of boolean flags into bits.
+
+	Parameters
+	----------
+	flags : array-like, shape [n_rows, n_flags]
+
+	Returns
+	-------
+	numpy.ndarray
+		A uint8 array of shape [n_rows, ceil(n_flags / 8)], where flag `j` of
+		each row is bit `7 - (j % 8)` of byte `j // 8`.
+	"""
+	return numpy.packbits(numpy.asarray(flags) != 0, axis=1)
+
+
+def unpack_bits(packed, n_flags):
+	"""
+	Unpack bits made by `pack_bits` into an int8 array of flags.
+
+	Parameters
+	----------
+	packed : array-like, shape [n_rows, n_bytes]
+	n_flags : int
+
+	Returns
+	-------
+	numpy.ndarray
+		An int8 array of shape [n_rows, n_flags].
+	"""
+	return numpy.unpackbits(numpy.asarray(packed, dtype=numpy.uint8), axis=1, count=n_flags).astype(numpy.int8)
@@ -0,0 +1,348 @@
+import weakref
+import numpy
+import pandas
+from multiprocessing import shared_memory
+
+_SEGMENTS = ('co', 'ca', 'ce', 'av', 'ch', 'wt')
+_ALIGN = 64
+
+
+class _SharedMemory(shared_memory.SharedMemory):
+
+	def __del__(self):
+		try:
+			self.close()
+		except (OSError, BufferError):
+			# arrays still view this block; it is unmapped when they are released
+			pass
+
+
+def _attach(name):
+	try:
+		# don't let the resource tracker of a worker unlink the owner's block
+		return _SharedMemory(name=name, track=False)
+	except TypeError: # python < 3.13
+		return _SharedMemory(name=name)
+
+
+def release_blocks(blocks):
+	"""
+	Unlink and close shared memory blocks.
+	"""
+	for shm in blocks:
+		try:
+			shm.unlink()
+		except FileNotFoundError:
+			pass
+		try:
+			shm.close()
+		except BufferError:
+			pass
+
+
+def share_arrays(arrays):
+	"""
+	Copy arrays into shared memory blocks, one block per array.
+
+	Parameters
+	----------
+	arrays : Iterable[array-like]
+
+	Returns
+	-------
+	blocks : list[SharedMemory]
+		The blocks, which the caller must release (see `release_blocks`)
+		when done.
+	specs : list[tuple]
+		The (name, shape, dtype) of each block, for `attach_arrays`.
+	"""
+	blocks, specs = [], []
+	try:
+		for a in arrays:
+			a = numpy.ascontiguousarray(a)
+			shm = _SharedMemory(create=True, size=max(a.nbytes, 1))
+			numpy.ndarray(a.shape, dtype=a.dtype, buffer=shm.buf)[...] = a
+			blocks.append(shm)
+			specs.append((shm.name, a.shape, a.dtype.str))
+	except:
+		release_blocks(blocks)
+		raise
+	return blocks, specs
+
+
+def attach_arrays(specs):
+	"""
+	Map arrays placed in shared memory by `share_arrays`.
+
+	Parameters
+	----------
+	specs : Sequence[tuple]
+
+	Returns
+	-------
+	blocks : list[SharedMemory]
+		The attached blocks, which must be kept alive as long as the
+		arrays are used.
+	arrays : tuple[ndarray]
+	"""
+	blocks = [_attach(name) for name, _, _ in specs]
+	arrays = tuple(
+		numpy.ndarray(shape, dtype=numpy.dtype(dtype), buffer=shm.buf)
+		for shm, (_, shape, dtype) in zip(blocks, specs)
+	)
+	return blocks, arrays
+
+
+def _aligned(nbytes):
+	return -(-nbytes // _ALIGN) * _ALIGN
+
+
+def _column_runs(df):
+	"""
+	Split the columns of a DataFrame into runs of consecutive columns of one dtype.
+
+	Returns
+	-------
+	list of (start, stop, dtype)
+	"""
+	runs = []
+	dtypes = list(df.dtypes)
+	start = 0
+	for j in range(1, len(dtypes) + 1):
+		if j == len(dtypes) or dtypes[j] != dtypes[start]:
+			runs.append((start, j, numpy.dtype(dtypes[start])))
+			start = j
+	return runs
+
+
+class SharedMemoryHandle():
+	"""
+	A picklable handle to the data of a DataFrames placed in shared memory.
+
+	Each data segment (co, ca, ce, av, ch, wt) is stored in one shared
+	memory block, holding each run of consecutive columns with a common
+	dtype as a C-contiguous [n_rows, n_columns] array, and the case index
+	is stored in another block.  Pickling the handle (or a DataFrames or
+	model that holds it) only serializes the block names and the column
+	labels (and the index of idce data), and unpickling it in another
+	process attaches to the same blocks without copying the data.
+
+	Handles are created by `DataFrames.to_shared_memory`.  The handle in
+	the creating process owns the blocks, and they are released when it
+	is garbage collected or when `unlink` is called, so the owner must be
+	kept alive until the workers that use the data are done.
+	"""
+
+	def __init__(self, segments, metadata):
+		self._segments = segments
+		self._metadata = metadata
+		self._blocks = []
+		self._owner = False
+		self._finalizer = None
+
+	@classmethod
+	def create(cls, dataframes):
+		"""
+		Copy the data of a DataFrames into new shared memory blocks.
+
+		Parameters
+		----------
+		dataframes : DataFrames
+
+		Returns
+		-------
+		SharedMemoryHandle
+
+		Raises
+		------
+		TypeError
+			If any data column has an object dtype, which cannot be
+			placed in shared memory.
+		"""
+		segments = {}
+		blocks = []
+		caseindex = dataframes.caseindex
+		alt_codes = dataframes.alternative_codes()
+		try:
+			if isinstance(getattr(caseindex, 'dtype', None), numpy.dtype) and not caseindex.dtype.hasobject:
+				# the case index is shared by most segments, and stored like data
+				shm = _SharedMemory(create=True, size=max(caseindex.nbytes, 1))
+				blocks.append(shm)
+				numpy.ndarray(len(caseindex), dtype=caseindex.dtype, buffer=shm.buf)[:] = caseindex
+				segments['caseindex'] = dict(
+					name=shm.name,
+					dtype=caseindex.dtype.str,
+					n_rows=len(caseindex),
+					index_name=caseindex.name,
+				)
+			for seg in _SEGMENTS:
+				df = getattr(dataframes, f'data_{seg}')
+				if df is None:
+					continue
+				series = isinstance(df, pandas.Series)
+				if series:
+					df = df.to_frame()
+				runs = _column_runs(df)
+				for start, stop, dtype in runs:
+					if dtype.hasobject:
+						raise TypeError(
+							f'data_{seg} column {df.columns[start]!r} has dtype {dtype}, '
+							f'which cannot be placed in shared memory'
+						)
+				if 'caseindex' in segments and df.index.equals(caseindex):
+					index = 'case'
+				elif (
+						'caseindex' in segments
+						and seg == 'ca'
+						and df.index.equals(pandas.MultiIndex.from_product([caseindex, alt_codes]))
+				):
+					index = 'case_alt'
+				else:
+					index = df.index
+				layout = []
+				nbytes = 0
+				for start, stop, dtype in runs:
+					layout.append((start, stop, dtype.str, nbytes))
+					nbytes += _aligned(len(df) * (stop - start) * dtype.itemsize)
+				shm = _SharedMemory(create=True, size=max(nbytes, 1))
+				blocks.append(shm)
+				for start, stop, dtype, offset in layout:
+					arr = numpy.ndarray((len(df), stop - start), dtype=dtype, buffer=shm.buf, offset=offset)
+					arr[:] = df.iloc[:, start:stop].to_numpy()
+					del arr
+				segments[seg] = dict(
+					name=shm.name,
+					layout=layout,
+					n_rows=len(df),
+					index=index,
+					index_names=list(df.index.names),
+					columns=df.columns,
+					series=series,
+				)
+		except:
+			release_blocks(blocks)
+			raise
+		metadata = dict(
+			alt_codes=alt_codes,
+			alt_names=dataframes.alternative_names(),
+			weight_normalization=dataframes.weight_normalization,
+			computational=dataframes.computational,
+			case_map=dataframes.case_map,
+		)
+		self = cls(segments, metadata)
+		self._blocks = blocks
+		self._owner = True
+		self._finalizer = weakref.finalize(self, release_blocks, blocks)
+		return self
+
+	@property
+	def owner(self):
+		"""bool : Whether this handle owns the shared memory blocks."""
+		return self._owner
+
+	@property
+	def nbytes(self):
+		"""int : The total size of the shared memory blocks."""
+		total = 0
+		for seg, info in self._segments.items():
+			if seg == 'caseindex':
+				total += info['n_rows'] * numpy.dtype(info['dtype']).itemsize
+			else:
+				for start, stop, dtype, offset in info['layout']:
+					total += _aligned(info['n_rows'] * (stop - start) * numpy.dtype(dtype).itemsize)
+		return total
+
+	def attach(self):
+		"""
+		A DataFrames whose data are views of the shared memory blocks.
+
+		The co, ca, ce and av data are read-only.  The ch and wt data
+		are writeable, and changes to them (e.g. by
+		`DataFrames.autoscale_weights`) are seen by every process.
+
+		Returns
+		-------
+		DataFrames
+		"""
+		from ..dataframes import DataFrames
+		if not self._blocks:
+			self._blocks = [_attach(info['name']) for info in self._segments.values()]
+		blocks = dict(zip(self._segments, self._blocks))
+		caseindex = None
+		if 'caseindex' in self._segments:
+			info = self._segments['caseindex']
+			caseindex = pandas.Index(
+				numpy.ndarray(info['n_rows'], dtype=info['dtype'], buffer=blocks['caseindex'].buf),
+				name=info['index_name'],
+				copy=False,
+			)
+		kwargs = {}
+		for seg, info in self._segments.items():
+			if seg == 'caseindex':
+				continue
+			if isinstance(info['index'], str) and info['index'] == 'case':
+				index = caseindex.rename(info['index_names'][0])
+			elif isinstance(info['index'], str) and info['index'] == 'case_alt':
+				index = pandas.MultiIndex.from_product(
+					[caseindex, self._metadata['alt_codes']],
+					names=info['index_names'],
+				)
+			else:
+				index = info['index']
+			frames = []
+			for start, stop, dtype, offset in info['layout']:
+				arr = numpy.ndarray(
+					(info['n_rows'], stop - start),
+					dtype=dtype,
+					buffer=blocks[seg].buf,
+					offset=offset,
+				)
+				# read-only data is shared by the DataFrames instead of copied
+				arr.flags.writeable = seg in ('ch', 'wt')
+				frames.append(pandas.DataFrame(
+					arr,
+					index=index,
+					columns=info['columns'][start:stop],
+					copy=False,
+				))
+			if len(frames) == 1:
+				df = frames[0]
+			else:
+				df = pandas.concat(frames, axis=1, copy=False)
+			if info['series']:
+				df = df.iloc[:, 0]
+			kwargs[seg] = df
+		result = DataFrames(
+			alt_codes=self._metadata['alt_codes'],
+			alt_names=self._metadata['alt_names'],
+			**kwargs,
+		)
+		result.weight_normalization = self._metadata['weight_normalization']
+		if self._metadata['computational']:
+			result.computational = True
+		result._set_shared_memory(self)
+		return result
+
+	def unlink(self):
+		"""
+		Release the shared memory blocks.
+
+		Processes that have already attached keep their data until it is
+		garbage collected, but the blocks can no longer be attached.
+		This has no effect on a handle that does not own the blocks.
+		"""
+		if self._finalizer is not None:
+			self._finalizer()
+
+	def __getstate__(self):
+		return self._segments, self._metadata
+
+	def __setstate__(self, state):
+		self._segments, self._metadata = state
+		self._blocks = []
+		self._owner = False
+		self._finalizer = None
+
+	def __repr__(self):
+		segs = ", ".join(self._segments)
+		return f"<larch.SharedMemoryHandle ({segs}) {self.nbytes} bytes{' owner' if self._owner else ''}>"
@@ -565,6 +565,105 @@ def test_dfs_feathers():
 			dfs2.caseindex,
 		)
 
+def test_dfs_feathers_memory_map():
+	import tempfile
+	m = example(1)
+	m.load_data()
+	ll = m.loglike()
+	with tempfile.TemporaryDirectory() as td:
+		filename = os.path.join(td, 'dfs')
+		m.dataframes.to_feathers(filename, compression='uncompressed')
+		dfs = DataFrames.from_feathers(filename, memory_map=True)
+		for seg in ['co', 'ca', 'av', 'ch']:
+			pandas.testing.assert_frame_equal(
+				getattr(dfs, f'data_{seg}'),
+				getattr(m.dataframes, f'data_{seg}'),
+				check_names=False,
+			)
+		# read-only arrays are views of the mapped files
+		assert not dfs.array_co().flags.writeable
+		assert not dfs.array_ca().flags.writeable
+		assert not dfs.array_av().flags.writeable
+		assert dfs.array_ch().flags.writeable
+		m.dataframes = dfs
+		assert m.loglike() == approx(ll)
+		del m, dfs
+
+def test_dfs_does_not_alias_caller_data():
+	ca = pandas.read_csv(example_file('MTCwork.csv.gz'), index_col=('casenum', 'altnum'))
+	co = ca.groupby(level=0).first()[['hhinc', 'age']]
+	co_before = co.copy()
+	ca_before = ca.copy()
+	d = DataFrames(co=co, ca=ca, ch='chose')  # the sparse ca data is stored as idce
+	d.data_co.iloc[0, 0] = -1
+	d.data_ce.iloc[0, 1] = -1
+	pandas.testing.assert_frame_equal(co, co_before)
+	pandas.testing.assert_frame_equal(ca, ca_before)
+	d.data_co = co
+	d.data_co.iloc[:, :] = numpy.nan
+	pandas.testing.assert_frame_equal(co, co_before)
+
+def test_partitioned_dataset():
+	import tempfile
+	from larch.examples import MTC
+	from larch.data_services import PartitionedDataset
+	d = MTC()
+	m = example(1)
+	m.load_data()
+	ll = m.loglike()
+	with tempfile.TemporaryDirectory() as td:
+		ds = PartitionedDataset.write(d, td, cases_per_partition=1000)
+		assert ds.n_partitions == 6
+		assert ds.n_cases == 5029
+		m.dataservice = ds
+		m.load_data()
+		# only the columns used by the model are read
+		assert list(m.dataframes.data_co.columns) == ['hhinc']
+		assert m.loglike() == approx(ll)
+		raw = ds.load(['hhinc'], ['tottime'], selector='hhinc > 50')
+		assert raw.n_cases == (d.data_co.hhinc > 50).sum()
+		assert list(raw.data_co.columns) == ['hhinc']
+		assert list(raw.data_ca.columns) == ['tottime']
+		numpy.testing.assert_array_equal(
+			raw.caseindex,
+			d.data_co.index[d.data_co.hhinc > 50],
+		)
+		raw = ds.load(['hhinc'], [], partitions=[1, 3])
+		assert raw.n_cases == 2000
+		numpy.testing.assert_array_equal(
+			raw.data_ch.to_numpy(),
+			d.data_ch.to_numpy()[numpy.r_[1000:2000, 3000:4000]],
+		)
+		del m, ds, raw
+
+def test_dfs_shared_memory():
+	import pickle
+	m = example(1)
+	m.load_data()
+	ll = m.loglike()
+	with raises(TypeError):
+		pickle.dumps(m.dataframes)
+	shared = m.dataframes.to_shared_memory()
+	assert shared.shared_memory.owner
+	for seg in ['co', 'ca', 'av', 'ch']:
+		pandas.testing.assert_frame_equal(
+			getattr(shared, f'data_{seg}'),
+			getattr(m.dataframes, f'data_{seg}'),
+		)
+	m.dataframes = shared
+	# only the handle is pickled, and the unpickled data views the same memory
+	assert len(pickle.dumps(shared)) < shared.data_ca.values.nbytes / 10
+	attached = pickle.loads(pickle.dumps(shared))
+	assert not attached.shared_memory.owner
+	pandas.testing.assert_frame_equal(attached.data_ca, shared.data_ca)
+	shared.data_ch.values[0, 0] += 1
+	assert attached.data_ch.values[0, 0] == shared.data_ch.values[0, 0]
+	shared.data_ch.values[0, 0] -= 1
+	m2 = pickle.loads(pickle.dumps(m))
+	assert m2.dataframes.shared_memory is not None
+	assert m2.loglike() == approx(ll)
+	del m2, attached
+
 def test_promotion_ce_to_ca():
 	from larch.data_warehouse import example_file
 
@@ -578,3 +677,58 @@ def test_promotion_ce_to_ca():
 	assert dfs.data_ca is not None
 	assert dfs.data_ca.shape == (30174, 6)
 
+
+
+def test_compress_cases():
+	m = example(1)
+	m.load_data()
+	d = m.dataframes
+	n_copies = 3
+	shift = lambda k: d.data_co.index.max() * k
+
+	def copies(df):
+		return pandas.concat([df.set_axis(df.index + shift(k)) for k in range(n_copies)])
+
+	ca = pandas.concat([
+		d.data_ca.set_axis(d.data_ca.index.set_levels(d.data_ca.index.levels[0] + shift(k), level=0))
+		for k in range(n_copies)
+	])
+	d3 = DataFrames(
+		co=copies(d.data_co), ca=ca, av=copies(d.data_av), ch=copies(d.data_ch),
+		alt_codes=d.alternative_codes(),
+	)
+	dc = d3.compress_cases()
+	assert dc.n_cases <= d.n_cases
+	assert dc.total_weight() == approx(d3.n_cases)
+	assert len(dc.case_map) == d3.n_cases
+	assert dc.case_map.iloc[0] == dc.case_map.iloc[d.n_cases] == 0
+
+	m3 = example(1)
+	m3.dataframes = d3
+	mc = example(1)
+	mc.dataframes = dc
+	assert mc.loglike() == approx(m3.loglike())
+	numpy.testing.assert_allclose(mc.d_loglike(), m3.d_loglike())
+
+	pr = dc.expand_cases(mc.probability(return_dataframe=True))
+	assert list(pr.index) == list(d3.caseindex)
+	numpy.testing.assert_allclose(pr.to_numpy(), m3.probability(), rtol=1e-6)
+
+	with raises(ValueError):
+		d3.expand_cases(numpy.zeros(d3.n_cases))
+
+def test_compress_cases_idce():
+	ce = pandas.read_csv(example_file('MTCwork.csv.gz'), index_col=('casenum', 'altnum'))
+	shift = ce.index.levels[0].max()
+	ce2 = pandas.concat([
+		ce,
+		ce.set_axis(ce.index.set_levels(ce.index.levels[0] + shift, level=0)),
+	])
+	d1 = DataFrames(ce, ch="chose", crack=True)
+	d2 = DataFrames(ce2, ch="chose", crack=True)
+	assert d2.data_ce is not None
+	assert d2.n_cases == 2 * d1.n_cases
+	# unavailable alternatives are NaN in the unstacked idce data, and
+	# must still match between identical cases
+	assert d2.compress_cases().n_cases == d1.compress_cases().n_cases
+	assert d2.compress_cases().n_cases <= d1.n_cases
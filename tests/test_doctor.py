@@ -30,3 +30,72 @@ def test_doctor_before_load_data():
 	with raises(ValueError):
 		larch.Model().doctor()
 
+
+def damaged_model(weighted=True):
+	m = larch.Model.Example(1)
+	if weighted:
+		m.weight_co_var = 'hhowndum'
+	m.load_data()
+	if weighted:
+		m.dataframes.data_wt = m.dataframes.data_wt.div(m.dataframes.data_wt)
+	m.dataframes.data_co.iloc[5:9, 0] = numpy.nan
+	m.dataframes.data_ch.iloc[3:20, :] = 0
+	m.dataframes.data_av.iloc[30:40, 0] = 0
+	return m
+
+
+def test_fused_doctor_matches_separate_checks():
+
+	for repairs in [
+		{},
+		dict(repair_ch_av='-', repair_noch_nowt='-', repair_nan_wt=True, repair_nan_data_co=True),
+		dict(repair_ch_av='+', repair_noch_nowt='*'),
+	]:
+		m_fused, d_fused = damaged_model().doctor(fused=True, **repairs)
+		m_separate, d_separate = damaged_model().doctor(fused=False, **repairs)
+		assert list(d_fused) == list(d_separate)
+		for k in d_fused:
+			pandas.testing.assert_frame_equal(d_fused[k], d_separate[k])
+		for seg in ['ch', 'av', 'wt', 'co']:
+			pandas.testing.assert_frame_equal(
+				getattr(m_fused.dataframes, f'data_{seg}'),
+				getattr(m_separate.dataframes, f'data_{seg}'),
+			)
+
+
+@pytest.mark.parametrize("storage", ["memory_map", "shared_memory"])
+def test_fused_doctor_read_only_data(storage, tmp_path):
+	import pickle
+	from larch import DataFrames
+	pytest.importorskip("numba")
+
+	def read_only(name):
+		source = damaged_model(weighted=False).dataframes
+		if storage == "memory_map":
+			source.to_feathers(str(tmp_path / name), compression='uncompressed')
+			return DataFrames.from_feathers(str(tmp_path / name), memory_map=True), source
+		source = source.to_shared_memory()
+		return pickle.loads(pickle.dumps(source)), source
+
+	for name, repairs in [
+		('none', {}),
+		('drop', dict(repair_ch_av='-')),
+		('add', dict(repair_ch_av='+')),
+	]:
+		m = larch.Model.Example(1)
+		m.dataframes, source = read_only(name)
+		assert not m.dataframes.data_av.values.flags.writeable
+		m, d = m.doctor(fused=True, **repairs)
+		m_expected, d_expected = damaged_model(weighted=False).doctor(fused=True, **repairs)
+		assert list(d) == list(d_expected)
+		for k in d:
+			pandas.testing.assert_frame_equal(d[k], d_expected[k])
+		for seg in ['ch', 'av']:
+			pandas.testing.assert_frame_equal(
+				getattr(m.dataframes, f'data_{seg}'),
+				getattr(m_expected.dataframes, f'data_{seg}'),
+				check_names=False,
+				check_dtype=False,
+			)
+		# the read-only availability data is replaced, not written to
+		assert (source.data_av.iloc[30:40, 0] == 0).all()
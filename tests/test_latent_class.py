@@ -1,4 +1,4 @@
-from pytest import approx, fixture, raises
+from pytest import approx, fixture, raises, warns
 
 import larch
 import pandas
@@ -175,3 +175,258 @@ def test_latent_class_full_data(swissmetro_raw_df):
 		'B_TIME': -40104.940072046316,
 		'W_OTHER': 245.43145056623683,
 	})
+
+
+def _fused_test_model(raw_df, cls):
+	dfs = larch.DataFrames(raw_df, alt_codes=[1,2,3])
+	m1 = larch.Model(dataservice=dfs)
+	m1.availability_co_vars = {
+		1: "TRAIN_AV_SP",
+		2: "SM_AV",
+		3: "CAR_AV_SP",
+	}
+	m1.choice_co_code = 'CHOICE'
+	m1.utility_co[1] = P("ASC_TRAIN") + X("TRAIN_CO*(GA==0)") * P("B_COST")
+	m1.utility_co[2] = X("SM_CO*(GA==0)") * P("B_COST")
+	m1.utility_co[3] = P("ASC_CAR") + X("CAR_CO") * P("B_COST")
+
+	m2 = larch.Model(dataservice=dfs)
+	m2.availability_co_vars = {
+		1: "TRAIN_AV_SP",
+		2: "SM_AV",
+		3: "CAR_AV_SP",
+	}
+	m2.choice_co_code = 'CHOICE'
+	m2.utility_co[1] = P("ASC_TRAIN") + X("TRAIN_TT") * P("B_TIME") + X("TRAIN_CO*(GA==0)") * P("B_COST")
+	m2.utility_co[2] = X("SM_TT") * P("B_TIME") + X("SM_CO*(GA==0)") * P("B_COST")
+	m2.utility_co[3] = P("ASC_CAR") + X("CAR_TT") * P("B_TIME") + X("CAR_CO") * P("B_COST")
+	m2.graph.new_node(parameter='MU_PUBLIC', children=[1,2])
+
+	km = larch.Model()
+	km.utility_co[2] = P.W_OTHER
+
+	m = cls(km, {1:m1, 2:m2})
+	m.load_data()
+	m.set_value(P.ASC_CAR, 0.125)
+	m.set_value(P.ASC_TRAIN, -0.398)
+	m.set_value(P.B_COST, -.0126)
+	m.set_value(P.B_TIME, -0.028)
+	m.set_value(P.W_OTHER, 1.095)
+	m.set_value(P.MU_PUBLIC, 0.8)
+	return m
+
+
+def test_latent_class_fused_kernel(swissmetro_raw_df):
+	import numpy
+	from larch.model.latentclass import LatentClassModel
+	from larch.numba.latentclass import LatentClassModel as FusedLatentClassModel
+
+	base = _fused_test_model(swissmetro_raw_df, LatentClassModel)
+	fused = _fused_test_model(swissmetro_raw_df, FusedLatentClassModel)
+
+	assert fused.loglike() == approx(base.loglike(), rel=1e-12)
+	r_base = base.loglike2_bhhh()
+	r_fused = fused.loglike2_bhhh()
+	assert r_fused.ll == approx(r_base.ll, rel=1e-12)
+	assert r_fused.dll == approx(numpy.asarray(r_base.dll), rel=1e-8, abs=1e-8)
+	assert r_fused.bhhh == approx(numpy.asarray(r_base.bhhh), rel=1e-8)
+
+	pr = base.probability()
+	d_pr = base.d_probability()
+	ch = base.dataframes.array_ch()
+	casewise_dll = numpy.einsum('ca,cap->cp', ch / numpy.where(pr > 0, pr, 1), d_pr)
+	assert r_fused.bhhh == approx(casewise_dll.T @ casewise_dll, rel=1e-8)
+
+	fused.lock_value(P.MU_PUBLIC, 0.8)
+	r_locked = fused.loglike2_bhhh()
+	position = fused.pf.index.get_loc('MU_PUBLIC')
+	assert r_locked.dll[position] == 0
+	assert numpy.all(r_locked.bhhh[position] == 0)
+
+
+def test_latent_class_fused_kernel_choice_amounts(swissmetro_raw_df):
+	import numpy
+	from larch.model.latentclass import LatentClassModel
+	from larch.numba.latentclass import LatentClassModel as FusedLatentClassModel
+
+	def with_amounts(m):
+		# repeated and split choices, some cases with no choice, and weights
+		x = m.dataframes
+		rng = numpy.random.default_rng(0)
+		ch = x.data_ch * rng.integers(1, 4, size=(x.n_cases, 1))
+		ch.iloc[::5, 1] += 0.5 * x.data_av.iloc[::5, 1]
+		ch.iloc[::7] = 0
+		m.dataframes = larch.DataFrames(
+			co=x.data_co,
+			av=x.data_av,
+			ch=ch,
+			wt=pandas.Series(rng.uniform(0.5, 2.0, x.n_cases), index=x.caseindex),
+			alt_codes=x.alternative_codes(),
+		)
+		return m
+
+	base = with_amounts(_fused_test_model(swissmetro_raw_df, LatentClassModel))
+	fused = with_amounts(_fused_test_model(swissmetro_raw_df, FusedLatentClassModel))
+
+	assert fused.loglike() == approx(base.loglike(), rel=1e-12)
+	r_base = base.loglike2_bhhh()
+	r_fused = fused.loglike2_bhhh()
+	assert r_fused.ll == approx(r_base.ll, rel=1e-12)
+	assert r_fused.dll == approx(numpy.asarray(r_base.dll), rel=1e-8, abs=1e-8)
+	assert r_fused.bhhh == approx(numpy.asarray(r_base.bhhh), rel=1e-8)
+
+	check = base.check_d_loglike()
+	assert check.data.similarity.min() > 4
+
+	# the class likelihood of a case is the product over its choices
+	h = base.class_responsibility()
+	assert h.to_numpy().sum(1) == approx(1.0)
+	ch = base.dataframes.array_ch()
+	wt = base.dataframes.array_wt().reshape(-1)
+	pi = base.class_membership_probability().to_numpy()
+	joint = numpy.zeros_like(pi)
+	for k_position, k_name in enumerate(base._k_model_names()):
+		k_pr = numpy.asarray(base._k_models[k_name].probability())[:, :3]
+		joint[:, k_position] = pi[:, k_position] * numpy.prod(numpy.where(ch > 0, k_pr, 1.0) ** ch, axis=1)
+	assert base.loglike() == approx((numpy.log(joint.sum(1)) * wt).sum(), rel=1e-10)
+
+
+def test_latent_class_em(swissmetro_raw_df):
+	import numpy
+	from larch.model.latentclass import LatentClassModel
+
+	dfs = larch.DataFrames(swissmetro_raw_df, alt_codes=[1,2,3])
+	k_models = {}
+	for k in (1, 2):
+		mk = larch.Model(dataservice=dfs)
+		mk.availability_co_vars = {
+			1: "TRAIN_AV_SP",
+			2: "SM_AV",
+			3: "CAR_AV_SP",
+		}
+		mk.choice_co_code = 'CHOICE'
+		mk.utility_co[1] = P(f"ASC_TRAIN_{k}") + X("TRAIN_CO*(GA==0)") * P(f"B_COST_{k}") + X("TRAIN_TT") * P(f"B_TIME_{k}")
+		mk.utility_co[2] = X("SM_CO*(GA==0)") * P(f"B_COST_{k}") + X("SM_TT") * P(f"B_TIME_{k}")
+		mk.utility_co[3] = P(f"ASC_CAR_{k}") + X("CAR_CO") * P(f"B_COST_{k}") + X("CAR_TT") * P(f"B_TIME_{k}")
+		k_models[k] = mk
+
+	km = larch.Model()
+	km.utility_co[2] = P.W_OTHER
+
+	m = LatentClassModel(km, k_models)
+	m.load_data()
+	m.set_value(P.B_COST_1, -0.01)
+	m.set_value(P.B_TIME_1, -0.01)
+	m.set_value(P.B_COST_2, -0.02)
+	m.set_value(P.B_TIME_2, -0.02)
+
+	h = m.class_responsibility()
+	assert h.shape == (m.n_cases, 2)
+	assert h.sum(1).to_numpy() == approx(numpy.ones(m.n_cases))
+
+	ll0 = m.loglike()
+	r1 = m.maximize_loglike_em(max_iter=3)
+	assert r1.iterations == 3
+	assert r1.loglike == approx(m.loglike())
+	assert r1.loglike > ll0
+	r2 = m.maximize_loglike_em(max_iter=3)
+	assert r2.loglike >= r1.loglike
+	assert r2.x.index.tolist() == m.pf.index.tolist()
+
+
+def test_latent_class_em_shared_parameters(swissmetro_raw_df):
+	from larch.model.latentclass import LatentClassModel
+
+	dfs = larch.DataFrames(swissmetro_raw_df, alt_codes=[1,2,3])
+	k_models = {}
+	for k in (1, 2):
+		mk = larch.Model(dataservice=dfs)
+		mk.availability_co_vars = {
+			1: "TRAIN_AV_SP",
+			2: "SM_AV",
+			3: "CAR_AV_SP",
+		}
+		mk.choice_co_code = 'CHOICE'
+		# B_COST is shared by both classes
+		mk.utility_co[1] = P(f"ASC_TRAIN_{k}") + X("TRAIN_CO*(GA==0)") * P("B_COST") + X("TRAIN_TT") * P(f"B_TIME_{k}")
+		mk.utility_co[2] = X("SM_CO*(GA==0)") * P("B_COST") + X("SM_TT") * P(f"B_TIME_{k}")
+		mk.utility_co[3] = P(f"ASC_CAR_{k}") + X("CAR_CO") * P("B_COST") + X("CAR_TT") * P(f"B_TIME_{k}")
+		k_models[k] = mk
+
+	km = larch.Model()
+	km.utility_co[2] = P.W_OTHER
+
+	m = LatentClassModel(km, k_models)
+	m.load_data()
+	m.set_value(P.B_COST, -0.01)
+	m.set_value(P.B_TIME_1, -0.01)
+	m.set_value(P.B_TIME_2, -0.02)
+
+	# the M-step maximizes the weighted class log likelihoods jointly,
+	# so their gradients for the shared parameter sum to zero
+	h = m.class_responsibility()
+	m.maximize_loglike_em(max_iter=1)
+	step_data = m._em_step_data(h)
+	submodels = m._em_submodels()
+	d_cost = 0
+	for k in (1, 2):
+		sub = submodels[k]
+		sub.dataframes = step_data[k]
+		sub.set_values(m.pf.value.reindex(sub.pf.index).to_dict())
+		d_cost += sub.loglike2().dll['B_COST']
+	assert abs(d_cost) < 1.0
+
+	lls = [m.loglike()]
+	for _ in range(4):
+		lls.append(m.maximize_loglike_em(max_iter=1).loglike)
+	assert all(b >= a - 1e-6 for a, b in zip(lls, lls[1:]))
+	assert lls[-1] > lls[0]
+	assert m.pf.value['B_COST'] != -0.01
+
+
+def test_latent_class_em_stopping_rule(swissmetro_raw_df):
+	from larch.model.latentclass import LatentClassModel
+
+	dfs = larch.DataFrames(swissmetro_raw_df, alt_codes=[1,2,3])
+	k_models = {}
+	for k in (1, 2):
+		mk = larch.Model(dataservice=dfs)
+		mk.availability_co_vars = {
+			1: "TRAIN_AV_SP",
+			2: "SM_AV",
+			3: "CAR_AV_SP",
+		}
+		mk.choice_co_code = 'CHOICE'
+		mk.utility_co[1] = P(f"ASC_TRAIN_{k}") + X("TRAIN_CO*(GA==0)") * P(f"B_COST_{k}") + X("TRAIN_TT") * P(f"B_TIME_{k}")
+		mk.utility_co[2] = X("SM_CO*(GA==0)") * P(f"B_COST_{k}") + X("SM_TT") * P(f"B_TIME_{k}")
+		mk.utility_co[3] = P(f"ASC_CAR_{k}") + X("CAR_CO") * P(f"B_COST_{k}") + X("CAR_TT") * P(f"B_TIME_{k}")
+		k_models[k] = mk
+
+	km = larch.Model()
+	km.utility_co[2] = P.W_OTHER
+
+	m = LatentClassModel(km, k_models)
+	m.load_data()
+	m.set_value(P.B_COST_1, -0.01)
+	m.set_value(P.B_TIME_1, -0.01)
+	m.set_value(P.B_COST_2, -0.02)
+	m.set_value(P.B_TIME_2, -0.02)
+
+	# updating the step data in place matches building it afresh
+	h1 = m.class_responsibility()
+	h2 = h1.copy()
+	h2.iloc[:, 0], h2.iloc[:, 1] = h1.iloc[:, 1], h1.iloc[:, 0]
+	step_data = m._em_step_data(h1)
+	m._em_update_step_data(step_data, h2)
+	for k_name, fresh in m._em_step_data(h2).items():
+		assert step_data[k_name].array_ch() == approx(fresh.array_ch())
+		assert step_data[k_name].array_wt() == approx(fresh.array_wt())
+
+	# a decrease in the log likelihood warns and does not count as convergence
+	lls = iter([-100.0, -101.0, -101.0])
+	m.loglike = lambda: next(lls)
+	with warns(RuntimeWarning, match='decreased the log likelihood'):
+		r = m.maximize_loglike_em(max_iter=5)
+	assert r.iterations == 2
+	assert r.message == 'converged'
+	assert r.loglike == -101.0
@@ -89,3 +89,46 @@ def test_simple_model_group():
 	mg3.append(m2)
 	mg3.doctor()
 	assert mg3.loglike() == approx(-3620.697667552756)
+
+
+def test_model_group_parallel_bhhh():
+	import numpy
+
+	df = pd.read_csv(example_file("MTCwork.csv.gz"))
+	df.set_index(['casenum','altnum'], inplace=True)
+	d = larch.DataFrames(df, ch='chose', crack=True)
+
+	members = []
+	for fem in (0, 1):
+		m = larch.Model(dataservice=d.selector_co(f"femdum == {fem}"))
+		m.utility_co[2] = P("ASC_SR2")  + P("hhinc#2") * X("hhinc")
+		m.utility_co[3] = P("ASC_SR3P") + P("hhinc#3") * X("hhinc")
+		m.utility_co[4] = P("ASC_TRAN") + P("hhinc#4") * X("hhinc")
+		m.utility_ca = P(f"tottime_{fem}")*X("tottime") + P("totcost")*X("totcost")
+		m.load_data()
+		members.append(m)
+
+	from larch.model.model_group import ModelGroup
+
+	mg = ModelGroup(members)
+	mg.set_values(ASC_SR2=-2.0, ASC_TRAN=-1.0, tottime_0=-0.05, tottime_1=-0.04, totcost=-0.003)
+	assert mg.pvals.dtype == numpy.float64
+
+	r = mg.loglike2_bhhh()
+	ll = 0
+	dll = pd.Series(0.0, index=mg.pf.index)
+	bhhh = pd.DataFrame(0.0, index=mg.pf.index, columns=mg.pf.index)
+	for m in members:
+		rm = m.loglike2_bhhh()
+		ll += rm.ll
+		dll[m.pf.index] += numpy.asarray(rm.dll)
+		bhhh.loc[m.pf.index, m.pf.index] += rm.bhhh
+	assert r.ll == approx(ll)
+	assert r.dll.to_numpy() == approx(dll.to_numpy())
+	assert r.bhhh == approx(bhhh.to_numpy())
+
+	mg.max_workers = 1
+	r1 = mg.loglike2_bhhh()
+	assert r1.ll == r.ll
+	assert r1.dll.to_numpy() == approx(r.dll.to_numpy(), rel=1e-12)
+	assert r1.bhhh == approx(r.bhhh, rel=1e-12)
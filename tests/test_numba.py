@@ -1099,3 +1099,573 @@ def test_model_pickling():
     m2.load_data()
     assert m2.loglike() == approx(-3626.1862555138796)
 
+
+
+def test_reduced_bhhh_matches_casewise():
+    from larch.numba import example
+    from larch.model.persist_flags import PERSIST_LOGLIKE_CASEWISE
+    m = example(22)
+    m.load_data()
+    m.set_values({'mu_motor': 0.8, 'mu_nonmotor': 0.6, 'motorized_time': -0.01})
+    reduced = m.loglike2_bhhh()
+    assert m.work_arrays.bhhh.strides[0] == 0
+    casewise = m.loglike2_bhhh(persist=PERSIST_LOGLIKE_CASEWISE)
+    assert reduced.ll == approx(casewise.ll)
+    assert reduced.ll == approx(casewise.ll_casewise.sum())
+    np.testing.assert_allclose(reduced.dll, casewise.dll, rtol=1e-7, atol=1e-9)
+    np.testing.assert_allclose(reduced.bhhh, casewise.bhhh, rtol=1e-7, atol=1e-9)
+    assert m.loglike() == approx(casewise.ll)
+    np.testing.assert_allclose(m.d_loglike(), casewise.dll, rtol=1e-7, atol=1e-9)
+    np.testing.assert_allclose(m.bhhh(), casewise.bhhh, rtol=1e-7, atol=1e-9)
+
+
+def test_dutility_slots_are_sparse():
+    from larch.numba import example
+    m = example(22)
+    m.load_data()
+    m.unmangle()
+    fixed = m._fixed_arrays
+
+    def node_params(n):
+        k = fixed.node_param_index[fixed.node_param_start[n]:fixed.node_param_start[n+1]]
+        return set(m.pf.index[k])
+
+    assert fixed.node_param_start[-1] == fixed.node_param_index.size
+    names = list(m.graph.standard_sort_names)
+    assert node_params(names.index('DA')) == {
+        'costbyincome', 'motorized_ovtbydist', 'motorized_time', 'nonmotorized_time',
+    }
+    nonmotorized = node_params(names.index('Nonmotorized'))
+    assert 'mu_nonmotor' in nonmotorized
+    assert 'mu_motor' not in nonmotorized
+    assert node_params(names.index('WALK')) <= nonmotorized
+    assert node_params(names.index('_root_')) == set(m.pf.index)
+    walk = names.index('WALK')
+    assert fixed.node_param_slot[walk, m.pf.index.get_loc('hhinc#4')] == -1
+
+
+@pytest.mark.parametrize("fmt", ["feather", "npy"])
+def test_streamed_cases(fmt, tmp_path):
+    from larch.numba import example
+    from larch.numba.streaming import FeatherCaseStream, NpyCaseStream
+    m = example(22)
+    m.load_data()
+    m.set_values({'mu_motor': 0.8, 'mu_nonmotor': 0.6, 'motorized_time': -0.01})
+    in_memory = m.loglike2_bhhh()
+
+    if fmt == "feather":
+        m.dataframes.to_feathers(tmp_path / "mtc")
+        stream = FeatherCaseStream(tmp_path / "mtc", block_size=1000)
+    else:
+        NpyCaseStream.write(m.dataframes, tmp_path / "mtc")
+        stream = NpyCaseStream(tmp_path / "mtc", block_size=1000)
+    assert stream.n_cases == m.n_cases
+
+    m2 = example(22)
+    m2.set_case_stream(stream)
+    m2.set_values(m.pf.value)
+    assert m2.n_cases == m.n_cases
+    assert m2.dataframes.n_cases == 1000
+    streamed = m2.loglike2_bhhh()
+    assert streamed.ll == approx(in_memory.ll)
+    np.testing.assert_allclose(streamed.dll, in_memory.dll, rtol=1e-7, atol=1e-9)
+    np.testing.assert_allclose(streamed.bhhh, in_memory.bhhh, rtol=1e-7, atol=1e-9)
+    with raises(ValueError):
+        m2.probability()
+    points = np.stack([m2.pvals, m2.pvals * 0.9])
+    np.testing.assert_allclose(
+        m2.loglike_multi(points).ll,
+        m.loglike_multi(points).ll,
+        rtol=1e-10,
+    )
+    # falls back to trying step lengths one at a time
+    ll, tolerance, n_iter, steps, message = m2.fit_bhhh(line_search_points=4, maxiter=2)
+    assert ll > streamed.ll
+
+
+def test_sampled_alternatives(mtc):
+    from larch.numba.sampling import sample_alternatives
+    s = sample_alternatives(mtc, 3, seed=42)
+    n_slots = s.alt_index.shape[1]
+    assert n_slots <= 4
+    assert s.dataframes.n_alts == n_slots
+    chosen = mtc.array_ch().argmax(1)
+    assert np.all((s.alt_index == chosen[:, None]).any(1))
+    # the chosen alternative is counted once more than it was drawn
+    assert np.all(s.pick_count.sum(1) == 4)
+    valid = s.alt_index >= 0
+    np.testing.assert_array_equal(s.dataframes.array_av(), valid)
+    rows = np.arange(mtc.n_cases)[:, None]
+    full_ca = mtc.array_ca()
+    compact_ca = s.dataframes.array_ca()
+    np.testing.assert_allclose(
+        compact_ca[:, :, :-1][valid],
+        full_ca[rows, np.where(valid, s.alt_index, 0)][valid],
+    )
+    np.testing.assert_allclose(
+        compact_ca[:, :, -1][valid],
+        np.log(s.pick_count[valid] / (3 * s.sampling_probability[valid])),
+    )
+
+    m = NumbaModel()
+    m.utility_ca = PX('tottime') + PX('totcost')
+    s.apply_to(m)
+    assert m.graph.n_elementals() == n_slots
+    assert m.pf.loc['_sampling_correction_', 'holdfast']
+
+    m_co = NumbaModel()
+    m_co.utility_ca = PX('tottime')
+    m_co.utility_co[2] = P.ASC_SR2
+    with raises(ValueError):
+        s.apply_to(m_co)
+
+
+def test_sampled_alternatives_recovery():
+    from larch.dataframes import DataFrames
+    from larch.numba.sampling import sample_alternatives
+    rng = np.random.default_rng(1)
+    n_cases, n_alts = 4000, 40
+    x1 = rng.normal(size=(n_cases, n_alts))
+    x2 = rng.uniform(0, 2, size=(n_cases, n_alts))
+    av = rng.random((n_cases, n_alts)) < 0.9
+    utility = -1.0 * x1 + 0.5 * x2 + rng.gumbel(size=(n_cases, n_alts))
+    utility[~av] = -np.inf
+    alt_codes = np.arange(1, n_alts+1)
+    ch = pd.DataFrame((utility == utility.max(1, keepdims=True)).astype(float), columns=alt_codes)
+    av = pd.DataFrame(av.astype(np.int8), columns=alt_codes)
+    # sampling weights that favor alternatives with high utility
+    ca = pd.DataFrame(
+        {'x1': x1.ravel(), 'x2': x2.ravel(), 'w': np.exp(-0.7 * x1).ravel()},
+        index=pd.MultiIndex.from_product([np.arange(n_cases), alt_codes], names=['case', 'alt']),
+    )
+    dfs = DataFrames(ca=ca, ch=ch, av=av, alt_codes=alt_codes)
+
+    s = sample_alternatives(dfs, 10, sampling_weights='w', seed=0)
+    m = NumbaModel()
+    m.utility_ca = PX('x1') + PX('x2')
+    s.apply_to(m)
+    m.maximize_loglike(quiet=True)
+    assert m.pf.value['x1'] == approx(-1.0, abs=0.05)
+    assert m.pf.value['x2'] == approx(0.5, abs=0.05)
+
+    # without the sampling correction the estimates are biased
+    m.lock_value('_sampling_correction_', 0.0)
+    m.set_values(x1=0, x2=0)
+    m.maximize_loglike(quiet=True)
+    assert m.pf.value['x1'] > -0.7
+
+    # the same sample is drawn from idce data
+    dfs_ce = DataFrames(ce=ca[av.to_numpy().ravel() != 0], ch=ch, av=av, alt_codes=alt_codes)
+    s_ce = sample_alternatives(dfs_ce, 10, sampling_weights='w', seed=0)
+    np.testing.assert_array_equal(s_ce.alt_index, s.alt_index)
+    np.testing.assert_allclose(s_ce.dataframes.array_ca(), s.dataframes.array_ca())
+
+
+def _central_d2_loglike(m, x):
+    result = np.zeros([len(x), len(x)])
+    for i in range(len(x)):
+        e = max(abs(x[i]), 1) * 1e-5
+        xp, xm = x.copy(), x.copy()
+        xp[i] += e
+        xm[i] -= e
+        result[:, i] = (m.d_loglike(xp) - m.d_loglike(xm)) / (2 * e)
+    m.set_values(x)
+    return result
+
+
+def test_analytic_hessian_nl():
+    from larch.numba import example
+    m = example(22)
+    m.load_data()
+    m.set_values({'mu_motor': 0.8, 'mu_nonmotor': 0.6, 'motorized_time': -0.01})
+    x = m.pvals.copy()
+    part = m.loglike3(return_bhhh=True)
+    assert part.ll == approx(m.loglike())
+    np.testing.assert_allclose(part.dll, m.d_loglike(), rtol=1e-7)
+    np.testing.assert_allclose(part.bhhh, m.bhhh(), rtol=1e-7)
+    np.testing.assert_allclose(part.d2ll, part.d2ll.T, rtol=1e-8, atol=1e-6)
+    fd = _central_d2_loglike(m, x)
+    np.testing.assert_allclose(part.d2ll, fd, rtol=1e-4, atol=1e-2)
+
+
+def test_analytic_hessian_quantity(mtcq):
+    m = NumbaModel()
+    m.utility_co[2] = P("ASC_SR2") + P("hhinc#2") * X("hhinc")
+    m.utility_co[4] = P("ASC_TRAN") + P("hhinc#4") * X("hhinc")
+    m.utility_ca = PX("tottime") + PX("totcost")
+    m.quantity_ca = (
+            + P("FakeSizeAlt") * X('altnum+1')
+            + P("FakeSizeIvtt") * X('ivtt+1')
+    )
+    m.quantity_scale = P.Theta
+    m.dataframes = mtcq
+    m.set_values({
+        'ASC_SR2': -0.5, 'ASC_TRAN': -0.1, 'hhinc#2': -0.001, 'hhinc#4': -0.002,
+        'totcost': -0.0013, 'tottime': -0.018, 'FakeSizeAlt': 0.123, 'Theta': 0.8,
+    })
+    x = m.pvals.copy()
+    d2ll = m.d2_loglike()
+    fd = _central_d2_loglike(m, x)
+    np.testing.assert_allclose(d2ll, fd, rtol=1e-4, atol=1e-2)
+
+
+def test_warmup():
+    import larch.numba
+    from larch.numba.warmup import startup_benchmark
+    timings = larch.numba.warmup(float_dtypes=(np.float64,), casewise=False)
+    assert set(timings) == {'float64'}
+    bench = startup_benchmark(n_repeat=1, with_warmup=False)
+    assert set(bench) == {'import_time', 'first_call_time', 'steady_state_time'}
+    assert all(t > 0 for t in bench.values())
+
+
+def test_float32_storage_with_float64_accumulation():
+    from larch.numba import example
+    m64 = example(22)
+    m64.load_data()
+    m32 = example(22)
+    m32.float_dtype = np.float32
+    m32.load_data()
+    assert m32._data_arrays.ca.dtype == np.float32
+    values = {'mu_motor': 0.8, 'mu_nonmotor': 0.6, 'motorized_time': -0.01}
+    r64 = m64.loglike2_bhhh(values)
+    r32 = m32.loglike2_bhhh(values)
+    assert r32.ll == approx(r64.ll, rel=1e-7)
+    assert r32.dll.dtype == np.float64
+    np.testing.assert_allclose(r32.dll, r64.dll, rtol=1e-4, atol=1e-3)
+    np.testing.assert_allclose(r32.bhhh, r64.bhhh, rtol=1e-4, atol=1e-3)
+
+    m32.maximize_loglike(quiet=True)
+    reference = m32.reference_loglike2_bhhh(block_size=1000)
+    assert reference.ll == approx(-3441.672522, rel=1e-8)
+    assert abs(reference.tolerance) < 1e-4
+    assert reference.ll == approx(m32.loglike(), rel=1e-8)
+
+
+def test_repack_data(mtcq):
+    def build(repack_data, dataframes=mtcq):
+        m = NumbaModel(repack_data=repack_data)
+        m.utility_co[2] = P("ASC_SR2") + P("hhinc#2") * X("hhinc")
+        m.utility_co[3] = P("ASC_SR3P") + P("hhinc#2") * X("hhinc")
+        m.utility_ca = P("tottime") * X("tottime") + P("totcost") * X("totcost")
+        m.quantity_ca = P("q_ivtt") * X("ivtt+1")
+        m.dataframes = dataframes
+        m.set_values(totcost=-0.005, tottime=-0.05, q_ivtt=0.5)
+        m.lock_value('q_ivtt', 0.0)
+        return m
+    packed = build(True)
+    full = build(False)
+    r_packed = packed.loglike2_bhhh()
+    r_full = full.loglike2_bhhh()
+    assert list(packed._data_columns[1]) == ['ivtt+1', 'tottime', 'totcost']
+    assert packed._data_arrays.ca.shape[-1] == 3
+    assert packed._data_arrays.ca.flags['C_CONTIGUOUS']
+    assert packed._data_arrays.co.shape[-1] == 1
+    assert full._data_arrays.ca.shape[-1] == 7
+    assert r_packed.ll == approx(r_full.ll)
+    np.testing.assert_allclose(r_packed.dll, r_full.dll)
+    np.testing.assert_allclose(r_packed.bhhh, r_full.bhhh)
+
+    packed.utility_ca = packed.utility_ca + P("ovtt") * X("ovtt")
+    full.utility_ca = full.utility_ca + P("ovtt") * X("ovtt")
+    assert packed.loglike() == approx(full.loglike())
+    assert packed._data_arrays.ca.shape[-1] == 4
+
+    # read-only data is used in place, not copied by repacking
+    import pickle
+    owner = mtcq.to_shared_memory()
+    shared = build(True, pickle.loads(pickle.dumps(owner)))
+    assert not shared.dataframes.data_ca.values.flags.writeable
+    r_shared = shared.loglike2_bhhh()
+    assert shared._data_columns == (None, None)
+    assert np.shares_memory(shared._data_arrays.ca, shared.dataframes.data_ca.values)
+    assert r_shared.ll == approx(r_full.ll)
+    np.testing.assert_allclose(r_shared.dll, r_full.dll)
+
+
+def test_cached_elemental_utility():
+    from larch.numba import example
+    cached = example(22)
+    cached.cache_utility = True
+    cached.load_data()
+    direct = example(22)
+    assert not direct.cache_utility
+    direct.load_data()
+    steps = [
+        {'mu_motor': 0.8, 'mu_nonmotor': 0.6, 'motorized_time': -0.01},
+        {'mu_motor': 0.7},
+        {'mu_nonmotor': 0.5},
+        {'motorized_time': -0.02},
+    ]
+    # only the logsum parameters change in the 2nd and 3rd steps
+    hits = [0, 1, 2, 2]
+    for values, n_hits in zip(steps, hits):
+        r_cached = cached.loglike2_bhhh(values)
+        r_direct = direct.loglike2_bhhh(values)
+        assert r_cached.ll == approx(r_direct.ll, rel=1e-12)
+        np.testing.assert_allclose(r_cached.dll, r_direct.dll, rtol=1e-10)
+        np.testing.assert_allclose(r_cached.bhhh, r_direct.bhhh, rtol=1e-10)
+        assert cached._utility_cache_hits == n_hits
+    assert cached._utility_cache is not None
+    assert direct._utility_cache is None
+    assert direct._utility_cache_hits == 0
+    cached.lock_value('motorized_time', -0.02)
+    direct.lock_value('motorized_time', -0.02)
+    np.testing.assert_allclose(cached.d_loglike(), direct.d_loglike(), rtol=1e-10)
+
+
+def test_shard_pool():
+    from larch.numba import example
+    from larch.numba.sharding import ShardPool
+    m = example(22)
+    m.load_data()
+    values = {'mu_motor': 0.8, 'mu_nonmotor': 0.6, 'motorized_time': -0.01}
+    direct = m.loglike2_bhhh(values)
+    direct_d2 = m.d2_loglike()
+    points = np.stack([m.pvals + 0.001 * j for j in range(3)])
+    direct_multi = m.loglike_multi(points, return_gradient=True)
+    direct_lr = m.likelihood_ratio()
+    with ShardPool(2, n_threads=1) as pool:
+        m.set_shard_pool(pool)
+        assert pool.shard_n_cases == [2515, 2514]
+        assert m.n_cases == 5029
+        sharded = m.loglike2_bhhh(values)
+        assert sharded.ll == approx(direct.ll, rel=1e-12)
+        np.testing.assert_allclose(sharded.dll, direct.dll, rtol=1e-8, atol=1e-8)
+        np.testing.assert_allclose(sharded.bhhh, direct.bhhh, rtol=1e-8, atol=1e-8)
+        np.testing.assert_allclose(m.d2_loglike(), direct_d2, rtol=1e-8, atol=1e-8)
+        # multi-point results fall back to one point at a time
+        sharded_multi = m.loglike_multi(points, return_gradient=True)
+        np.testing.assert_allclose(sharded_multi.ll, direct_multi.ll, rtol=1e-12)
+        np.testing.assert_allclose(sharded_multi.dll, direct_multi.dll, rtol=1e-8, atol=1e-8)
+        pd.testing.assert_series_equal(m.likelihood_ratio(), direct_lr, rtol=1e-8)
+        with raises(ValueError):
+            m.probability()
+        m.lock_value('mu_nonmotor', 0.6)
+        result = m.maximize_loglike(quiet=True)
+        m.set_shard_pool(None)
+    assert result.loglike == approx(m.loglike(), rel=1e-10)
+
+    # shard servers on the network must use a secret
+    from larch.numba.sharding import serve_shard
+    for authkey in (None, b'', 'secret'):
+        with raises(ValueError):
+            serve_shard(('localhost', 0), authkey)
+        with raises(ValueError):
+            ShardPool(addresses=[('localhost', 0)], authkey=authkey)
+
+
+def test_neg_loglike_cache():
+    from larch.numba import example
+    from larch.model.optimization import NegLoglikeCache
+    m = example(1)
+    m.load_data()
+    objective = NegLoglikeCache(m, m._null_slice + (-1, -1, -1), maxsize=2)
+    x0 = m.pvals
+    x1 = x0 + 0.001
+    x2 = x0 + 0.002
+    assert objective.neg_loglike(x0) == approx(-m.loglike(x0))
+    np.testing.assert_allclose(objective.neg_d_loglike(x0), -m.d_loglike(x0))
+    assert objective.n_evaluations == 1
+    objective.neg_loglike(x1)
+    objective.neg_d_loglike(x1)
+    assert objective.n_evaluations == 2
+    objective.neg_loglike(x2)
+    objective.neg_loglike(x1)
+    assert objective.n_evaluations == 3
+    objective.neg_loglike(x0)
+    assert objective.n_evaluations == 4
+    with raises(ValueError):
+        objective.neg_bhhh(x0)
+    fused = NegLoglikeCache(m, m._null_slice + (-1, -1, -1), bhhh=True)
+    np.testing.assert_allclose(fused.neg_bhhh(x0), -m.bhhh(x0))
+    assert fused.neg_loglike(x0) == approx(-m.loglike(x0))
+    assert fused.n_evaluations == 1
+
+    unmemoized = NegLoglikeCache(m, m._null_slice + (-1, -1, -1), maxsize=0)
+    unmemoized.neg_loglike(x0)
+    unmemoized.neg_d_loglike(x0)
+    assert unmemoized.n_evaluations == 2
+    with raises(ValueError):
+        NegLoglikeCache(m, maxsize=-1)
+
+    r = m.maximize_loglike(method='slsqp', quiet=True)
+    assert r.loglike == approx(-3626.18625551293, rel=1e-6)
+    m.set_values('null')
+    r0 = m.maximize_loglike(method='slsqp', quiet=True, memoize=0)
+    assert r0.loglike == approx(r.loglike, rel=1e-6)
+
+
+def test_loglike_multi():
+    from larch.numba import example
+    m = example(22)
+    m.load_data()
+    m.set_values(mu_motor=0.8, mu_nonmotor=0.6, motorized_time=-0.01)
+    x0 = m.pvals.copy()
+    points = np.stack([x0 + 0.001 * j for j in range(4)])
+    r = m.loglike_multi(points, return_gradient=True)
+    np.testing.assert_array_equal(m.pvals, x0)
+    for j in range(4):
+        y = m.loglike2(points[j])
+        assert r.ll[j] == approx(y.ll, rel=1e-10)
+        np.testing.assert_allclose(r.dll[j], np.asarray(y.dll), rtol=1e-8, atol=1e-8)
+    m.set_values(x0)
+
+    lr = m.likelihood_ratio()
+    for name in ['mu_motor', 'motorized_time']:
+        assert lr[name] == approx(m.likelihood_ratio(name, ref_value=m.pf.loc[name, 'nullvalue']))
+        assert m.pf.loc[name, 'likelihood_ratio'] == lr[name]
+
+    m1 = example(1)
+    m1.load_data()
+    ll, tolerance, n_iter, steps, message = m1.fit_bhhh(line_search_points=4)
+    assert ll == approx(-3626.18625551293, rel=1e-6)
+
+
+def test_parallel_resampling():
+    from larch.numba import example
+    m = example(1)
+    m.load_data()
+    m.maximize_loglike(quiet=True)
+    x_full = m.pvals.copy()
+
+    ll_cv = m.cross_validate(3, n_workers=1)
+    np.testing.assert_array_equal(m.pvals, x_full)
+    fold_ll = 0.0
+    for fold in range(3):
+        casewise = m.loglike_casewise(m.pf[f'cv_{fold:03d}'].to_numpy())
+        fold_ll += casewise[np.arange(m.n_cases) % 3 == fold].sum()
+        m.set_values(x_full)
+    assert ll_cv == approx(fold_ll, rel=1e-8)
+    assert ll_cv < m.loglike()
+
+    boot = m.bootstrap(3, n_workers=1, seed=42)
+    assert boot.shape == (3, len(m.pf))
+    assert list(boot.columns) == list(m.pf.index)
+    assert np.all(m.pf['bootstrap_std_err'] > 0)
+    np.testing.assert_allclose(boot.mean(), x_full, atol=0.5)
+
+    m.set_values('null')
+    with warns(UserWarning, match='did not converge'):
+        m.cross_validate(2, n_workers=1, options={'maxiter': 1})
+
+
+def test_compact_data():
+    from larch.numba import example
+    from larch.numba.compact import compact_choice
+    dense = example(22)
+    dense.load_data()
+    compact = example(22)
+    compact.compact_data = True
+    compact.load_data()
+    # a budget of 1000 cases of cascaded float64 choices and int8 availability
+    compact._expand_block_bytes = 1000 * len(compact.graph) * 9
+    assert compact._expand_block_size() == 1000
+    for m in (dense, compact):
+        m.set_values(mu_motor=0.8, mu_nonmotor=0.6, motorized_time=-0.01)
+    assert compact._compact_arrays.av_bits.shape == (compact.n_cases, 1)
+    r_dense = dense.loglike2_bhhh()
+    r_compact = compact.loglike2_bhhh()
+    assert r_compact.ll == approx(r_dense.ll, rel=1e-10)
+    np.testing.assert_allclose(r_compact.dll, r_dense.dll, rtol=1e-8)
+    np.testing.assert_allclose(r_compact.bhhh, r_dense.bhhh, rtol=1e-8)
+    np.testing.assert_allclose(compact.probability(), dense.probability())
+    np.testing.assert_allclose(
+        compact.loglike_casewise(start_case=10, stop_case=100, step_case=3),
+        dense.loglike_casewise(start_case=10, stop_case=100, step_case=3),
+    )
+    with raises(ValueError):
+        compact_choice(np.asarray([[1, 0, 0], [0, 1, 1]]))
+
+
+def test_idce_data():
+    from larch import DataFrames
+    from larch.data_warehouse import example_file
+    df = pd.read_csv(example_file("MTCwork.csv.gz"))
+    df.set_index(['casenum', 'altnum'], inplace=True)
+    ce = DataFrames(ce=df, ch='chose', crack=True)
+    ca = DataFrames(ca=ce.data_ce_as_ca(), co=ce.data_co, ch=ce.data_ch, av=ce.data_av)
+
+    def build(dataframes):
+        m = NumbaModel()
+        m.utility_ca = P("tottime") * X("tottime") + P("totcost") * X("totcost")
+        m.utility_co[2] = P("ASC_SR2") + P("hhinc#2") * X("hhinc")
+        m.utility_co[3] = P("ASC_SR3P") + P("hhinc#3") * X("hhinc")
+        m.utility_co[4] = P("ASC_TRAN") + P("hhinc#4") * X("hhinc")
+        m.dataframes = dataframes
+        m.set_values(tottime=-0.05, totcost=-0.004, ASC_TRAN=-0.3)
+        return m
+    sparse = build(ce)
+    dense = build(ca)
+    r_sparse = sparse.loglike2_bhhh()
+    r_dense = dense.loglike2_bhhh()
+    assert sparse._data_arrays.ca is None
+    assert sparse._ce_arrays.rows.shape == (22033, 2)
+    assert r_sparse.ll == approx(r_dense.ll, rel=1e-10)
+    np.testing.assert_allclose(r_sparse.dll, r_dense.dll, rtol=1e-8)
+    np.testing.assert_allclose(r_sparse.bhhh, r_dense.bhhh, rtol=1e-8)
+    np.testing.assert_allclose(sparse.d2_loglike(), dense.d2_loglike(), rtol=1e-8)
+    np.testing.assert_allclose(sparse.probability(), dense.probability())
+
+
+def test_shared_memory_pickle():
+    import pickle
+    from larch.numba import example
+    m = example(1)
+    m.load_data()
+    ll = m.loglike()
+    m.dataframes = m.dataframes.to_shared_memory()
+    # every column is used, so the kernel arrays view the shared data
+    assert m._data_columns == (None, None)
+    assert np.shares_memory(m._data_arrays.ca, m.dataframes.data_ca.values)
+    m2 = pickle.loads(pickle.dumps(m))
+    assert not m2.dataframes.shared_memory.owner
+    assert m2.loglike() == approx(ll)
+    # both models read the same memory, which is read-only but for ch and wt
+    assert not m2._data_arrays.ca.flags.writeable
+    m.dataframes.data_ch.values[0, 0] += 1
+    assert m2.dataframes.data_ch.values[0, 0] == m.dataframes.data_ch.values[0, 0]
+    m.dataframes.data_ch.values[0, 0] -= 1
+
+
+def test_dense_skims(tmp_path):
+    import larch.exampville
+    from larch.numba.skims import DenseSkims
+    omx = larch.OMX(larch.exampville.files.skims, mode='r')
+    skims = DenseSkims.from_omx(omx, lookup='TAZ_ID')
+    assert skims['AUTO_TIME'].dtype == np.float32
+    rng = np.random.default_rng(0)
+    orig = pd.Series(rng.integers(0, 40, 500), index=np.arange(500) + 10)
+    dest = rng.integers(0, 40, 500)
+    expected = omx.get_rc_dataframe(orig, dest)
+    result = skims.get_rc_dataframe(orig, dest)
+    np.testing.assert_allclose(result.to_numpy(), expected.to_numpy(), rtol=1e-6)
+    assert list(result.columns) == list(expected.columns)
+    np.testing.assert_array_equal(result.index, expected.index)
+    taz = omx.lookup.TAZ_ID[:]
+    np.testing.assert_array_equal(skims.zone_index(taz[[5, 2, 39]]), [5, 2, 39])
+    with raises(KeyError):
+        skims.zone_index([-99])
+
+    skims.save(tmp_path / "skims")
+    mapped = DenseSkims.load(tmp_path / "skims")
+    assert isinstance(mapped['AUTO_TIME'], np.memmap)
+    np.testing.assert_array_equal(
+        mapped.gather('AUTO_TIME', orig, dest),
+        skims.gather('AUTO_TIME', orig, dest),
+    )
+    np.testing.assert_array_equal(mapped.zone_index(taz), np.arange(40))
+
+    by_period = DenseSkims(
+        {'TIME': np.stack([omx.data.AUTO_TIME[:], 2 * omx.data.AUTO_TIME[:]], axis=-1)},
+        time_periods=['AM', 'PM'],
+    )
+    period = np.where(rng.random(500) < 0.5, 'AM', 'PM')
+    np.testing.assert_allclose(
+        by_period.gather('TIME', orig, dest, period),
+        omx.data.AUTO_TIME[:][orig, dest] * np.where(period == 'AM', 1, 2),
+    )
+    with raises(ValueError):
+        by_period.gather('TIME', orig, dest)
+    with raises(IndexError):
+        skims.gather('AUTO_TIME', [40], [0])
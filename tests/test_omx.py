@@ -0,0 +1,45 @@
+import numpy
+import larch
+import larch.exampville
+from larch.data_services.h5 import H5PodRC
+from larch.data_services.h5.h5tiles import TileCache, read_pairs
+
+
+def test_tiled_skim_reads():
+	skims = larch.OMX(larch.exampville.files.skims, mode='r')
+	rng = numpy.random.default_rng(42)
+	rows = rng.integers(0, skims.shape[0], 500)
+	cols = rng.integers(0, skims.shape[1], 500)
+
+	cache = TileCache()
+	full = skims.data.AUTO_TIME[:]
+	numpy.testing.assert_array_equal(
+		read_pairs(skims.data.AUTO_TIME, rows.reshape(5, 100), cols.reshape(5, 100), cache=cache),
+		full[rows, cols].reshape(5, 100),
+	)
+	assert cache.misses == len(cache) > 0
+	read_pairs(skims.data.AUTO_TIME, rows, cols, cache=cache)
+	assert cache.hits == cache.misses
+
+	# the budget is shared by all matrices, least recently used tiles are dropped
+	tile_bytes = cache.nbytes // len(cache)
+	cache.max_bytes = tile_bytes
+	read_pairs(skims.data.WALK_TIME, rows, cols, cache=cache)
+	assert cache.nbytes <= tile_bytes
+
+	numpy.testing.assert_array_equal(
+		skims.get_rc_dataframe(rows, cols, tile_cache=cache),
+		skims.get_rc_dataframe(rows, cols, tile_cache=False),
+	)
+
+	tiled = H5PodRC(rows, cols, groupnode=skims.data, tile_cache=cache)
+	untiled = H5PodRC(rows, cols, groupnode=skims.data, tile_cache=False)
+	# reductions and shape-dependent expressions are evaluated on the whole matrix
+	for expr in [
+		'AUTO_TIME', 'AUTO_TIME + exp(-AUTO_DIST)', 'WALK_TIME > 10',
+		'AUTO_TIME / AUTO_TIME.max()', 'AUTO_TIME.T', 'normalize(AUTO_DIST)',
+	]:
+		numpy.testing.assert_allclose(
+			tiled._evaluate_rc(expr, slice(10, 200)),
+			untiled._evaluate_rc(expr, slice(10, 200)),
+		)